@@ -1,10 +1,49 @@
 import requests
 import json
+import threading
+import time
 from config import Config
 from database import get_db
+from tracing import span
+from monitor_log import get_logger
+from metrics import ALERT_DISPATCH_DURATION, ALERT_DELIVERY_DELAY, ALERT_BATCH_SIZE
 
-def send_wechat_alert(message):
-    """发送企业微信告警"""
+logger = get_logger('alerts')
+
+# 告警投递重试配置
+DISPATCH_INTERVAL = 5        # 无新告警时检查发件箱的间隔（秒）
+DISPATCH_BATCH_SIZE = 50     # 每次从发件箱取出的最大条数
+RETRY_BASE_DELAY = 10        # 首次重试延迟（秒），之后按指数增长
+RETRY_MAX_DELAY = 1800       # 最大重试延迟（秒）
+MAX_ATTEMPTS = 8             # 最大投递次数，超过后标记为失败
+WEBHOOK_CACHE_TTL = 60       # Webhook 配置缓存时间（秒）
+
+# 告警汇总与限流配置
+DIGEST_WINDOW = 10           # 收集窗口（秒），窗口内的告警合并为一条汇总消息
+RATE_LIMIT_PER_MINUTE = 20   # 企业微信群机器人每分钟最多接收的消息数
+MAX_TEXT_BYTES = 2000        # text 消息内容上限（企业微信限制2048字节）
+MAX_MARKDOWN_BYTES = 4000    # markdown 消息内容上限（企业微信限制4096字节）
+
+# 汇总消息中的监控类型名称
+TYPE_NAMES = {
+    'server': '服务器',
+    'storage': '存储',
+    'application': '应用',
+    'database': '数据库',
+    'business': '业务指标',
+    'backup': '备份'
+}
+
+_webhook_cache = {'url': None, 'expires': 0}
+_webhook_lock = threading.Lock()
+_http = requests.Session()
+
+def get_webhook_url():
+    """获取企业微信Webhook地址（带缓存，避免每条告警都查询数据库）"""
+    with _webhook_lock:
+        if time.time() < _webhook_cache['expires']:
+            return _webhook_cache['url']
+    
     # 从数据库读取企业微信Webhook配置
     db = get_db()
     cursor = db.cursor()
@@ -12,41 +51,528 @@ def send_wechat_alert(message):
     result = cursor.fetchone()
     db.close()
     
-    webhook_url = result['value'] if result else Config.WECHAT_WEBHOOK
+    url = result['value'] if result else Config.WECHAT_WEBHOOK
+    with _webhook_lock:
+        _webhook_cache['url'] = url
+        _webhook_cache['expires'] = time.time() + WEBHOOK_CACHE_TTL
+    return url
+
+def invalidate_webhook_cache():
+    """清除Webhook配置缓存（系统配置修改后调用）"""
+    with _webhook_lock:
+        _webhook_cache['expires'] = 0
+
+def send_wechat_alert(message, webhook_url=None, msgtype='text'):
+    """发送企业微信告警
+    
+    Args:
+        message: 消息内容
+        webhook_url: Webhook地址，默认读取系统配置
+        msgtype: 消息类型，text 或 markdown
+    """
+    if webhook_url is None:
+        webhook_url = get_webhook_url()
     
     if not webhook_url:
-        print("企业微信Webhook未配置")
+        logger.warning("企业微信Webhook未配置")
         return False
     
     try:
         data = {
-            "msgtype": "text",
-            "text": {
+            "msgtype": msgtype,
+            msgtype: {
                 "content": message
             }
         }
-        response = requests.post(webhook_url, json=data, timeout=5)
+        response = _http.post(webhook_url, json=data, timeout=5)
+        # 被限流等错误时企业微信仍返回200，需要检查 errcode
+        errcode = 0
         if response.status_code == 200:
-            print(f"企业微信告警发送成功: {message[:50]}...")
+            try:
+                errcode = response.json().get('errcode', 0)
+            except ValueError:
+                pass
+        if response.status_code == 200 and errcode == 0:
+            logger.info("企业微信告警发送成功: %s...", message[:50])
             return True
         else:
-            print(f"企业微信告警发送失败，状态码: {response.status_code}, 响应: {response.text}")
+            logger.error("企业微信告警发送失败，状态码: %s, 响应: %s", response.status_code, response.text)
             return False
     except Exception as e:
-        print(f"发送企业微信告警失败: {e}")
+        logger.error("发送企业微信告警失败: %s", e)
         return False
 
-def send_alert(target_id, alert_type, message):
-    """记录并发送告警"""
-    db = get_db()
-    cursor = db.cursor()
-    
+def _enqueue_message(cursor, alert_id, title, message):
+    """将通知消息写入发件箱（由调用方提交事务）"""
+    now = int(time.time())
     cursor.execute(
-        'INSERT INTO alerts (target_id, alert_type, message) VALUES (?, ?, ?)',
-        (target_id, alert_type, message)
+        'INSERT INTO alert_outbox (alert_id, title, message, next_attempt_ts, created_ts) VALUES (?, ?, ?, ?, ?)',
+        (alert_id, title, message, now, now)
     )
-    db.commit()
+
+def _format_duration(seconds):
+    """格式化持续时间"""
+    if seconds < 60:
+        return f"{int(seconds)}秒"
+    elif seconds < 3600:
+        return f"{int(seconds / 60)}分钟"
+    return f"{seconds / 3600:.1f}小时"
+
+class AlertTracker:
+    """告警状态机
     
-    send_wechat_alert(f"【监控告警】\n{message}")
+    每个 (监控目标, 告警类型) 维护一个状态：正常 → 告警中(pending) → 已恢复(resolved)
+    - 首次触发：写入一条告警记录并发送通知
+    - 持续触发：只更新该告警记录的最近信息和次数，超过重复通知间隔才再次通知
+    - 条件恢复：告警记录标记为已恢复，并发送恢复通知
+    告警表和通知数量随故障次数增长，而不是随检查次数增长。
+    检查线程只在锁内修改内存状态，数据库写入由 flush() 在每轮检查结束时一次事务完成
+    """
     
-    db.close()
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._active = None  # (target_id, alert_type) -> 状态字典，首次使用时从数据库加载
+        self._dirty = {}     # 有未写入变化的状态（含本轮新建和已恢复的）：id(state) -> state
+        self._outbox = []    # 待写入发件箱的通知 (state, 标题, 内容)
+    
+    def _load(self):
+        """从数据库加载仍处于告警中的记录（重启后继续跟踪，调用方持有锁）"""
+        if self._active is not None:
+            return
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute('''
+            SELECT id, target_id, alert_type, message, last_notified_ts,
+                   CAST(strftime('%s', created_at) AS INTEGER) AS started_ts
+            FROM alerts WHERE status = 'pending' ORDER BY id
+        ''')
+        rows = cursor.fetchall()
+        db.close()
+        now = int(time.time())
+        self._active = {}
+        for row in rows:
+            key = (row['target_id'], row['alert_type'])
+            self._active[key] = self._new_state(
+                row['id'], row['message'], row['started_ts'] or now, row['last_notified_ts'] or now, key
+            )
+        # 尚未写入数据库的新告警
+        for state in self._dirty.values():
+            if state['id'] is None and not state['resolved']:
+                self._active[state['key']] = state
+    
+    @staticmethod
+    def _new_state(alert_id, message, started, last_notified, key=None):
+        return {
+            'id': alert_id,
+            'key': key,
+            'message': message,
+            'started': started,
+            'last_notified': last_notified,
+            'last_seen': None,
+            'seen': 0,           # 未写入的触发次数
+            'resolved': False
+        }
+    
+    def reset(self):
+        """清空内存状态，下次使用时重新从数据库加载（告警记录被清除并提交后调用）"""
+        # 等待正在写入的一批完成，否则重新加载时这批新告警既不在 _dirty 中也不在数据库中
+        with self._write_lock:
+            with self._lock:
+                self._active = None
+    
+    def forget(self, target_id):
+        """丢弃目标的告警状态和未写入的变化（目标删除后调用）"""
+        with self._write_lock:
+            with self._lock:
+                if self._active is not None:
+                    for key in [key for key in self._active if key[0] == target_id]:
+                        del self._active[key]
+                self._dirty = {
+                    state_id: state for state_id, state in self._dirty.items() if state['key'][0] != target_id
+                }
+                self._outbox = [item for item in self._outbox if item[0]['key'][0] != target_id]
+    
+    def fire(self, target_id, alert_type, message):
+        """告警条件成立"""
+        key = (target_id, alert_type)
+        now = int(time.time())
+        
+        with self._lock:
+            self._load()
+            state = self._active.get(key)
+            
+            if state is None:
+                state = self._active[key] = self._new_state(None, message, now, now, key)
+                self._outbox.append((state, '【监控告警】', message))
+            elif now - state['last_notified'] >= Config.ALERT_RENOTIFY_INTERVAL:
+                duration = _format_duration(now - state['started'])
+                self._outbox.append((state, f"【持续告警】已持续{duration}", message))
+                state['last_notified'] = now
+            state['message'] = message
+            state['last_seen'] = now
+            state['seen'] += 1
+            self._dirty[id(state)] = state
+    
+    def resolve(self, target_id, alert_type):
+        """告警条件不再成立"""
+        key = (target_id, alert_type)
+        
+        with self._lock:
+            if self._active is not None and key not in self._active:
+                # 没有告警中的记录，无需访问数据库
+                return
+            self._load()
+            state = self._active.pop(key, None)
+            if state is None:
+                return
+            
+            duration = _format_duration(int(time.time()) - state['started'])
+            state['resolved'] = True
+            self._outbox.append((state, f"【告警恢复】持续{duration}后已恢复", state['message']))
+            self._dirty[id(state)] = state
+    
+    def flush(self):
+        """把本轮告警状态的变化写入数据库（一轮检查结束时调用）
+        
+        Returns:
+            int: 写入的通知数
+        """
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty and not self._outbox:
+                    return 0
+                # 在锁内取出本轮的变化，之后检查线程的新变化进入下一批
+                changes = [
+                    (state, state['seen'], state['last_seen'], state['message'], state['last_notified'], state['resolved'])
+                    for state in self._dirty.values()
+                ]
+                for state in self._dirty.values():
+                    state['seen'] = 0
+                self._dirty = {}
+                outbox, self._outbox = self._outbox, []
+            
+            try:
+                inserted = self._write(changes, outbox)
+            except Exception:
+                # 写入失败时放回，下一轮重试
+                with self._lock:
+                    for state, seen, *_ in changes:
+                        state['seen'] += seen
+                        self._dirty[id(state)] = state
+                    self._outbox[:0] = outbox
+                raise
+            
+            # 提交后再记录新告警的ID，重新加载状态时未提交的告警仍按未写入处理
+            with self._lock:
+                for state in [state for state, *_ in changes if id(state) in inserted]:
+                    state['id'] = inserted[id(state)]
+        
+        if outbox:
+            dispatcher.notify()
+        return len(outbox)
+    
+    def _write(self, changes, outbox):
+        """在一个事务中写入告警记录和通知，返回新告警的ID {id(state): 记录ID}"""
+        db = get_db()
+        cursor = db.cursor()
+        try:
+            inserted = {}
+            for state, seen, last_seen, message, last_notified, resolved in changes:
+                alert_id = state['id']
+                if alert_id is None:
+                    target_id, alert_type = state['key']
+                    cursor.execute(
+                        '''INSERT INTO alerts (target_id, alert_type, message, last_seen_ts, last_notified_ts, occurrences)
+                           VALUES (?, ?, ?, ?, ?, ?)''',
+                        (target_id, alert_type, message, last_seen, last_notified, max(seen, 1))
+                    )
+                    alert_id = inserted[id(state)] = cursor.lastrowid
+                elif seen:
+                    cursor.execute(
+                        '''UPDATE alerts SET message = ?, last_seen_ts = ?, occurrences = occurrences + ?,
+                           last_notified_ts = ? WHERE id = ?''',
+                        (message, last_seen, seen, last_notified, alert_id)
+                    )
+                if resolved:
+                    cursor.execute(
+                        "UPDATE alerts SET status = 'resolved', resolved_at = CURRENT_TIMESTAMP WHERE id = ?",
+                        (alert_id,)
+                    )
+            for state, title, message in outbox:
+                _enqueue_message(cursor, state['id'] or inserted.get(id(state)), title, message)
+            db.commit()
+            return inserted
+        finally:
+            db.close()
+
+
+# 全局告警状态机实例
+alert_tracker = AlertTracker()
+
+def send_alert(target_id, alert_type, message):
+    """触发告警
+    
+    告警记录和待发送消息在本轮检查结束时（flush_alerts）同一事务中写入，实际发送由后台投递线程完成，
+    监控线程不会被数据库写入和企业微信接口的网络延迟阻塞。同一目标同一类型的告警持续期间不会重复记录。
+    """
+    with span('alert'):
+        alert_tracker.fire(target_id, alert_type, message)
+
+def resolve_alert(target_id, alert_type):
+    """告警恢复（检查结果正常时调用，没有告警中的记录时不做任何操作）"""
+    with span('alert'):
+        alert_tracker.resolve(target_id, alert_type)
+
+class TokenBucket:
+    """令牌桶限流器"""
+    
+    def __init__(self, rate_per_minute):
+        self.capacity = rate_per_minute
+        self.tokens = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """尝试取出一个令牌
+        
+        Returns:
+            float: 0 表示成功，否则为需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+def split_message(lines, max_bytes, header='', owners=None):
+    """按字节上限将多行内容拆分为多条消息
+    
+    Args:
+        lines: 内容行列表
+        max_bytes: 单条消息的最大字节数（UTF-8）
+        header: 每条消息开头的标题，拆分后会附加页码
+        owners: 与 lines 一一对应的所属发件箱记录ID（标题行等不属于任何记录的为 None）
+    
+    Returns:
+        list: [(消息内容, 消息包含的记录ID集合)]
+    """
+    if owners is None:
+        owners = [None] * len(lines)
+    budget = max_bytes - len(header.encode('utf-8')) - 16  # 预留页码的空间
+    chunks = []
+    current = []
+    size = 0
+    
+    for line, owner in zip(lines, owners):
+        encoded = line.encode('utf-8')
+        if len(encoded) > budget:
+            # 单行超长时截断
+            line = encoded[:budget - 10].decode('utf-8', errors='ignore') + '...'
+            encoded = line.encode('utf-8')
+        if current and size + len(encoded) + 1 > budget:
+            chunks.append(current)
+            current = []
+            size = 0
+        current.append((line, owner))
+        size += len(encoded) + 1
+    if current:
+        chunks.append(current)
+    
+    total = len(chunks)
+    messages = []
+    for i, chunk in enumerate(chunks):
+        title = header
+        if total > 1:
+            title = f"{header}（{i + 1}/{total}）"
+        content = '\n'.join(([title] if title else []) + [line for line, _ in chunk])
+        messages.append((content, {owner for _, owner in chunk if owner is not None}))
+    return messages
+
+def build_messages(rows):
+    """根据发件箱记录构建要发送的消息
+    
+    单条告警按原格式发送 text 消息；多条告警合并为按监控类型分组的 markdown 汇总
+    
+    Returns:
+        tuple: (消息类型, [(消息内容, 消息包含的发件箱记录ID集合)])
+    """
+    if len(rows) == 1:
+        row = rows[0]
+        lines = f"{row['title']}\n{row['message']}".split('\n')
+        return 'text', split_message(lines, MAX_TEXT_BYTES, owners=[row['id']] * len(lines))
+    
+    groups = {}
+    for row in rows:
+        groups.setdefault(row['target_type'] or 'other', []).append(row)
+    
+    lines = []
+    owners = []
+    for target_type, items in groups.items():
+        lines.append(f"### {TYPE_NAMES.get(target_type, '其他')}（{len(items)}）")
+        owners.append(None)
+        for row in items:
+            color = 'info' if row['title'].startswith('【告警恢复】') else 'warning'
+            name = row['target_name'] or '未知目标'
+            # 多行内容（如业务指标明细）只保留第一行，避免汇总消息过长
+            summary = row['message'].split('\n')[0]
+            lines.append(f"- <font color=\"{color}\">{row['title']}</font> **{name}**: {summary}")
+            owners.append(row['id'])
+    
+    header = f"**监控告警汇总**（共{len(rows)}条）"
+    return 'markdown', split_message(lines, MAX_MARKDOWN_BYTES, header, owners)
+
+class AlertDispatcher:
+    """告警投递线程
+    
+    从发件箱表 alert_outbox 中取出到期的消息发送，失败后按指数退避重试，
+    发件箱持久化在数据库中，重启后未发送的消息会继续投递。
+    收集窗口内的多条告警合并为一条汇总消息，并按企业微信的频率限制用令牌桶限流。
+    """
+    
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._flush = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._bucket = TokenBucket(RATE_LIMIT_PER_MINUTE)
+    
+    def start(self):
+        """启动投递线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+        self._thread.start()
+        logger.info("告警投递线程已启动")
+    
+    def stop(self):
+        """停止投递线程"""
+        self._stop.set()
+        self._flush.set()
+        self._wakeup.set()
+    
+    def notify(self):
+        """唤醒投递线程（有新告警写入时调用）"""
+        self._wakeup.set()
+    
+    def flush(self):
+        """结束收集窗口立即发送（一轮监控检查结束时调用）"""
+        self._flush.set()
+        self._wakeup.set()
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(DISPATCH_INTERVAL)
+            self._wakeup.clear()
+            # 收集窗口：等待同一轮检查产生的其他告警，本轮检查结束时提前发送
+            self._flush.wait(DIGEST_WINDOW)
+            self._flush.clear()
+            try:
+                # 一批处理满时说明可能还有积压，继续处理
+                while not self._stop.is_set() and self.dispatch_pending() >= DISPATCH_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                logger.exception("告警投递异常: %s", e)
+    
+    def _send_limited(self, content, webhook_url, msgtype):
+        """在限流范围内发送一条消息"""
+        while True:
+            wait = self._bucket.acquire()
+            if wait == 0:
+                break
+            if self._stop.wait(wait):
+                return False
+        start = time.perf_counter()
+        success = send_wechat_alert(content, webhook_url, msgtype)
+        ALERT_DISPATCH_DURATION.observe(
+            time.perf_counter() - start, result='success' if success else 'failure'
+        )
+        return success
+    
+    def dispatch_pending(self):
+        """发送发件箱中所有到期的消息
+        
+        Returns:
+            int: 本次处理的消息数
+        """
+        now = int(time.time())
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute('''
+            SELECT o.id, o.title, o.message, o.attempts, o.created_ts, t.name AS target_name, t.type AS target_type
+            FROM alert_outbox o
+            LEFT JOIN alerts a ON o.alert_id = a.id
+            LEFT JOIN monitor_targets t ON a.target_id = t.id
+            WHERE o.status = 'pending' AND o.next_attempt_ts <= ?
+            ORDER BY o.id
+            LIMIT ?
+        ''', (now, DISPATCH_BATCH_SIZE))
+        rows = cursor.fetchall()
+        
+        if not rows:
+            db.close()
+            return 0
+        
+        webhook_url = get_webhook_url()
+        
+        if not webhook_url:
+            cursor.executemany(
+                "UPDATE alert_outbox SET status = 'skipped', last_error = ? WHERE id = ?",
+                [('企业微信Webhook未配置', row['id']) for row in rows]
+            )
+            db.commit()
+            db.close()
+            return len(rows)
+        
+        ALERT_BATCH_SIZE.observe(len(rows))
+        msgtype, messages = build_messages(rows)
+        # 已发出的分段中的记录标记为已发送，只有未发出的分段中的记录重试
+        unsent = set()
+        for index, (content, owners) in enumerate(messages):
+            if not self._send_limited(content, webhook_url, msgtype):
+                for _, rest in messages[index:]:
+                    unsent |= rest
+                break
+        
+        for row in rows:
+            attempts = row['attempts'] + 1
+            if row['id'] not in unsent:
+                sent_ts = int(time.time())
+                cursor.execute(
+                    "UPDATE alert_outbox SET status = 'sent', attempts = ?, sent_ts = ? WHERE id = ?",
+                    (attempts, sent_ts, row['id'])
+                )
+                if row['created_ts']:
+                    ALERT_DELIVERY_DELAY.observe(max(sent_ts - row['created_ts'], 0))
+            elif attempts >= MAX_ATTEMPTS:
+                cursor.execute(
+                    "UPDATE alert_outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                    (attempts, '超过最大重试次数', row['id'])
+                )
+            else:
+                delay = min(RETRY_BASE_DELAY * (2 ** (attempts - 1)), RETRY_MAX_DELAY)
+                cursor.execute(
+                    'UPDATE alert_outbox SET attempts = ?, next_attempt_ts = ? WHERE id = ?',
+                    (attempts, int(time.time()) + delay, row['id'])
+                )
+        
+        db.commit()
+        db.close()
+        return len(rows)
+
+# 全局投递线程实例
+dispatcher = AlertDispatcher()
+
+def start_alert_dispatcher():
+    """启动告警投递线程"""
+    dispatcher.start()
+
+def flush_alerts():
+    """写入本轮的告警变化，并立即发送收集窗口中的告警"""
+    alert_tracker.flush()
+    dispatcher.flush()
@@ -0,0 +1,231 @@
+"""
+流式异常检测
+为每个监控目标的每个数值指标维护增量基线，每个样本 O(1) 更新：
+- 全局基线：指数加权移动平均（EWMA）和指数加权方差
+- 季节基线：按一天中的小时分 24 个槽，每个槽各自维护 EWMA 和方差
+样本偏离基线（优先使用样本足够的季节基线）超过 ANOMALY_Z_SCORE 个标准差，
+且相对变化超过 ANOMALY_MIN_CHANGE 时判定为异常，监控数据状态记为 warning 并发送告警
+基线以 array('d') 打包成二进制保存在 anomaly_baselines 表中，重启后继续使用
+"""
+
+import math
+import threading
+import time
+from array import array
+from config import Config
+from database import get_db
+from metrics import DB_WRITE_DURATION, DB_WRITE_BATCH_SIZE
+from rules import METRIC_LABELS
+
+EWMA_SPAN = 30               # 全局基线的等效窗口（样本数）
+SEASONAL_ALPHA = 0.1         # 季节槽的最小平滑系数
+SEASONAL_SLOTS = 24          # 按小时分槽
+WARMUP_SAMPLES = 30          # 全局基线至少积累的样本数，之前不做判断
+SEASONAL_MIN_SAMPLES = 10    # 季节槽样本数达到后优先使用季节基线
+ANOMALY_Z_SCORE = 4.0        # 偏离的标准差倍数
+ANOMALY_MIN_CHANGE = 0.3     # 相对基线的最小变化比例，避免方差很小时的误报
+SETTINGS_CACHE_TTL = 60      # 开关配置的缓存时间（秒）
+
+# 各监控类型参与异常检测的指标
+ANOMALY_METRICS = {
+    'server': ['cpu', 'memory', 'disk', 'execution_time'],
+    'storage': ['percent'],
+    'application': ['response_time'],
+    'database': ['execution_time'],
+    'business': ['value', 'execution_time'],
+    'backup': ['total_count', 'total_size']
+}
+
+# 基线状态布局：全局 [count, mean, var]，之后每个季节槽 [count, mean, var]
+STATE_SIZE = 3 + SEASONAL_SLOTS * 3
+
+
+class Baseline:
+    """单个指标的增量基线"""
+    
+    __slots__ = ('state', 'dirty')
+    
+    def __init__(self, state=None):
+        self.state = state if state is not None else array('d', bytes(8 * STATE_SIZE))
+        self.dirty = False
+    
+    @staticmethod
+    def _update(state, offset, value, alpha):
+        """指数加权更新 offset 处的 [count, mean, var]"""
+        count = state[offset]
+        if count == 0:
+            state[offset + 1] = value
+            state[offset + 2] = 0.0
+        else:
+            diff = value - state[offset + 1]
+            increment = alpha * diff
+            state[offset + 1] += increment
+            state[offset + 2] = (1 - alpha) * (state[offset + 2] + diff * increment)
+        state[offset] = count + 1
+    
+    def observe(self, value, slot):
+        """先用现有基线判断，再把样本计入基线
+        
+        Returns:
+            tuple: (基线均值, 基线标准差, z 分数)，基线样本不足时返回 None
+        """
+        state = self.state
+        seasonal = 3 + slot * 3
+        
+        result = None
+        if state[0] >= WARMUP_SAMPLES:
+            offset = seasonal if state[seasonal] >= SEASONAL_MIN_SAMPLES else 0
+            mean = state[offset + 1]
+            std = math.sqrt(max(state[offset + 2], 0.0))
+            # 方差极小时（如长时间恒定的值）以均值的 1% 作为标准差下限
+            floor = max(std, abs(mean) * 0.01, 1e-9)
+            result = (mean, std, (value - mean) / floor)
+        
+        self._update(state, 0, value, 2 / (EWMA_SPAN + 1))
+        self._update(state, seasonal, value, max(1 / (state[seasonal] + 1), SEASONAL_ALPHA))
+        self.dirty = True
+        return result
+
+
+class AnomalyDetector:
+    """异常检测器，保存所有目标指标的基线"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baselines = None   # (target_id, metric) -> Baseline
+        self._enabled = False
+        self._expires = 0
+    
+    def _load(self):
+        """从数据库加载保存的基线"""
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute('SELECT target_id, metric, state FROM anomaly_baselines')
+        baselines = {}
+        for row in cursor.fetchall():
+            state = array('d')
+            state.frombytes(row['state'])
+            if len(state) == STATE_SIZE:
+                baselines[(row['target_id'], row['metric'])] = Baseline(state)
+        db.close()
+        return baselines
+    
+    def enabled(self):
+        """是否启用异常检测（系统配置 anomaly_detection，默认读取 Config）"""
+        now = time.time()
+        if now < self._expires:
+            return self._enabled
+        
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute("SELECT value FROM system_config WHERE key = 'anomaly_detection'")
+        result = cursor.fetchone()
+        db.close()
+        
+        self._enabled = result['value'] == '1' if result else Config.ANOMALY_DETECTION
+        self._expires = now + SETTINGS_CACHE_TTL
+        return self._enabled
+    
+    def invalidate(self):
+        """清除开关配置缓存（系统配置修改后调用）"""
+        self._expires = 0
+    
+    def observe(self, target_id, target_type, metrics, ts=None):
+        """把本次检查的指标计入基线并返回异常
+        
+        Args:
+            target_id: 监控目标ID
+            target_type: 监控类型
+            metrics: 本次检查结果 {指标名: 数值}
+            ts: 采样时间（epoch 秒），默认当前时间
+        
+        Returns:
+            list: 异常列表 [{'metric', 'value', 'expected', 'std', 'score'}]；未启用时返回 None
+        """
+        if not self.enabled():
+            return None
+        if ts is None:
+            ts = time.time()
+        slot = time.localtime(ts).tm_hour % SEASONAL_SLOTS
+        
+        anomalies = []
+        with self._lock:
+            if self._baselines is None:
+                self._baselines = self._load()
+            
+            for metric in ANOMALY_METRICS.get(target_type, []):
+                value = metrics.get(metric)
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                key = (target_id, metric)
+                baseline = self._baselines.get(key)
+                if baseline is None:
+                    baseline = self._baselines[key] = Baseline()
+                
+                result = baseline.observe(value, slot)
+                if result is None:
+                    continue
+                mean, std, score = result
+                change = abs(value - mean) / abs(mean) if mean else math.inf
+                if abs(score) >= ANOMALY_Z_SCORE and change >= ANOMALY_MIN_CHANGE:
+                    anomalies.append({
+                        'metric': metric,
+                        'value': value,
+                        'expected': round(mean, 2),
+                        'std': round(std, 2),
+                        'score': round(score, 1)
+                    })
+        return anomalies
+    
+    def save(self):
+        """把有变化的基线写入数据库（每轮检查结束后调用）"""
+        with self._lock:
+            if not self._baselines:
+                return
+            rows = []
+            for (target_id, metric), baseline in self._baselines.items():
+                if baseline.dirty:
+                    rows.append((target_id, metric, baseline.state.tobytes()))
+                    baseline.dirty = False
+        if not rows:
+            return
+        
+        now = int(time.time())
+        db = get_db()
+        cursor = db.cursor()
+        with DB_WRITE_DURATION.time(table='anomaly_baselines'):
+            cursor.executemany(
+                'INSERT OR REPLACE INTO anomaly_baselines (target_id, metric, state, updated_ts) VALUES (?, ?, ?, ?)',
+                [row + (now,) for row in rows]
+            )
+            db.commit()
+        db.close()
+        DB_WRITE_BATCH_SIZE.observe(len(rows), table='anomaly_baselines')
+    
+    def forget(self, target_id):
+        """丢弃监控目标的基线（目标删除后调用）"""
+        with self._lock:
+            if self._baselines:
+                for key in [key for key in self._baselines if key[0] == target_id]:
+                    del self._baselines[key]
+        db = get_db()
+        db.execute('DELETE FROM anomaly_baselines WHERE target_id = ?', (target_id,))
+        db.commit()
+        db.close()
+
+
+def format_anomalies(anomalies):
+    """生成异常告警消息"""
+    lines = []
+    for item in anomalies:
+        label, unit = METRIC_LABELS.get(item['metric'], (item['metric'], ''))
+        direction = '升高' if item['value'] > item['expected'] else '降低'
+        lines.append(
+            f"{label}异常{direction}: {round(item['value'], 2)}{unit}"
+            f"（基线 {item['expected']}±{item['std']}{unit}）"
+        )
+    return '\n'.join(lines)
+
+
+# 全局实例
+anomaly_detector = AnomalyDetector()
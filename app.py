@@ -1,12 +1,30 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
 from database import init_db, get_db
-from scheduler import start_scheduler
+from scheduler import start_scheduler, load_check_interval, executor
 from config import Config
 from utils import utc_to_local, format_relative_time, get_local_time
-from crypto_utils import encrypt_config, decrypt_config
+from crypto_utils import encrypt_config, decrypt_config, config_cache
+from dashboard_sync import dashboard_sync
+from alerts import invalidate_webhook_cache, alert_tracker
+from rules import rule_engine, validate_rules, DEFAULT_THRESHOLDS
+from anomaly import anomaly_detector
+from dependencies import validate_dependency
+from breaker import circuit_breaker
+from history import parse_metrics, downsample_series, downsample_batch, query_since
+from metrics import registry, TARGET_CHECK_DURATION
+from tracing import tracer, PHASE_LABELS
+from monitor_log import log_buffer
+from profiler import profiler
+from capacity import check_stats
+from scheduler_health import scheduler_health
+from local_sampler import local_sampler
+from local_collector import local_collector
 from werkzeug.security import check_password_hash, generate_password_hash
-from functools import wraps
+from functools import wraps, lru_cache
 import json
+import gzip
+import hmac
+import time
 from datetime import datetime, timedelta
 
 app = Flask(__name__)
@@ -44,6 +62,37 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# 响应压缩的最小字节数，过小的响应压缩收益不明显
+GZIP_MIN_SIZE = 1024
+
+def json_response(payload, etag=None):
+    """构建JSON响应，支持 ETag 条件请求和 gzip 压缩
+    
+    Args:
+        payload: 响应数据，为 None 时只返回 304
+        etag: 资源版本标识，客户端 If-None-Match 匹配时返回 304
+    
+    Returns:
+        Response: Flask 响应对象
+    """
+    if payload is None or (etag and request.if_none_match.contains_weak(etag)):
+        response = app.response_class(status=304)
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
+    
+    response = jsonify(payload)
+    if etag:
+        # 压缩后的表示与原始表示字节不同，使用弱 ETag
+        response.set_etag(etag, weak=True)
+    
+    response.headers['Vary'] = 'Accept-Encoding'
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and response.content_length >= GZIP_MIN_SIZE:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    
+    return response
+
 # 注册模板过滤器
 @app.template_filter('local_time')
 def local_time_filter(utc_time_str):
@@ -74,6 +123,20 @@ def favicon():
     # 返回一个简单的透明图标，避免404错误
     return '', 204  # 204 No Content
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus 格式的监控系统自身指标
+    
+    已登录用户可访问；采集程序通过 Authorization: Bearer <METRICS_TOKEN> 访问，未配置令牌时不开放。
+    不按来源地址放行：经反向代理访问时 remote_addr 都是代理的本机地址
+    """
+    if 'user_id' not in session:
+        auth = request.headers.get('Authorization', '')
+        token = auth[7:] if auth.startswith('Bearer ') else ''
+        if not Config.METRICS_TOKEN or not hmac.compare_digest(token.encode(), Config.METRICS_TOKEN.encode()):
+            return 'Forbidden', 403
+    return app.response_class(registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """用户登录"""
@@ -255,7 +318,7 @@ def monitor_detail(target_id):
     if not target:
         return "监控目标不存在", 404
     
-    return render_template('monitor_detail.html', target=dict(target))
+    return render_template('monitor_detail.html', target=dict(target), timezone=Config.TIMEZONE)
 
 @app.route('/api/test-connection', methods=['POST'])
 @login_required
@@ -516,6 +579,16 @@ def api_targets():
         
         data = request.json
         
+        rules_error = validate_rules(data['config'].get('alert_rules'))
+        if rules_error:
+            db.close()
+            return jsonify({'success': False, 'error': f'告警规则错误: {rules_error}'})
+        
+        dependency_error = validate_dependency(cursor, None, data['config'])
+        if dependency_error:
+            db.close()
+            return jsonify({'success': False, 'error': dependency_error})
+        
         # 加密配置中的敏感信息
         encrypted_config = encrypt_config(data['config'])
         
@@ -549,6 +622,16 @@ def api_target(target_id):
         cursor.execute('DELETE FROM monitor_targets WHERE id = ?', (target_id,))
         db.commit()
         db.close()
+        config_cache.invalidate(target_id)
+        circuit_breaker.reset(target_id)
+        rule_engine.forget(target_id)
+        anomaly_detector.forget(target_id)
+        TARGET_CHECK_DURATION.remove(target_id=target_id)
+        tracer.forget(target_id)
+        alert_tracker.forget(target_id)
+        check_stats.forget(target_id)
+        local_sampler.forget(target_id)
+        local_collector.forget(target_id)
         return jsonify({'success': True})
     
     if request.method == 'PUT':
@@ -559,6 +642,16 @@ def api_target(target_id):
         
         data = request.json
         
+        rules_error = validate_rules(data['config'].get('alert_rules'))
+        if rules_error:
+            db.close()
+            return jsonify({'success': False, 'error': f'告警规则错误: {rules_error}'})
+        
+        dependency_error = validate_dependency(cursor, target_id, data['config'])
+        if dependency_error:
+            db.close()
+            return jsonify({'success': False, 'error': dependency_error})
+        
         # 获取原有配置
         cursor.execute('SELECT config FROM monitor_targets WHERE id = ?', (target_id,))
         result = cursor.fetchone()
@@ -585,6 +678,8 @@ def api_target(target_id):
             )
             db.commit()
             db.close()
+            config_cache.invalidate(target_id)
+            circuit_breaker.reset(target_id)
             return jsonify({'success': True})
         else:
             db.close()
@@ -595,99 +690,354 @@ def api_target(target_id):
     db.close()
     return jsonify(dict(target) if target else {})
 
+@app.route('/api/traces')
+@admin_required
+def api_traces():
+    """最近检查的分阶段耗时（仅管理员）
+    
+    参数:
+        target_id: 监控目标ID，不指定时返回所有目标
+        limit: 最多返回的追踪记录数，默认50
+    """
+    target_id = request.args.get('target_id', type=int)
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({
+        'phases': PHASE_LABELS,
+        'summary': tracer.summary(target_id),
+        'traces': tracer.recent(target_id, limit)
+    })
+
+@app.route('/api/logs')
+@admin_required
+def api_logs():
+    """查询内存中的最近日志（仅管理员）
+    
+    参数:
+        target_id: 监控目标ID
+        level: 最低日志级别（DEBUG/INFO/WARNING/ERROR）
+        from/to: 时间范围（epoch 秒）
+        limit: 最多返回的条数，默认200
+    """
+    return jsonify(log_buffer.query(
+        target_id=request.args.get('target_id', type=int),
+        level=request.args.get('level'),
+        since=request.args.get('from', type=float),
+        until=request.args.get('to', type=float),
+        limit=min(request.args.get('limit', 200, type=int), 1000)
+    ))
+
+@app.route('/api/profile', methods=['GET', 'POST', 'DELETE'])
+@admin_required
+def api_profile():
+    """按需性能剖析（仅管理员）
+    
+    POST: 开启剖析 {mode: cycles|window, cycles, seconds, interval_ms, include_idle}
+    GET: 剖析状态和结果，format=collapsed 时下载折叠栈文件
+    DELETE: 停止剖析
+    """
+    if request.method == 'POST':
+        data = request.json or {}
+        try:
+            error = profiler.start(
+                mode=data.get('mode', 'cycles'),
+                cycles=data.get('cycles', 1),
+                seconds=data.get('seconds', 30),
+                interval=float(data.get('interval_ms', 10)) / 1000,
+                include_idle=data.get('include_idle', False)
+            )
+        except (TypeError, ValueError):
+            error = '参数格式错误'
+        if error:
+            return jsonify({'success': False, 'error': error})
+        return jsonify({'success': True, 'status': profiler.status()})
+    
+    if request.method == 'DELETE':
+        profiler.stop()
+        return jsonify({'success': True, 'status': profiler.status()})
+    
+    if request.args.get('format') == 'collapsed':
+        response = app.response_class(profiler.collapsed(), content_type='text/plain; charset=utf-8')
+        response.headers['Content-Disposition'] = 'attachment; filename=profile.collapsed'
+        return response
+    return jsonify(profiler.report(top=min(request.args.get('top', 50, type=int), 500)))
+
+@app.route('/capacity')
+@admin_required
+def capacity():
+    """慢目标与容量报告页面"""
+    return render_template('capacity.html')
+
+@app.route('/api/capacity')
+@admin_required
+def api_capacity():
+    """慢目标与容量报告（仅管理员）
+    
+    参数:
+        hours: 统计窗口（小时），默认24，最多720
+    按小时累计的耗时统计汇总，不扫描 monitor_data
+    """
+    hours = min(max(request.args.get('hours', 24, type=int), 1), 720)
+    return jsonify(check_stats.report(
+        hours=hours,
+        workers=executor._max_workers,
+        interval=load_check_interval()
+    ))
+
+@app.route('/api/scheduler/health')
+@login_required
+def api_scheduler_health():
+    """调度器健康状态：启动延迟、错过的执行、积压和线程利用率"""
+    return jsonify(scheduler_health.status())
+
+# 批量历史数据接口单次最多查询的目标数
+BATCH_MAX_TARGETS = 200
+
+@app.route('/api/monitor-data/batch')
+@login_required
+def api_monitor_data_batch():
+    """批量获取多个监控目标的降采样历史数据
+    
+    参数：
+        ids: 逗号分隔的监控目标ID
+        metrics: 逗号分隔的指标名，默认按各目标的监控类型选择
+        from / to / points / mode: 与单目标接口相同
+    所有目标的数据通过一次查询读取，避免浏览器逐个目标请求
+    """
+    try:
+        target_ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({'error': 'ids 参数格式错误'}), 400
+    
+    target_ids = list(dict.fromkeys(target_ids))
+    if not target_ids:
+        return jsonify({'error': '缺少 ids 参数'}), 400
+    if len(target_ids) > BATCH_MAX_TARGETS:
+        return jsonify({'error': f'单次最多查询 {BATCH_MAX_TARGETS} 个监控目标'}), 400
+    
+    end = request.args.get('to', type=int) or int(time.time())
+    start = request.args.get('from', type=int)
+    if start is None:
+        start = end - 24 * 3600
+    points = request.args.get('points', 500, type=int)
+    mode = request.args.get('mode', 'lttb')
+    metrics_arg = request.args.get('metrics')
+    
+    db = get_db()
+    cursor = db.cursor()
+    
+    placeholders = ','.join('?' * len(target_ids))
+    cursor.execute(f'SELECT id, type FROM monitor_targets WHERE id IN ({placeholders})', target_ids)
+    target_metrics = {
+        row['id']: parse_metrics(metrics_arg, row['type'])
+        for row in cursor.fetchall()
+    }
+    
+    results = downsample_batch(cursor, target_metrics, start, end, points, mode)
+    db.close()
+    
+    return json_response({
+        'from': start,
+        'to': end,
+        'mode': 'bucket' if mode == 'bucket' else 'lttb',
+        'targets': {str(tid): results[tid] for tid in target_ids if tid in results}
+    })
+
 @app.route('/api/monitor-data/<int:target_id>')
 @login_required
 def api_monitor_data(target_id):
-    """获取监控数据"""
+    """获取监控数据
+    
+    默认返回最近 limit 条原始记录；传入 from 或 metrics 时返回服务端降采样后的数值序列：
+        from / to: 时间范围（epoch 秒），to 默认为当前时间，from 默认为 to 之前24小时
+        points: 目标数据点数，默认500
+        mode: lttb（默认，保留曲线形状）或 bucket（每个时间桶的最小/平均/最大值）
+        metrics: 逗号分隔的指标名，默认按监控类型选择
+    序列结果带有 cursor（最新记录ID），之后传入 since=<cursor>&metrics=... 只返回新增的原始数据点；
+    原始记录模式下同样可以传入 since，只返回ID大于游标的记录；传入 epoch=1 时不做时区转换
+    """
     db = get_db()
     cursor = db.cursor()
     
+    start = request.args.get('from', type=int)
+    since = request.args.get('since', type=int)
+    
+    if start is not None or request.args.get('metrics'):
+        end = request.args.get('to', type=int) or int(time.time())
+        if start is None:
+            start = end - 24 * 3600
+        points = request.args.get('points', 500, type=int)
+        mode = request.args.get('mode', 'lttb')
+        
+        cursor.execute('SELECT type FROM monitor_targets WHERE id = ?', (target_id,))
+        target = cursor.fetchone()
+        if not target:
+            db.close()
+            return jsonify({'error': '监控目标不存在'}), 404
+        
+        metrics = parse_metrics(request.args.get('metrics'), target['type'])
+        if since is not None:
+            result = query_since(cursor, target_id, metrics, since)
+        else:
+            result = downsample_series(cursor, target_id, metrics, start, end, points, mode)
+            result.update({'from': start, 'to': end})
+        db.close()
+        
+        result['target_id'] = target_id
+        return json_response(result)
+    
     # 获取最近的数据点数量
     limit = request.args.get('limit', 100, type=int)
+    epoch = request.args.get('epoch', 0, type=int)
     
-    cursor.execute('''
-        SELECT * FROM monitor_data 
-        WHERE target_id = ? 
-        ORDER BY created_at DESC 
-        LIMIT ?
-    ''', (target_id, limit))
+    if since is not None:
+        # 只取游标之后的新记录（仍然按 limit 截取最新的部分）
+        cursor.execute('''
+            SELECT * FROM monitor_data 
+            WHERE target_id = ? AND id > ? 
+            ORDER BY id DESC 
+            LIMIT ?
+        ''', (target_id, since, limit))
+    else:
+        cursor.execute('''
+            SELECT * FROM monitor_data 
+            WHERE target_id = ? 
+            ORDER BY id DESC 
+            LIMIT ?
+        ''', (target_id, limit))
     data = [dict(row) for row in cursor.fetchall()]
     db.close()
     
-    # 转换时间为本地时区
-    for item in data:
-        if 'created_at' in item:
-            item['created_at'] = utc_to_local(item['created_at'])
+    # 转换时间为本地时区（epoch=1 时只返回 created_ts，由浏览器格式化）
+    if not epoch:
+        for item in data:
+            if 'created_at' in item:
+                item['created_at'] = utc_to_local(item['created_at'])
     
     # 反转顺序，使时间从旧到新
     data.reverse()
     return jsonify(data)
 
+@lru_cache(maxsize=1024)
+def content_fingerprint(metric_value):
+    """监控数据的内容指纹（不含每次检查都会变化的 execution_time）"""
+    try:
+        content = json.loads(metric_value)
+    except (TypeError, ValueError):
+        return hash(metric_value)
+    if isinstance(content, dict):
+        content.pop('execution_time', None)
+    return hash(json.dumps(content, sort_keys=True))
+
 @app.route('/api/dashboard-stats')
 @login_required
 def api_dashboard_stats():
-    """获取仪表板统计数据"""
+    """获取仪表板统计数据
+    
+    支持增量同步：
+        since: 客户端上次收到的版本号，只返回此后发生变化的目标和已移除的目标ID
+    响应带有 ETag（当前版本号和最新记录ID），客户端通过 If-None-Match 携带时没有新的检查记录则返回 304
+    目标内容未变化时只在 times 中返回最新检查时间，“最后更新”时间不会停在内容上次变化时
+    传入 epoch=1 时 time 字段为 epoch 秒，由浏览器格式化
+    """
+    since = request.args.get('since', type=int)
+    epoch = request.args.get('epoch', 0, type=int)
+    
     db = get_db()
     cursor = db.cursor()
     
-    # 获取所有启用的监控目标及其最新数据
-    cursor.execute('SELECT * FROM monitor_targets WHERE enabled = 1')
+    # 一次查询获取所有启用目标及其最新数据
+    cursor.execute('''
+        SELECT t.id, t.name, t.type, d.id AS data_id, d.status, d.metric_value, d.created_at, d.created_ts
+        FROM monitor_targets t
+        LEFT JOIN monitor_data d ON d.id = (
+            SELECT MAX(id) FROM monitor_data WHERE target_id = t.id
+        )
+        WHERE t.enabled = 1
+        ORDER BY t.id
+    ''')
     targets = cursor.fetchall()
+    db.close()
+    
+    summary = {
+        'total': len(targets),
+        'online': 0,
+        'offline': 0,
+        'warning': 0,
+        'unknown': 0
+    }
+    
+    fingerprints = {}
+    latest_id = 0
+    for target in targets:
+        if target['data_id'] is None:
+            continue
+        # 按显示内容计算指纹：新的检查记录与上次内容相同时不重新发送数据
+        fingerprints[target['id']] = (
+            target['status'], content_fingerprint(target['metric_value']), target['name'], target['type']
+        )
+        latest_id = max(latest_id, target['data_id'])
+        
+        # 统计状态
+        if target['status'] == 'normal':
+            summary['online'] += 1
+        elif target['status'] == 'error':
+            summary['offline'] += 1
+        elif target['status'] == 'unknown':
+            # 依赖的父目标不可用而跳过检查
+            summary['unknown'] += 1
+        else:
+            summary['warning'] += 1
+    
+    version = dashboard_sync.update(fingerprints)
+    # 内容未变化的新检查记录也要更新检查时间，ETag 同时包含最新记录ID
+    etag = f'{version}-{latest_id}'
+    
+    if request.if_none_match.contains_weak(etag):
+        return json_response(None, etag=etag)
+    
+    full, changed_ids, removed_ids = dashboard_sync.delta(since)
+    
+    # 只返回变化目标的监控数据
+    changed = [t for t in targets if t['id'] in changed_ids and t['data_id'] is not None]
     
     stats = {
+        'version': version,
+        'full': full,
+        'removed': removed_ids,
+        'times': {
+            target['id']: target['created_ts'] if epoch else utc_to_local(target['created_at'])
+            for target in targets if target['data_id'] is not None
+        },
         'servers': [],
         'applications': [],
         'databases': [],
         'business': [],
         'backups': [],
-        'summary': {
-            'total': len(targets),
-            'online': 0,
-            'offline': 0,
-            'warning': 0
-        }
+        'summary': summary
     }
     
-    for target in targets:
-        cursor.execute('''
-            SELECT * FROM monitor_data 
-            WHERE target_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        ''', (target['id'],))
-        latest = cursor.fetchone()
-        
-        if latest:
-            target_data = {
-                'id': target['id'],
-                'name': target['name'],
-                'type': target['type'],
-                'status': latest['status'],
-                'data': latest['metric_value'],
-                'time': utc_to_local(latest['created_at'])
-            }
-            
-            if target['type'] == 'server':
-                stats['servers'].append(target_data)
-            elif target['type'] == 'application':
-                stats['applications'].append(target_data)
-            elif target['type'] == 'database':
-                stats['databases'].append(target_data)
-            elif target['type'] == 'business':
-                stats['business'].append(target_data)
-            elif target['type'] == 'backup':
-                stats['backups'].append(target_data)
-            
-            # 统计状态
-            if latest['status'] == 'normal':
-                stats['summary']['online'] += 1
-            elif latest['status'] == 'error':
-                stats['summary']['offline'] += 1
-            else:
-                stats['summary']['warning'] += 1
+    type_keys = {
+        'server': 'servers',
+        'application': 'applications',
+        'database': 'databases',
+        'business': 'business',
+        'backup': 'backups'
+    }
     
-    db.close()
-    return jsonify(stats)
+    for target in changed:
+        target_data = {
+            'id': target['id'],
+            'name': target['name'],
+            'type': target['type'],
+            'status': target['status'],
+            'data': target['metric_value'],
+            'time': target['created_ts'] if epoch else utc_to_local(target['created_at'])
+        }
+        
+        if target['type'] in type_keys:
+            stats[type_keys[target['type']]].append(target_data)
+    
+    return json_response(stats, etag=etag)
 
 @app.route('/alerts')
 @login_required
@@ -846,6 +1196,11 @@ def api_config():
         data = request.json
         need_restart = False
         
+        rules_error = validate_rules(data.get('alert_rules'), grouped=True)
+        if rules_error:
+            db.close()
+            return jsonify({'success': False, 'error': f'告警规则错误: {rules_error}'})
+        
         for key, value in data.items():
             cursor.execute(
                 'INSERT OR REPLACE INTO system_config (key, value) VALUES (?, ?)',
@@ -858,6 +1213,13 @@ def api_config():
         db.commit()
         db.close()
         
+        if 'wechat_webhook' in data:
+            invalidate_webhook_cache()
+        if 'alert_rules' in data or any(key in data for key in DEFAULT_THRESHOLDS):
+            rule_engine.invalidate()
+        if 'anomaly_detection' in data:
+            anomaly_detector.invalidate()
+        
         return jsonify({
             'success': True,
             'need_restart': need_restart,
@@ -950,6 +1312,12 @@ def api_clear_alerts():
         deleted_alerts = count_before
         deleted_monitor_data = 0
         
+        # 清理已处理完毕且对应告警已删除的发件箱记录
+        cursor.execute('''
+            DELETE FROM alert_outbox
+            WHERE status != 'pending' AND alert_id NOT IN (SELECT id FROM alerts)
+        ''')
+        
         # 如果需要清除监控数据
         if clear_monitor_data:
             if range_type == 'all':
@@ -966,6 +1334,9 @@ def api_clear_alerts():
         
         db.commit()
         
+        # 告警记录可能已被删除，提交后告警状态机重新从数据库加载
+        alert_tracker.reset()
+        
         # 优化数据库（回收空间）
         cursor.execute('VACUUM')
         
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+调度器基准测试脚本
+
+在本机启动一组模拟的被监控对象，生成 N 个监控目标写入临时数据库，
+执行 run_monitors 并统计：
+    - 每轮检查的总耗时
+    - 单个检查耗时的 p50/p99
+    - CPU 占用（占单核的百分比）
+    - 进程 RSS
+    - SQLite 写入吞吐（监控数据行/秒）
+
+模拟对象：
+    - HTTP 服务：多线程，可配置延迟和错误率（应用监控）
+    - SSH 服务：基于 paramiko，应答 /proc/stat、/proc/meminfo、df、find 命令（远程服务器和备份监控）
+    - 拒绝连接的端口、只建立连接不应答的慢端口（数据库监控）
+
+每个目标规模在独立的子进程中执行，RSS 和 CPU 只统计监控进程本身，模拟对象运行在父进程中。
+
+使用方法:
+    python3 benchmark_scheduler.py                          # 默认 10,100,1000 个目标，每个规模 3 轮
+    python3 benchmark_scheduler.py --sizes 10,100,1000,5000 --cycles 2
+    python3 benchmark_scheduler.py --http-latency 0.2 --http-error-rate 0.1 --json result.json
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MIX = 'application=0.5,server=0.3,backup=0.1,database=0.1'
+
+
+# ---- 模拟的 HTTP 服务 ----
+
+class FakeHTTPHandler(BaseHTTPRequestHandler):
+    """按配置的延迟和错误率应答"""
+    
+    latency = 0.05
+    error_rate = 0.0
+    
+    def do_GET(self):
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        status = 500 if random.random() < self.error_rate else 200
+        body = b'ok'
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(latency, error_rate):
+    handler = type('Handler', (FakeHTTPHandler,), {'latency': latency, 'error_rate': error_rate})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 256
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+# ---- 模拟的 SSH 服务 ----
+
+def fake_command_output(command):
+    """生成远程命令的模拟输出"""
+    if '/proc/stat' in command:
+        return f"{random.uniform(5, 60):.2f}"
+    if '/proc/meminfo' in command:
+        return f"{random.uniform(20, 80):.2f}"
+    if command.startswith('df '):
+        return str(random.randint(30, 75))
+    if command.startswith('find '):
+        now = time.time()
+        return '\n'.join(
+            f"backup_{i:03d}.sql.gz|{random.randint(1, 500) * 1048576}|{now - i * 86400:.1f}"
+            for i in range(random.randint(3, 15))
+        )
+    if command.startswith('ps '):
+        return '1'
+    return ''
+
+
+def start_ssh_server():
+    import logging
+    import paramiko
+    
+    # 预检只建立 TCP 连接随即断开，服务端会记录大量握手失败日志
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    host_key = paramiko.RSAKey.generate(2048)
+    
+    class Handler(paramiko.ServerInterface):
+        def __init__(self):
+            self.commands = queue.Queue()
+        
+        def get_allowed_auths(self, username):
+            return 'password'
+        
+        def check_auth_password(self, username, password):
+            return paramiko.AUTH_SUCCESSFUL
+        
+        def check_channel_request(self, kind, chanid):
+            if kind == 'session':
+                return paramiko.OPEN_SUCCEEDED
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+        
+        def check_channel_exec_request(self, channel, command):
+            self.commands.put((channel, command.decode('utf-8', 'replace')))
+            return True
+    
+    def serve(sock):
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(host_key)
+        handler = Handler()
+        try:
+            transport.start_server(server=handler)
+            while transport.is_active():
+                try:
+                    channel, command = handler.commands.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                channel.sendall(fake_command_output(command).encode('utf-8'))
+                channel.send_exit_status(0)
+                channel.close()
+        except Exception:
+            pass
+        finally:
+            transport.close()
+    
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(256)
+    
+    def accept_loop():
+        while True:
+            sock, _ = listener.accept()
+            threading.Thread(target=serve, args=(sock,), daemon=True).start()
+    
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+# ---- 拒绝连接 / 不应答的端口 ----
+
+def refused_port():
+    """绑定后立即关闭，连接该端口会被拒绝"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_slow_port():
+    """只由内核完成握手、从不应答的端口（客户端等待到自身超时）"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1024)
+    return sock, sock.getsockname()[1]
+
+
+# ---- 生成监控目标 ----
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, share = item.partition('=')
+        mix[name.strip()] = float(share)
+    total = sum(mix.values())
+    return {name: share / total for name, share in mix.items()}
+
+
+def build_targets(count, mix, farm, slow_share, seed):
+    """按比例生成监控目标 [(名称, 类型, 配置)]"""
+    rng = random.Random(seed)
+    types = list(mix)
+    weights = [mix[name] for name in types]
+    targets = []
+    for i in range(count):
+        target_type = rng.choices(types, weights)[0]
+        if target_type == 'application':
+            config = {'url': f"http://127.0.0.1:{farm['http']}/health/{i}"}
+        elif target_type == 'server':
+            config = {
+                'is_remote': True, 'host': '127.0.0.1', 'port': farm['ssh'],
+                'username': 'bench', 'password': 'bench'
+            }
+        elif target_type == 'backup':
+            config = {
+                'host': '127.0.0.1', 'port': farm['ssh'], 'username': 'bench', 'password': 'bench',
+                'backup_path': '/backup', 'file_pattern': '*.sql.gz', 'max_age_hours': 48
+            }
+        elif target_type == 'database':
+            port = farm['slow'] if rng.random() < slow_share else farm['refused']
+            config = {
+                'db_type': 'mysql', 'host': '127.0.0.1', 'port': port,
+                'user': 'bench', 'password': 'bench'
+            }
+        else:
+            raise ValueError(f'不支持的监控类型: {target_type}')
+        targets.append((f'bench-{target_type}-{i}', target_type, json.dumps(config)))
+    return targets
+
+
+# ---- 子进程：执行检查并统计 ----
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def run_worker(args):
+    """在临时数据库中执行 run_monitors，结果以 JSON 输出到 stdout"""
+    # 初始化数据库等过程的输出转到 stderr，stdout 只输出结果
+    output = sys.stdout
+    sys.stdout = sys.stderr
+    workdir = tempfile.mkdtemp(prefix='monitor-bench-')
+    os.chdir(workdir)
+    
+    from config import Config
+    Config.DATABASE = os.path.join(workdir, 'bench.db')
+    
+    import psutil
+    import database
+    database.init_db()
+    
+    farm = json.loads(args.farm)
+    targets = build_targets(args.worker, parse_mix(args.mix), farm, args.slow_share, args.seed)
+    db = database.get_db()
+    db.executemany('INSERT INTO monitor_targets (name, type, config) VALUES (?, ?, ?)', targets)
+    db.commit()
+    db.close()
+    
+    import scheduler
+    from tracing import tracer
+    from metrics import DB_WRITE_DURATION
+    
+    process = psutil.Process()
+    cycles = []
+    for _ in range(args.cycles):
+        start_ts = time.time()
+        cpu_before = process.cpu_times()
+        writes_before, write_time_before = DB_WRITE_DURATION.totals(table='monitor_data')
+        start = time.perf_counter()
+        
+        scheduler.run_monitors()
+        
+        wall = time.perf_counter() - start
+        cpu_after = process.cpu_times()
+        writes_after, write_time_after = DB_WRITE_DURATION.totals(table='monitor_data')
+        cpu_seconds = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+        latencies = [
+            trace['duration'] for trace in tracer.recent(limit=args.worker * 2)
+            if trace['ts'] >= start_ts
+        ]
+        rows = writes_after - writes_before
+        write_time = write_time_after - write_time_before
+        cycles.append({
+            'wall': round(wall, 3),
+            'checks': len(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p99_ms': percentile(latencies, 99),
+            'cpu_percent': round(cpu_seconds / wall * 100, 1) if wall else None,
+            'rss_mb': round(process.memory_info().rss / 1048576, 1),
+            'rows': rows,
+            'rows_per_sec': round(rows / wall, 1) if wall else None,
+            'insert_rows_per_sec': round(rows / write_time, 1) if write_time else None
+        })
+    
+    json.dump({'targets': args.worker, 'cycles': cycles}, output)
+
+
+# ---- 父进程：启动模拟对象并汇总 ----
+
+def summarize(result):
+    cycles = result['cycles']
+    walls = sorted(cycle['wall'] for cycle in cycles)
+    last = cycles[-1]
+    return {
+        'targets': result['targets'],
+        'wall_median': walls[len(walls) // 2],
+        'wall_max': walls[-1],
+        'p50_ms': last['p50_ms'],
+        'p99_ms': last['p99_ms'],
+        'cpu_percent': max(cycle['cpu_percent'] or 0 for cycle in cycles),
+        'rss_mb': max(cycle['rss_mb'] for cycle in cycles),
+        'rows_per_sec': last['rows_per_sec'],
+        'insert_rows_per_sec': last['insert_rows_per_sec']
+    }
+
+
+def print_table(rows):
+    headers = [
+        ('targets', '目标数'), ('wall_median', '轮耗时中位(s)'), ('wall_max', '轮耗时最大(s)'),
+        ('p50_ms', '检查p50(ms)'), ('p99_ms', '检查p99(ms)'), ('cpu_percent', 'CPU(%)'),
+        ('rss_mb', 'RSS(MB)'), ('rows_per_sec', '写入(行/s)'), ('insert_rows_per_sec', 'INSERT(行/s)')
+    ]
+    print(' | '.join(label for _, label in headers))
+    for row in rows:
+        print(' | '.join('-' if row[key] is None else str(row[key]) for key, _ in headers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='调度器基准测试')
+    parser.add_argument('--sizes', default='10,100,1000', help='目标规模，逗号分隔')
+    parser.add_argument('--cycles', type=int, default=3, help='每个规模执行的检查轮数')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='各监控类型的比例')
+    parser.add_argument('--http-latency', type=float, default=0.05, help='HTTP 服务平均延迟（秒）')
+    parser.add_argument('--http-error-rate', type=float, default=0.02, help='HTTP 服务返回500的比例')
+    parser.add_argument('--slow-share', type=float, default=0.05, help='数据库目标中指向不应答端口的比例')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子（相同参数生成相同的目标）')
+    parser.add_argument('--json', help='把完整结果写入 JSON 文件')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--farm', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker:
+        run_worker(args)
+        return
+    
+    random.seed(args.seed)
+    slow_sock, slow_port = start_slow_port()
+    farm = {
+        'http': start_http_server(args.http_latency, args.http_error_rate),
+        'ssh': start_ssh_server(),
+        'refused': refused_port(),
+        'slow': slow_port
+    }
+    print(f"模拟服务: HTTP :{farm['http']}  SSH :{farm['ssh']}  拒绝 :{farm['refused']}  不应答 :{farm['slow']}")
+    
+    env = dict(os.environ, LOG_LEVEL='ERROR')
+    script = os.path.abspath(__file__)
+    results = []
+    for size in [int(item) for item in args.sizes.split(',') if item.strip()]:
+        print(f"\n执行 {size} 个目标 × {args.cycles} 轮 ...")
+        command = [
+            sys.executable, script, '--worker', str(size), '--farm', json.dumps(farm),
+            '--cycles', str(args.cycles), '--mix', args.mix,
+            '--slow-share', str(args.slow_share), '--seed', str(args.seed)
+        ]
+        proc = subprocess.run(
+            command, env=env, stdout=subprocess.PIPE, cwd=os.path.dirname(script), text=True
+        )
+        if proc.returncode != 0:
+            print(f"{size} 个目标执行失败（退出码 {proc.returncode}）")
+            continue
+        result = json.loads(proc.stdout)
+        for index, cycle in enumerate(result['cycles'], 1):
+            print(f"  第{index}轮: {cycle}")
+        results.append(result)
+    
+    slow_sock.close()
+    if not results:
+        return
+    
+    print()
+    print_table([summarize(result) for result in results])
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'params': vars(args), 'farm': farm, 'results': results}, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Web 接口压测脚本
+
+generate: 生成包含大量历史数据的测试数据库
+    按真实检查结果的 JSON 结构为各类型监控目标写入 monitor_data（含间歇性故障），
+    故障期间同时写入对应的告警记录（大部分已恢复，少量仍在告警中）
+
+run: 并发请求主要页面和接口，统计各接口的延迟分位数，并与保存的基线比较
+    默认使用 Flask 测试客户端直接调用（不经过网络），也可以用 --url 压测运行中的服务
+
+使用方法:
+    python3 benchmark_web.py generate --db bench.db --targets 300 --days 7
+    python3 benchmark_web.py run --db bench.db --requests 200 --concurrency 8 --save-baseline baseline.json
+    python3 benchmark_web.py run --db bench.db --baseline baseline.json          # 与基线比较，退化时退出码为1
+    python3 benchmark_web.py run --url http://127.0.0.1:8080 --username admin --password admin123
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+TYPE_MIX = {
+    'server': 0.35, 'application': 0.25, 'database': 0.15,
+    'storage': 0.1, 'business': 0.1, 'backup': 0.05
+}
+INSERT_BATCH = 10000          # 每批写入的行数
+OUTAGE_START_PROBABILITY = 0.0005   # 每个采样点开始一次故障的概率
+DEFAULT_ENDPOINTS = ['/api/dashboard-stats', '/dashboard', '/api/monitor-data/{id}', '/alerts']
+
+
+# ---- 生成历史数据 ----
+
+def make_sample(target_type, rng, state, failing):
+    """生成一条与 check_* 写入格式一致的监控数据，返回 (metric_value, status)"""
+    execution_time = round(rng.uniform(0.01, 0.3), 2)
+    if target_type == 'server':
+        if failing:
+            return {'status': 'offline', 'error': '无法连接到服务器', 'execution_time': 15.0}, 'error'
+        # 资源使用率在基准值附近随机游走
+        for key in ('cpu', 'memory', 'disk'):
+            state[key] = min(max(state[key] + rng.gauss(0, 2), 1), 99)
+        return {
+            'cpu': round(state['cpu'], 1),
+            'memory': round(state['memory'], 1),
+            'disk': round(state['disk'], 1),
+            'execution_time': execution_time
+        }, 'normal'
+    if target_type == 'application':
+        if failing:
+            return {'status': 'offline', 'error': 'Connection refused', 'execution_time': execution_time}, 'error'
+        return {
+            'status': 'online',
+            'status_code': 200,
+            'response_time': round(rng.lognormvariate(-2.5, 0.5), 3),
+            'execution_time': execution_time
+        }, 'normal'
+    if target_type == 'database':
+        if failing:
+            return {'status': 'offline', 'error': '(2003, "Can\'t connect to MySQL server")', 'execution_time': 10.0}, 'error'
+        return {'status': 'online', 'execution_time': execution_time}, 'normal'
+    if target_type == 'storage':
+        state['used'] = min(state['used'] + rng.randint(0, 1 << 20), state['total'])
+        return {
+            'total': state['total'],
+            'used': state['used'],
+            'free': state['total'] - state['used'],
+            'percent': round(state['used'] / state['total'] * 100, 1),
+            'execution_time': execution_time
+        }, 'normal'
+    if target_type == 'business':
+        if failing:
+            rows = [[f'ORD{rng.randint(10000, 99999)}', rng.randint(1, 500)] for _ in range(rng.randint(1, 5))]
+            return {
+                'value': rows[0][0], 'alert': True, 'detail_data': rows, 'all_data': rows,
+                'row_count': len(rows), 'execution_time': execution_time
+            }, 'warning'
+        return {
+            'value': 0, 'alert': False, 'detail_data': None, 'all_data': [],
+            'row_count': 0, 'execution_time': execution_time
+        }, 'normal'
+    # backup
+    now = time.time()
+    files = [
+        {
+            'name': f'backup_{i:03d}.sql.gz',
+            'size': 104857600 + i,
+            'size_human': '100.00 MB',
+            'mtime': now - i * 86400,
+            'mtime_str': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now - i * 86400))
+        }
+        for i in range(10)
+    ]
+    return {
+        'status': 'warning' if failing else 'normal',
+        'alert': failing,
+        'alert_message': '最新备份文件已超过 48 小时' if failing else '',
+        'files': files,
+        'total_count': 30,
+        'total_size': 3145728000,
+        'total_size_human': '2.93 GB',
+        'backup_path': '/backup',
+        'file_pattern': '*.sql.gz',
+        'execution_time': execution_time
+    }, 'warning' if failing else 'normal'
+
+
+def generate(args):
+    """生成测试数据库"""
+    if os.path.exists(args.db):
+        print(f"数据库已存在: {args.db}（请先删除或指定其他路径）")
+        return 1
+    
+    from config import Config
+    Config.DATABASE = args.db
+    import database
+    database.init_db()
+    
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(args.db)
+    # 生成数据时不需要持久性保证
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    
+    types = list(TYPE_MIX)
+    targets = []
+    for i in range(args.targets):
+        target_type = rng.choices(types, [TYPE_MIX[name] for name in types])[0]
+        cursor = conn.execute(
+            'INSERT INTO monitor_targets (name, type, config) VALUES (?, ?, ?)',
+            (f'{target_type}-{i:04d}', target_type, json.dumps({'generated': True}))
+        )
+        targets.append({
+            'id': cursor.lastrowid,
+            'type': target_type,
+            'state': {
+                'cpu': rng.uniform(5, 60), 'memory': rng.uniform(20, 70), 'disk': rng.uniform(20, 80),
+                'total': 1 << 40, 'used': rng.randint(1 << 38, 1 << 39)
+            },
+            'outage_left': 0,
+            'alert_id': None
+        })
+    
+    end_ts = int(time.time())
+    start_ts = end_ts - args.days * 86400
+    steps = (end_ts - start_ts) // args.interval
+    total = steps * len(targets)
+    print(f"生成 {len(targets)} 个目标 × {steps} 个采样点 = {total} 条监控数据 ...")
+    
+    started = time.time()
+    rows = []
+    written = 0
+    alerts = 0
+    for step in range(steps):
+        ts = start_ts + step * args.interval
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+        for target in targets:
+            # 间歇性故障：故障开始时写入告警，结束时标记恢复
+            if target['outage_left'] == 0 and rng.random() < OUTAGE_START_PROBABILITY:
+                target['outage_left'] = rng.randint(3, 60)
+                cursor = conn.execute(
+                    'INSERT INTO alerts (target_id, alert_type, message, status, created_at, '
+                    'last_seen_ts, last_notified_ts, occurrences) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (target['id'], target['type'], f"{target['type']} 检查失败", 'pending',
+                     created_at, ts, ts, target['outage_left'])
+                )
+                target['alert_id'] = cursor.lastrowid
+                alerts += 1
+            failing = target['outage_left'] > 0
+            if failing:
+                target['outage_left'] -= 1
+                if target['outage_left'] == 0:
+                    conn.execute(
+                        "UPDATE alerts SET status = 'resolved', resolved_at = ?, last_seen_ts = ? WHERE id = ?",
+                        (created_at, ts, target['alert_id'])
+                    )
+                    target['alert_id'] = None
+            
+            metric_value, status = make_sample(target['type'], rng, target['state'], failing)
+            rows.append((target['id'], target['type'], json.dumps(metric_value), status, created_at, ts))
+        
+        if len(rows) >= INSERT_BATCH:
+            conn.executemany(
+                'INSERT INTO monitor_data (target_id, metric_type, metric_value, status, created_at, created_ts) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows
+            )
+            written += len(rows)
+            rows = []
+            if step % max(steps // 20, 1) == 0:
+                conn.commit()
+                print(f"  {written}/{total} ({written / (time.time() - started):.0f} 行/秒)")
+    
+    if rows:
+        conn.executemany(
+            'INSERT INTO monitor_data (target_id, metric_type, metric_value, status, created_at, created_ts) '
+            'VALUES (?, ?, ?, ?, ?, ?)', rows
+        )
+        written += len(rows)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    
+    size_mb = os.path.getsize(args.db) / 1048576
+    print(f"完成: {written} 条监控数据, {alerts} 条告警, 数据库 {size_mb:.1f} MB, 耗时 {time.time() - started:.1f}秒")
+    return 0
+
+
+# ---- 压测 ----
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def make_test_client_factory(args):
+    """使用 Flask 测试客户端直接调用（每个线程一个已登录的客户端）"""
+    from config import Config
+    Config.DATABASE = args.db
+    from app import app
+    import database
+    
+    db = database.get_db()
+    target_ids = [row['id'] for row in db.execute('SELECT id FROM monitor_targets')]
+    admin = db.execute('SELECT id, username FROM users WHERE is_admin = 1 ORDER BY id LIMIT 1').fetchone()
+    db.close()
+    
+    local = threading.local()
+    
+    def request(path):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = admin['id']
+                session['username'] = admin['username']
+                session['is_admin'] = 1
+        response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+        return response.status_code, len(response.get_data())
+    
+    return request, target_ids
+
+
+def make_http_factory(args):
+    """请求运行中的服务（每个线程一个已登录的会话）"""
+    import requests
+    
+    local = threading.local()
+    
+    def session_for_thread():
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.post(f'{args.url}/login', data={'username': args.username, 'password': args.password})
+        return session
+    
+    targets = session_for_thread().get(f'{args.url}/api/targets').json()
+    
+    def request(path):
+        response = session_for_thread().get(args.url + path)
+        return response.status_code, len(response.content)
+    
+    return request, [target['id'] for target in targets]
+
+
+def expand_path(endpoint, target_ids, rng):
+    """把接口模板展开为实际请求路径"""
+    if '{id}' not in endpoint:
+        return endpoint
+    path = endpoint.replace('{id}', str(rng.choice(target_ids)))
+    # 与详情页相同的请求：24小时降采样图表
+    if endpoint == '/api/monitor-data/{id}':
+        now = int(time.time())
+        path += f'?from={now - 86400}&to={now}&points=500'
+    return path
+
+
+def run(args):
+    """并发压测各接口"""
+    if args.url:
+        request, target_ids = make_http_factory(args)
+    else:
+        if not os.path.exists(args.db):
+            print(f"数据库不存在: {args.db}（先执行 generate）")
+            return 1
+        request, target_ids = make_test_client_factory(args)
+    if not target_ids:
+        print('没有监控目标')
+        return 1
+    
+    rng = random.Random(args.seed)
+    endpoints = args.endpoints.split(',') if args.endpoints else DEFAULT_ENDPOINTS
+    report = {}
+    for endpoint in endpoints:
+        paths = [expand_path(endpoint, target_ids, rng) for _ in range(args.requests)]
+        # 预热（加载模板、SQLite 页缓存）
+        for path in paths[:min(3, len(paths))]:
+            request(path)
+        
+        latencies = []
+        errors = 0
+        sizes = 0
+        lock = threading.Lock()
+        
+        def call(path):
+            nonlocal errors, sizes
+            start = time.perf_counter()
+            status, size = request(path)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                sizes += size
+                if status >= 400:
+                    errors += 1
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(call, paths))
+        wall = time.perf_counter() - started
+        
+        report[endpoint] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / wall, 1),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(max(latencies), 2),
+            'avg_bytes': sizes // len(latencies)
+        }
+    
+    print_report(report)
+    
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['endpoints']
+        status = compare(report, baseline, args.tolerance)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({
+                'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'params': {'requests': args.requests, 'concurrency': args.concurrency, 'db': args.db, 'url': args.url},
+                'endpoints': report
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\n基线已保存: {args.save_baseline}")
+    return status
+
+
+def print_report(report):
+    print(f"\n{'接口':<28}{'请求':>6}{'错误':>6}{'RPS':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}")
+    for endpoint, item in report.items():
+        print(f"{endpoint:<28}{item['requests']:>6}{item['errors']:>6}{item['rps']:>8}"
+              f"{item['p50_ms']:>10}{item['p95_ms']:>10}{item['p99_ms']:>10}{item['max_ms']:>10}")
+
+
+def compare(report, baseline, tolerance):
+    """p50 或 p95 超过基线 (1 + tolerance) 倍判定为退化，返回退出码"""
+    regressions = []
+    print(f"\n与基线比较（容差 {tolerance:.0%}）:")
+    for endpoint, item in report.items():
+        base = baseline.get(endpoint)
+        if not base:
+            print(f"  {endpoint}: 基线中没有该接口")
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms'):
+            ratio = item[key] / base[key] if base[key] else 1
+            changes.append(f"{key[:3]} {base[key]} → {item[key]} ({ratio - 1:+.0%})")
+            if ratio > 1 + tolerance:
+                regressions.append(f"{endpoint} {key[:3]}")
+        print(f"  {endpoint}: " + ', '.join(changes))
+    if regressions:
+        print(f"\n性能退化: {', '.join(regressions)}")
+        return 1
+    print('\n未发现性能退化')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Web 接口压测')
+    sub = parser.add_subparsers(dest='command', required=True)
+    
+    gen = sub.add_parser('generate', help='生成历史数据')
+    gen.add_argument('--db', default='bench.db', help='数据库路径')
+    gen.add_argument('--targets', type=int, default=300, help='监控目标数')
+    gen.add_argument('--days', type=int, default=7, help='历史天数')
+    gen.add_argument('--interval', type=int, default=60, help='采样间隔（秒）')
+    gen.add_argument('--seed', type=int, default=1, help='随机种子')
+    
+    bench = sub.add_parser('run', help='执行压测')
+    bench.add_argument('--db', default='bench.db', help='数据库路径（使用测试客户端时）')
+    bench.add_argument('--url', help='运行中的服务地址，如 http://127.0.0.1:8080')
+    bench.add_argument('--username', default='admin', help='登录用户名（--url 时使用）')
+    bench.add_argument('--password', default='admin123', help='登录密码（--url 时使用）')
+    bench.add_argument('--endpoints', help='逗号分隔的接口列表，{id} 替换为随机目标ID')
+    bench.add_argument('--requests', type=int, default=100, help='每个接口的请求数')
+    bench.add_argument('--concurrency', type=int, default=8, help='并发数')
+    bench.add_argument('--baseline', help='与该基线文件比较')
+    bench.add_argument('--save-baseline', help='把本次结果保存为基线')
+    bench.add_argument('--tolerance', type=float, default=0.2, help='允许的退化比例')
+    bench.add_argument('--seed', type=int, default=1, help='随机种子')
+    
+    args = parser.parse_args()
+    if args.command == 'generate':
+        return generate(args)
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+监控目标熔断
+目标连续失败 FAILURE_THRESHOLD 次后进入熔断状态，之后按指数退避的间隔重新探测，
+两次探测之间不执行真实检查，直接记录 offline (cached)，
+避免宕机的服务器、数据库每轮都占用工作线程等待连接超时
+"""
+
+import threading
+import time
+
+FAILURE_THRESHOLD = 3   # 连续失败多少次后熔断
+BACKOFF_BASE = 120      # 首次熔断的探测间隔（秒），之后每次失败翻倍
+BACKOFF_MAX = 3600      # 最大探测间隔（秒）
+
+
+class CircuitBreaker:
+    """按监控目标记录连续失败次数和下次探测时间"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}  # target_id -> {'failures', 'next_probe', 'last_error'}
+    
+    def record(self, target_id, status, error=None):
+        """记录一次真实检查的结果
+        
+        Args:
+            target_id: 监控目标ID
+            status: 写入监控数据的状态，error 计为失败，normal/warning 计为成功
+            error: 失败原因
+        """
+        with self._lock:
+            if status == 'error':
+                state = self._states.setdefault(target_id, {'failures': 0, 'next_probe': 0})
+                state['failures'] += 1
+                state['last_error'] = error
+                if state['failures'] >= FAILURE_THRESHOLD:
+                    exponent = min(state['failures'] - FAILURE_THRESHOLD, 16)
+                    delay = min(BACKOFF_BASE * 2 ** exponent, BACKOFF_MAX)
+                    state['next_probe'] = time.time() + delay
+            elif status in ('normal', 'warning'):
+                self._states.pop(target_id, None)
+    
+    def open_state(self, target_id):
+        """目标处于熔断状态且未到探测时间时返回状态副本，否则返回 None"""
+        with self._lock:
+            state = self._states.get(target_id)
+            if state and time.time() < state['next_probe']:
+                return dict(state)
+            return None
+    
+    def reset(self, target_id):
+        """清除目标的熔断状态（目标配置修改或删除后调用）"""
+        with self._lock:
+            self._states.pop(target_id, None)
+    
+    def snapshot(self):
+        """当前所有处于熔断状态的目标 {target_id: 状态副本}"""
+        now = time.time()
+        with self._lock:
+            return {
+                tid: dict(state) for tid, state in self._states.items()
+                if now < state['next_probe']
+            }
+
+
+# 全局实例
+circuit_breaker = CircuitBreaker()
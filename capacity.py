@@ -0,0 +1,291 @@
+"""
+检查耗时统计与容量报告
+每次检查结束时把耗时计入 (目标, 小时) 的统计桶：次数、总耗时、最大值、超时次数和分桶直方图，
+每轮检查结束后把有变化的桶写入 check_stats 表。
+报告只汇总时间窗口内的小时桶，不扫描 monitor_data；分位数由直方图估算。
+统计从启用本功能后开始积累，不回填历史数据
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from database import get_db
+
+# 耗时直方图的分桶上限（秒），最后一个桶为无穷大
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 15, 30, 60)
+BUCKET_COUNT = len(DURATION_BUCKETS) + 1
+
+# 各类型检查所用客户端的超时时间（秒），耗时达到该值视为超时
+CHECK_TIMEOUTS = {
+    'application': 3,      # requests 超时
+    'database': 10,        # 数据库连接超时
+    'business': 10,
+    'server': 15,          # SSH 连接超时
+    'backup': 15
+}
+
+STATS_RETENTION_DAYS = 30   # check_stats 保留天数
+
+
+def hour_of(ts):
+    return int(ts) // 3600 * 3600
+
+
+class _Bucket:
+    """单个目标一小时内的统计"""
+    
+    __slots__ = ('count', 'total', 'max', 'timeouts', 'histogram', 'dirty')
+    
+    def __init__(self, count=0, total=0.0, peak=0.0, timeouts=0, histogram=None):
+        self.count = count
+        self.total = total
+        self.max = peak
+        self.timeouts = timeouts
+        self.histogram = histogram if histogram is not None else array('I', bytes(4 * BUCKET_COUNT))
+        self.dirty = False
+    
+    def add(self, duration, timed_out):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        if timed_out:
+            self.timeouts += 1
+        self.histogram[bisect_left(DURATION_BUCKETS, duration)] += 1
+        self.dirty = True
+    
+    def merge(self, other):
+        """合并另一个桶的统计"""
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.timeouts += other.timeouts
+        for index, count in enumerate(other.histogram):
+            self.histogram[index] += count
+        self.dirty = True
+
+
+def estimate_percentile(histogram, p):
+    """由分桶直方图估算分位数（桶内线性插值）"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = p / 100 * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            lower = DURATION_BUCKETS[index - 1] if index else 0.0
+            if index >= len(DURATION_BUCKETS):
+                return lower
+            upper = DURATION_BUCKETS[index]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return DURATION_BUCKETS[-1]
+
+
+class CheckStats:
+    """按小时累计各目标的检查耗时"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()     # 保证写入按顺序进行，数据库读写不持有 _lock
+        self._buckets = {}          # (target_id, hour) -> _Bucket，只保留当前小时
+        self._hour = None
+    
+    def _load_hour(self, hour):
+        """加载某小时已保存的统计（服务在小时中途重启时）"""
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute(
+            'SELECT target_id, count, total, max, timeouts, histogram FROM check_stats WHERE hour_ts = ?',
+            (hour,)
+        )
+        buckets = {}
+        for row in cursor.fetchall():
+            histogram = array('I')
+            histogram.frombytes(row['histogram'])
+            if len(histogram) != BUCKET_COUNT:
+                continue
+            buckets[(row['target_id'], hour)] = _Bucket(
+                row['count'], row['total'], row['max'], row['timeouts'], histogram
+            )
+        db.close()
+        return buckets
+    
+    def record(self, target_id, target_type, duration, ts=None):
+        """记录一次检查的耗时（秒）"""
+        hour = hour_of(ts if ts is not None else time.time())
+        timeout = CHECK_TIMEOUTS.get(target_type)
+        timed_out = timeout is not None and duration >= timeout
+        previous = None
+        with self._lock:
+            if hour != self._hour:
+                # 进入新的小时：在锁内换出上一小时的桶，读写数据库在锁外进行
+                previous = self._buckets
+                self._buckets = {}
+                self._hour = hour
+            bucket = self._buckets.get((target_id, hour))
+            if bucket is None:
+                bucket = self._buckets[(target_id, hour)] = _Bucket()
+            bucket.add(duration, timed_out)
+        if previous is not None:
+            self._rollover(previous, hour)
+    
+    def _rollover(self, previous, hour):
+        """写入上一小时未保存的桶，并合并本小时已保存的统计"""
+        # 持有写入锁直到合并完成，避免 save() 先用本小时不完整的统计覆盖已保存的记录
+        with self._write_lock:
+            self._write(self._snapshot(previous))
+            saved = self._load_hour(hour)
+            with self._lock:
+                if self._hour != hour:
+                    return
+                for key, bucket in saved.items():
+                    current = self._buckets.get(key)
+                    if current is None:
+                        self._buckets[key] = bucket
+                    else:
+                        current.merge(bucket)
+    
+    def save(self):
+        """把有变化的桶写入数据库（每轮检查结束后调用）"""
+        with self._write_lock:
+            with self._lock:
+                rows = self._snapshot(self._buckets)
+            self._write(rows)
+    
+    @staticmethod
+    def _snapshot(buckets):
+        """复制有变化的桶的数值（调用方持有锁或桶已换出）"""
+        rows = []
+        for (target_id, hour), bucket in buckets.items():
+            if not bucket.dirty:
+                continue
+            rows.append((
+                target_id, hour, bucket.count, bucket.total, bucket.max,
+                bucket.timeouts, bucket.histogram.tobytes()
+            ))
+            bucket.dirty = False
+        return rows
+    
+    def _write(self, rows):
+        if not rows:
+            return
+        db = get_db()
+        db.executemany(
+            'INSERT OR REPLACE INTO check_stats (target_id, hour_ts, count, total, max, timeouts, histogram) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            rows
+        )
+        db.execute('DELETE FROM check_stats WHERE hour_ts < ?', (hour_of(time.time()) - STATS_RETENTION_DAYS * 86400,))
+        db.commit()
+        db.close()
+    
+    def forget(self, target_id):
+        """丢弃目标的统计（目标删除后调用）"""
+        with self._lock:
+            for key in [key for key in self._buckets if key[0] == target_id]:
+                del self._buckets[key]
+        db = get_db()
+        db.execute('DELETE FROM check_stats WHERE target_id = ?', (target_id,))
+        db.commit()
+        db.close()
+    
+    def report(self, hours=24, workers=1, interval=60):
+        """生成慢目标与容量报告
+        
+        Args:
+            hours: 统计窗口（小时）
+            workers: 检查线程池的并发数
+            interval: 检查间隔（秒）
+        
+        Returns:
+            dict: {'targets': [...按 p95 降序], 'summary': {...}}
+        """
+        self.save()
+        since = hour_of(time.time()) - (hours - 1) * 3600
+        
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute('''
+            SELECT s.target_id, s.count, s.total, s.max, s.timeouts, s.histogram,
+                   t.name, t.type, t.enabled
+            FROM check_stats s
+            JOIN monitor_targets t ON s.target_id = t.id
+            WHERE s.hour_ts >= ?
+        ''', (since,))
+        rows = cursor.fetchall()
+        db.close()
+        
+        merged = {}
+        for row in rows:
+            item = merged.get(row['target_id'])
+            if item is None:
+                item = merged[row['target_id']] = {
+                    'target_id': row['target_id'], 'name': row['name'], 'type': row['type'],
+                    'enabled': row['enabled'], 'count': 0, 'total': 0.0, 'max': 0.0, 'timeouts': 0,
+                    'histogram': [0] * BUCKET_COUNT
+                }
+            item['count'] += row['count']
+            item['total'] += row['total']
+            item['max'] = max(item['max'], row['max'])
+            item['timeouts'] += row['timeouts']
+            histogram = array('I')
+            histogram.frombytes(row['histogram'])
+            for index, count in enumerate(histogram[:BUCKET_COUNT]):
+                item['histogram'][index] += count
+        
+        grand_total = sum(item['total'] for item in merged.values()) or 1
+        targets = []
+        cycle_mean = 0.0
+        cycle_p95 = 0.0
+        slowest_mean = 0.0
+        slowest_p95 = 0.0
+        for item in merged.values():
+            mean = item['total'] / item['count'] if item['count'] else 0
+            # 桶内插值的估算值不超过实际最大值
+            p50 = min(estimate_percentile(item['histogram'], 50) or 0, item['max'])
+            p95 = min(estimate_percentile(item['histogram'], 95) or 0, item['max'])
+            if item['enabled']:
+                # 每个启用的目标每轮执行一次，按平均耗时和 p95 估算每轮的工作量
+                cycle_mean += mean
+                cycle_p95 += p95
+                slowest_mean = max(slowest_mean, mean)
+                slowest_p95 = max(slowest_p95, p95)
+            targets.append({
+                'target_id': item['target_id'],
+                'name': item['name'],
+                'type': item['type'],
+                'enabled': bool(item['enabled']),
+                'count': item['count'],
+                'mean': round(mean, 3),
+                'p50': round(p50, 3),
+                'p95': round(p95, 3),
+                'max': round(item['max'], 3),
+                'timeout_rate': round(item['timeouts'] / item['count'], 4) if item['count'] else 0,
+                'share': round(item['total'] / grand_total, 4)
+            })
+        targets.sort(key=lambda item: item['p95'], reverse=True)
+        
+        workers = max(workers, 1)
+        # 并发执行时每轮耗时不低于总工作量/并发数，也不低于最慢的单个检查
+        predicted_mean = max(cycle_mean / workers, slowest_mean)
+        predicted_p95 = max(cycle_p95 / workers, slowest_p95)
+        return {
+            'targets': targets,
+            'summary': {
+                'hours': hours,
+                'targets': len(targets),
+                'checks': sum(item['count'] for item in targets),
+                'workers': workers,
+                'interval': interval,
+                'work_per_cycle': round(cycle_mean, 2),
+                'predicted_cycle': round(predicted_mean, 2),
+                'predicted_cycle_p95': round(predicted_p95, 2),
+                'utilization': round(predicted_mean / interval, 3) if interval else None
+            }
+        }
+
+
+# 全局实例
+check_stats = CheckStats()
@@ -16,5 +16,22 @@ class Config:
     DISK_THRESHOLD = 80  # 磁盘使用率阈值（%）
     STORAGE_THRESHOLD = 80  # 存储使用率阈值（%）
     
+    # 是否启用异常检测（可在系统配置页面修改）
+    ANOMALY_DETECTION = os.environ.get('ANOMALY_DETECTION') == '1'
+    
+    # 告警持续期间重复通知的间隔（秒）
+    ALERT_RENOTIFY_INTERVAL = 3600
+    
+    # 日志级别（DEBUG/INFO/WARNING/ERROR）
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    # 每个目标的检查成功日志每 N 条输出 1 条（1 表示全部输出）
+    LOG_SUCCESS_SAMPLE = int(os.environ.get('LOG_SUCCESS_SAMPLE') or 10)
+    
+    # 本地服务器后台采样间隔（秒），0 表示不启用；启用后每轮检查上报两次检查之间的最小/平均/最大/p95
+    LOCAL_SAMPLE_INTERVAL = float(os.environ.get('LOCAL_SAMPLE_INTERVAL') or 0)
+    
+    # /metrics 的访问令牌（Authorization: Bearer <令牌>），为空时只允许已登录用户访问
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or ''
+    
     # 企业微信配置
     WECHAT_WEBHOOK = os.environ.get('WECHAT_WEBHOOK') or ''
@@ -6,6 +6,12 @@
 from cryptography.fernet import Fernet
 import os
 import base64
+import hashlib
+import json
+import threading
+from monitor_log import get_logger
+
+logger = get_logger('crypto')
 
 class CryptoManager:
     """加密管理器"""
@@ -27,7 +33,7 @@ class CryptoManager:
             with open(self.key_file, 'rb') as f:
                 key = f.read()
             self.cipher = Fernet(key)
-            print(f"已加载加密密钥: {self.key_file}")
+            logger.info("已加载加密密钥: %s", self.key_file)
         else:
             # 生成新密钥
             key = Fernet.generate_key()
@@ -36,8 +42,8 @@ class CryptoManager:
             # 设置文件权限为只有所有者可读写
             os.chmod(self.key_file, 0o600)
             self.cipher = Fernet(key)
-            print(f"已生成新的加密密钥: {self.key_file}")
-            print("警告：请妥善保管密钥文件，丢失将无法解密已加密的数据！")
+            logger.info("已生成新的加密密钥: %s", self.key_file)
+            logger.warning("请妥善保管密钥文件，丢失将无法解密已加密的数据！")
     
     def encrypt(self, plaintext):
         """加密文本
@@ -60,7 +66,7 @@ class CryptoManager:
             encrypted_str = base64.b64encode(encrypted_bytes).decode('utf-8')
             return encrypted_str
         except Exception as e:
-            print(f"加密失败: {e}")
+            logger.error("加密失败: %s", e)
             return plaintext  # 加密失败时返回原文（向后兼容）
     
     def decrypt(self, encrypted_text):
@@ -75,6 +81,10 @@ class CryptoManager:
         if not encrypted_text:
             return ''
         
+        # 不是加密格式的旧数据直接返回原文，不做试探性解密
+        if not self.is_encrypted(encrypted_text):
+            return encrypted_text
+        
         try:
             # 从Base64字符串转换为字节
             encrypted_bytes = base64.b64decode(encrypted_text.encode('utf-8'))
@@ -85,12 +95,15 @@ class CryptoManager:
             return decrypted_str
         except Exception as e:
             # 解密失败，可能是未加密的旧数据
-            print(f"解密失败（可能是未加密的数据）: {e}")
+            logger.warning("解密失败（可能是未加密的数据）: %s", e)
             return encrypted_text  # 返回原文（向后兼容）
     
     def is_encrypted(self, text):
         """检查文本是否已加密
         
+        只检查格式（Base64 包装的 Fernet 令牌，版本字节为 0x80），不做试探性解密，
+        对明文不会产生“解密失败”日志
+        
         Args:
             text: 待检查的文本
             
@@ -101,12 +114,12 @@ class CryptoManager:
             return False
         
         try:
-            # 尝试Base64解码
-            base64.b64decode(text.encode('utf-8'))
-            # 尝试解密
-            self.decrypt(text)
-            return True
-        except:
+            # 外层 Base64 解码得到 Fernet 令牌
+            token = base64.b64decode(text.encode('utf-8'), validate=True)
+            # Fernet 令牌为 URL 安全的 Base64：版本(1) + 时间戳(8) + IV(16) + 密文(16的倍数) + HMAC(32)
+            raw = base64.urlsafe_b64decode(token)
+            return raw[0] == 0x80 and len(raw) >= 73 and (len(raw) - 57) % 16 == 0
+        except Exception:
             return False
 
 
@@ -189,6 +202,56 @@ def decrypt_config(config):
     return decrypted_config
 
 
+class ConfigCache:
+    """已解析、已解密的监控目标配置缓存
+    
+    以 目标ID + 配置内容哈希 为键，配置未变化时调度器每轮直接复用，
+    不再重复 json.loads 和 Fernet 解密。解密后的敏感信息只保存在内存中。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # target_id -> (配置哈希, 解密后的配置)
+    
+    def get(self, target_id, config_str):
+        """获取解密后的配置
+        
+        Args:
+            target_id: 监控目标ID
+            config_str: 数据库中保存的配置JSON字符串
+        
+        Returns:
+            dict: 解密后的配置（副本，调用方修改不会影响缓存）
+        """
+        config_hash = hashlib.sha256(config_str.encode('utf-8')).hexdigest()
+        
+        with self._lock:
+            entry = self._entries.get(target_id)
+        if entry and entry[0] == config_hash:
+            return dict(entry[1])
+        
+        config = decrypt_config(json.loads(config_str))
+        with self._lock:
+            self._entries[target_id] = (config_hash, config)
+        return dict(config)
+    
+    def invalidate(self, target_id=None):
+        """清除缓存（目标更新或删除时调用）
+        
+        Args:
+            target_id: 监控目标ID，为 None 时清除全部
+        """
+        with self._lock:
+            if target_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(target_id, None)
+
+
+# 全局配置缓存实例
+config_cache = ConfigCache()
+
+
 if __name__ == '__main__':
     # 测试加密功能
     manager = CryptoManager()
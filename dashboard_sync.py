@@ -0,0 +1,81 @@
+"""
+仪表板增量同步模块
+为 /api/dashboard-stats 维护全局版本号，记录每个监控目标最近一次变化时的版本，
+客户端携带上次看到的版本号即可只获取发生变化的目标以及已移除的目标ID
+"""
+
+import threading
+import time
+
+
+class DashboardSync:
+    """仪表板版本管理器"""
+    
+    def __init__(self, max_removed=1000):
+        """初始化版本管理器
+        
+        Args:
+            max_removed: 最多保留的已移除目标记录数，超出后更早的增量请求返回全量
+        """
+        self._lock = threading.Lock()
+        # 以启动时的毫秒时间戳作为起始版本，重启前的旧版本号一定小于它，会被识别为过期
+        self.version = int(time.time() * 1000)
+        self._base_version = self.version
+        self._max_removed = max_removed
+        self._fingerprints = {}  # target_id -> 指纹
+        self._changed_at = {}    # target_id -> 最近变化的版本
+        self._removed_at = {}    # target_id -> 移除时的版本
+    
+    def update(self, fingerprints):
+        """用最新快照更新版本
+        
+        Args:
+            fingerprints: {target_id: 指纹} 字典，指纹变化即视为目标状态变化
+        
+        Returns:
+            int: 当前版本号
+        """
+        with self._lock:
+            changed = [tid for tid, fp in fingerprints.items() if self._fingerprints.get(tid) != fp]
+            removed = [tid for tid in self._fingerprints if tid not in fingerprints]
+            
+            if not changed and not removed:
+                return self.version
+            
+            self.version += 1
+            for tid in changed:
+                self._fingerprints[tid] = fingerprints[tid]
+                self._changed_at[tid] = self.version
+                self._removed_at.pop(tid, None)
+            for tid in removed:
+                del self._fingerprints[tid]
+                del self._changed_at[tid]
+                self._removed_at[tid] = self.version
+            
+            # 限制已移除记录的数量（字典按插入顺序，先删除最早的）
+            while len(self._removed_at) > self._max_removed:
+                tid = next(iter(self._removed_at))
+                self._base_version = max(self._base_version, self._removed_at.pop(tid))
+            
+            return self.version
+    
+    def delta(self, since):
+        """计算自某版本以来的变化
+        
+        Args:
+            since: 客户端上次看到的版本号，None 表示首次请求
+        
+        Returns:
+            tuple: (是否全量, 变化的目标ID集合, 已移除的目标ID列表)
+        """
+        with self._lock:
+            if since is None or since < self._base_version or since > self.version:
+                return True, set(self._fingerprints), []
+            
+            changed = {tid for tid, v in self._changed_at.items() if v > since}
+            removed = sorted(tid for tid, v in self._removed_at.items() if v > since)
+            return False, changed, removed
+
+
+# 全局实例
+dashboard_sync = DashboardSync()
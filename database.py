@@ -1,5 +1,7 @@
 import sqlite3
+import time
 from config import Config
+from metrics import DB_WRITE_DURATION
 
 def init_db():
     conn = sqlite3.connect(Config.DATABASE)
@@ -39,10 +41,20 @@ def init_db():
             metric_value TEXT,
             status TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_ts INTEGER,
             FOREIGN KEY (target_id) REFERENCES monitor_targets(id)
         )
     ''')
     
+    # 旧数据库补充 epoch 时间戳列
+    migrate_epoch_timestamps(cursor)
+    
+    # 按目标查询最新数据的索引
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_monitor_data_target
+        ON monitor_data (target_id, id)
+    ''')
+    
     # 告警记录表
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS alerts (
@@ -52,10 +64,67 @@ def init_db():
             message TEXT,
             status TEXT DEFAULT 'pending',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen_ts INTEGER,
+            last_notified_ts INTEGER,
+            occurrences INTEGER DEFAULT 1,
+            resolved_at TIMESTAMP,
             FOREIGN KEY (target_id) REFERENCES monitor_targets(id)
         )
     ''')
     
+    # 旧数据库补充告警状态字段
+    migrate_alert_lifecycle(cursor)
+    
+    # 告警发件箱（待发送的通知消息，由后台投递线程发送）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alert_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            alert_id INTEGER,
+            title TEXT,
+            message TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_ts INTEGER,
+            last_error TEXT,
+            created_ts INTEGER,
+            sent_ts INTEGER,
+            FOREIGN KEY (alert_id) REFERENCES alerts(id)
+        )
+    ''')
+    # 旧数据库补充消息标题列（合并摘要时按标题区分告警/恢复）
+    cursor.execute('PRAGMA table_info(alert_outbox)')
+    if 'title' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE alert_outbox ADD COLUMN title TEXT')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_alert_outbox_pending
+        ON alert_outbox (status, next_attempt_ts)
+    ''')
+    
+    # 异常检测基线表（基线状态以二进制保存）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS anomaly_baselines (
+            target_id INTEGER,
+            metric TEXT,
+            state BLOB NOT NULL,
+            updated_ts INTEGER,
+            PRIMARY KEY (target_id, metric)
+        )
+    ''')
+    
+    # 检查耗时小时统计表（耗时分布直方图以二进制保存）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS check_stats (
+            target_id INTEGER,
+            hour_ts INTEGER,
+            count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            max REAL NOT NULL,
+            timeouts INTEGER NOT NULL,
+            histogram BLOB NOT NULL,
+            PRIMARY KEY (target_id, hour_ts)
+        )
+    ''')
+    
     # 系统配置表
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS system_config (
@@ -91,6 +160,73 @@ def init_db():
     conn.commit()
     conn.close()
 
+def migrate_epoch_timestamps(cursor):
+    """为 monitor_data 增加整数 epoch 时间戳列 created_ts
+    
+    - 旧数据库自动添加该列，并根据 created_at 回填历史数据（只在添加列时执行一次）
+    - 建立 (target_id, created_ts) 索引，时间范围查询变为整数比较
+    - 触发器为未写入 created_ts 的插入（如迁移脚本）自动补齐
+    """
+    cursor.execute('PRAGMA table_info(monitor_data)')
+    columns = [row[1] for row in cursor.fetchall()]
+    
+    if 'created_ts' not in columns:
+        print("正在为监控数据添加 epoch 时间戳列...")
+        cursor.execute('ALTER TABLE monitor_data ADD COLUMN created_ts INTEGER')
+        cursor.execute('''
+            UPDATE monitor_data
+            SET created_ts = CAST(strftime('%s', created_at) AS INTEGER)
+            WHERE created_ts IS NULL
+        ''')
+        print(f"已回填 {cursor.rowcount} 条监控数据的时间戳")
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_monitor_data_target_ts
+        ON monitor_data (target_id, created_ts)
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_monitor_data_created_ts
+        AFTER INSERT ON monitor_data
+        WHEN NEW.created_ts IS NULL
+        BEGIN
+            UPDATE monitor_data
+            SET created_ts = CAST(strftime('%s', NEW.created_at) AS INTEGER)
+            WHERE id = NEW.id;
+        END
+    ''')
+
+def migrate_alert_lifecycle(cursor):
+    """为 alerts 表增加告警状态跟踪字段
+    
+    旧版本每次检查都会新增一条 pending 告警，这些记录无法对应到持续中的故障，
+    添加字段时统一标记为已处理，仍在发生的故障会在下一轮检查时重新产生一条告警
+    """
+    cursor.execute('PRAGMA table_info(alerts)')
+    columns = [row[1] for row in cursor.fetchall()]
+    
+    if 'last_seen_ts' in columns:
+        return
+    
+    print("正在为告警记录添加状态跟踪字段...")
+    cursor.execute('ALTER TABLE alerts ADD COLUMN last_seen_ts INTEGER')
+    cursor.execute('ALTER TABLE alerts ADD COLUMN last_notified_ts INTEGER')
+    cursor.execute('ALTER TABLE alerts ADD COLUMN occurrences INTEGER DEFAULT 1')
+    cursor.execute('ALTER TABLE alerts ADD COLUMN resolved_at TIMESTAMP')
+    cursor.execute("UPDATE alerts SET status = 'resolved' WHERE status = 'pending'")
+    print(f"已将 {cursor.rowcount} 条旧告警标记为已处理")
+
+def insert_monitor_data(cursor, target_id, metric_type, metric_value, status):
+    """写入一条监控数据，created_at 和 created_ts 取同一时刻"""
+    now = int(time.time())
+    with DB_WRITE_DURATION.time(table='monitor_data'):
+        cursor.execute(
+            'INSERT INTO monitor_data (target_id, metric_type, metric_value, status, created_at, created_ts) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (target_id, metric_type, metric_value, status,
+             time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now)), now)
+        )
+
 def get_db():
     conn = sqlite3.connect(Config.DATABASE)
     conn.row_factory = sqlite3.Row
@@ -0,0 +1,103 @@
+"""
+监控目标依赖关系
+监控目标可以在配置中用 depends_on 声明所依赖的父目标，例如 应用 → 所在主机、业务指标 → 数据库。
+调度时父目标先执行，父目标不可用（error 或 unknown）时子目标不再探测，
+记为 unknown 状态且不发送告警，避免一次主机故障引发一连串告警和超时等待
+"""
+
+from crypto_utils import config_cache
+
+# 视为不可用的监控状态
+DOWN_STATUSES = ('error', 'unknown')
+
+
+def get_parent_id(config):
+    """读取配置中声明的父目标ID，未声明时返回 None"""
+    try:
+        parent_id = int(config.get('depends_on') or 0)
+    except (TypeError, ValueError):
+        return None
+    return parent_id or None
+
+
+def build_dependency_graph(parents, target_ids):
+    """根据父目标关系计算执行顺序
+    
+    Args:
+        parents: {target_id: 父目标ID或None}
+        target_ids: 本轮执行的目标ID列表（父目标不在其中时忽略该依赖）
+    
+    Returns:
+        tuple: (可以直接执行的目标ID列表, {父目标ID: [子目标ID, ...]})
+    """
+    id_set = set(target_ids)
+    valid = {
+        tid: parent for tid, parent in parents.items()
+        if parent in id_set and parent != tid
+    }
+    children = {}
+    for tid, parent in valid.items():
+        children.setdefault(parent, []).append(tid)
+    
+    roots = [tid for tid in target_ids if tid not in valid]
+    reachable = set()
+    
+    def mark(start):
+        stack = [start]
+        while stack:
+            tid = stack.pop()
+            reachable.add(tid)
+            stack.extend(children.get(tid, []))
+    
+    for tid in roots:
+        mark(tid)
+    
+    # 依赖形成环时环上的目标无法从根到达，忽略其依赖直接执行
+    for tid in target_ids:
+        if tid not in reachable:
+            children[valid[tid]].remove(tid)
+            roots.append(tid)
+            mark(tid)
+    
+    return roots, children
+
+
+def load_parents(cursor):
+    """读取所有监控目标的父目标关系"""
+    cursor.execute('SELECT id, config FROM monitor_targets')
+    return {
+        row['id']: get_parent_id(config_cache.get(row['id'], row['config']))
+        for row in cursor.fetchall()
+    }
+
+
+def validate_dependency(cursor, target_id, config):
+    """校验配置中的父目标（存在且不形成循环依赖）
+    
+    Args:
+        cursor: 数据库游标
+        target_id: 监控目标ID，新建目标时为 None
+        config: 新的监控目标配置
+    
+    Returns:
+        str: 错误信息，无错误时返回 None
+    """
+    parent_id = get_parent_id(config)
+    if parent_id is None:
+        return None
+    
+    parents = load_parents(cursor)
+    if parent_id not in parents:
+        return f'依赖的监控目标不存在: {parent_id}'
+    if target_id is None:
+        return None
+    
+    # 沿父目标链向上查找，回到自身即为循环依赖
+    seen = set()
+    current = parent_id
+    while current is not None and current not in seen:
+        if current == target_id:
+            return '不能形成循环依赖'
+        seen.add(current)
+        current = parents.get(current)
+    return None
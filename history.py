@@ -0,0 +1,304 @@
+"""
+历史数据查询模块
+按时间范围读取监控数据并在服务端降采样，图表无论时间跨度多长都只需传输固定数量的数据点
+- lttb: Largest-Triangle-Three-Buckets 算法，保留曲线形状，适合折线图
+- bucket: 按时间等分桶，返回每个桶的 最小/平均/最大 值
+返回结果带有游标（最新记录ID），客户端之后只需用 since 游标获取新增的数据点
+时间范围基于整数列 created_ts（epoch 秒）比较，返回的时间也是 epoch 秒，由浏览器格式化
+"""
+
+# 各监控类型默认返回的数值指标（metric_value 中的字段）
+DEFAULT_METRICS = {
+    'server': ['cpu', 'memory', 'disk'],
+    'storage': ['percent'],
+    'application': ['response_time'],
+    'database': ['execution_time'],
+    'business': ['value'],
+    'backup': ['total_count', 'total_size']
+}
+
+# 单次请求允许的最大数据点数
+MAX_POINTS = 5000
+
+
+def parse_metrics(metrics_arg, target_type):
+    """解析请求中的指标列表
+    
+    Args:
+        metrics_arg: 逗号分隔的指标名，为空时使用该类型的默认指标
+        target_type: 监控类型
+    
+    Returns:
+        list: 指标名列表（只保留字母、数字和下划线组成的名称）
+    """
+    if metrics_arg:
+        names = [m.strip() for m in metrics_arg.split(',')]
+    else:
+        names = DEFAULT_METRICS.get(target_type, ['execution_time'])
+    return [m for m in names if m and m.replace('_', '').isalnum()]
+
+
+def query_raw_series(cursor, target_id, metrics, start, end, max_id):
+    """读取时间范围内的原始数值序列
+    
+    指标值由 SQLite 的 json_extract 直接提取，不在 Python 中逐行解析 JSON
+    
+    Returns:
+        tuple: ({指标名: [(epoch, value), ...]}, 原始行数)，序列按时间升序，已过滤空值
+    """
+    columns = ', '.join(f'json_extract(metric_value, ?) AS m{i}' for i in range(len(metrics)))
+    cursor.execute(f'''
+        SELECT created_ts AS ts, {columns}
+        FROM monitor_data
+        WHERE target_id = ? AND created_ts >= ? AND created_ts <= ? AND id <= ?
+        ORDER BY id
+    ''', [f'$.{m}' for m in metrics] + [target_id, start, end, max_id])
+    rows = cursor.fetchall()
+    
+    series = {}
+    for i, metric in enumerate(metrics):
+        series[metric] = [
+            (row[0], row[i + 1]) for row in rows
+            if isinstance(row[i + 1], (int, float))
+        ]
+    return series, len(rows)
+
+
+def query_bucket_series(cursor, target_id, metrics, start, end, points, max_id):
+    """按时间等分桶聚合，每个桶返回 [epoch, min, avg, max]
+    
+    分桶和聚合都在 SQLite 中以一条 GROUP BY 语句完成
+    
+    Returns:
+        tuple: ({指标名: [[epoch, min, avg, max], ...]}, 原始行数)
+    """
+    width = max(1, (end - start) / points)
+    aggregates = ', '.join(
+        f'MIN(m{i}), AVG(m{i}), MAX(m{i})' for i in range(len(metrics))
+    )
+    extracts = ', '.join(f'json_extract(metric_value, ?) AS m{i}' for i in range(len(metrics)))
+    cursor.execute(f'''
+        SELECT CAST((ts - ?) / ? AS INTEGER) AS bucket, COUNT(*), {aggregates}
+        FROM (
+            SELECT created_ts AS ts, {extracts}
+            FROM monitor_data
+            WHERE target_id = ? AND created_ts >= ? AND created_ts <= ? AND id <= ?
+        )
+        GROUP BY bucket
+        ORDER BY bucket
+    ''', [start, width] + [f'$.{m}' for m in metrics]
+         + [target_id, start, end, max_id])
+    rows = cursor.fetchall()
+    
+    series = {metric: [] for metric in metrics}
+    raw_count = 0
+    for row in rows:
+        bucket_time = int(start + row[0] * width)
+        raw_count += row[1]
+        for i, metric in enumerate(metrics):
+            low, avg, high = row[2 + i * 3], row[3 + i * 3], row[4 + i * 3]
+            if avg is not None:
+                series[metric].append([bucket_time, low, round(avg, 2), high])
+    return series, raw_count
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets 降采样
+    
+    Args:
+        points: [(x, y), ...]，按 x 升序
+        threshold: 目标点数
+    
+    Returns:
+        list: 降采样后的 [[x, y], ...]，始终保留首尾两点
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return [list(p) for p in points]
+    
+    # 坐标拆成两个列表，每个桶用切片求和、求最大值，避免逐点索引元组
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    sampled = [list(points[0])]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    
+    for i in range(threshold - 2):
+        # 下一个桶的平均点
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_len = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / avg_len
+        avg_y = sum(ys[avg_start:avg_end]) / avg_len
+        
+        # 当前桶中与上一个选中点、下一个桶平均点构成三角形面积最大的点（面积相同时取最早的点）
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        dx = ax - avg_x
+        dy = avg_y - ay
+        areas = [
+            abs(dx * (y - ay) - (ax - x) * dy)
+            for x, y in zip(xs[range_start:range_end], ys[range_start:range_end])
+        ]
+        a = range_start + areas.index(max(areas))
+        sampled.append(list(points[a]))
+    
+    sampled.append(list(points[-1]))
+    return sampled
+
+
+def latest_cursor(cursor, target_id):
+    """获取监控目标最新一条记录的ID，作为增量查询的游标"""
+    cursor.execute('SELECT MAX(id) FROM monitor_data WHERE target_id = ?', (target_id,))
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def query_since(cursor, target_id, metrics, since_id, limit=MAX_POINTS):
+    """读取游标之后新增的原始数据点（不降采样）
+    
+    Args:
+        cursor: 数据库游标
+        target_id: 监控目标ID
+        metrics: 指标名列表
+        since_id: 上次返回的游标（记录ID）
+        limit: 最多返回的记录数
+    
+    Returns:
+        dict: 包含 series 和新游标的结果字典
+    """
+    columns = ', '.join(f'json_extract(metric_value, ?) AS m{i}' for i in range(len(metrics)))
+    cursor.execute(f'''
+        SELECT id, created_ts AS ts, {columns}
+        FROM monitor_data
+        WHERE target_id = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', [f'$.{m}' for m in metrics] + [target_id, since_id, limit])
+    rows = cursor.fetchall()
+    
+    series = {}
+    for i, metric in enumerate(metrics):
+        series[metric] = [
+            [row[1], row[i + 2]] for row in rows
+            if isinstance(row[i + 2], (int, float))
+        ]
+    return {
+        'mode': 'since',
+        'raw_count': len(rows),
+        'cursor': rows[-1][0] if rows else since_id,
+        'series': series
+    }
+
+
+def downsample_series(cursor, target_id, metrics, start, end, points, mode='lttb'):
+    """读取并降采样时间范围内的监控数据
+    
+    Args:
+        cursor: 数据库游标
+        target_id: 监控目标ID
+        metrics: 指标名列表
+        start: 起始时间（epoch 秒）
+        end: 结束时间（epoch 秒）
+        points: 目标数据点数
+        mode: lttb 或 bucket
+    
+    Returns:
+        dict: 包含 series 和游标的结果字典
+    """
+    points = max(3, min(points, MAX_POINTS))
+    # 先取游标并以它为上界，之后的增量查询既不会漏掉也不会重复降采样期间写入的数据
+    last_id = latest_cursor(cursor, target_id)
+    
+    if mode == 'bucket':
+        series, raw_count = query_bucket_series(cursor, target_id, metrics, start, end, points, last_id)
+        return {'mode': 'bucket', 'raw_count': raw_count, 'cursor': last_id, 'series': series}
+    
+    raw, raw_count = query_raw_series(cursor, target_id, metrics, start, end, last_id)
+    return {
+        'mode': 'lttb',
+        'raw_count': raw_count,
+        'cursor': last_id,
+        'series': {metric: lttb(values, points) for metric, values in raw.items()}
+    }
+
+
+def downsample_batch(cursor, target_metrics, start, end, points, mode='lttb'):
+    """批量读取多个监控目标的降采样序列
+    
+    所有目标的数据由一条 IN (...) 查询读取，再按目标分组降采样
+    
+    Args:
+        cursor: 数据库游标
+        target_metrics: {target_id: [指标名, ...]}
+        start: 起始时间（epoch 秒）
+        end: 结束时间（epoch 秒）
+        points: 每个序列的目标数据点数
+        mode: lttb 或 bucket
+    
+    Returns:
+        dict: {target_id: {'raw_count': 行数, 'series': {指标名: [...]}}}
+    """
+    points = max(3, min(points, MAX_POINTS))
+    target_ids = list(target_metrics)
+    metrics = sorted({m for names in target_metrics.values() for m in names})
+    results = {
+        tid: {'raw_count': 0, 'series': {m: [] for m in target_metrics[tid]}}
+        for tid in target_ids
+    }
+    if not target_ids or not metrics:
+        return results
+    
+    placeholders = ','.join('?' * len(target_ids))
+    extracts = ', '.join(f'json_extract(metric_value, ?) AS m{i}' for i in range(len(metrics)))
+    params = [f'$.{m}' for m in metrics] + target_ids + [start, end]
+    
+    if mode == 'bucket':
+        width = max(1, (end - start) / points)
+        aggregates = ', '.join(
+            f'MIN(m{i}), AVG(m{i}), MAX(m{i})' for i in range(len(metrics))
+        )
+        cursor.execute(f'''
+            SELECT target_id, CAST((ts - ?) / ? AS INTEGER) AS bucket, COUNT(*), {aggregates}
+            FROM (
+                SELECT target_id, created_ts AS ts, {extracts}
+                FROM monitor_data
+                WHERE target_id IN ({placeholders}) AND created_ts >= ? AND created_ts <= ?
+            )
+            GROUP BY target_id, bucket
+            ORDER BY target_id, bucket
+        ''', [start, width] + params)
+        
+        for row in cursor.fetchall():
+            result = results[row[0]]
+            bucket_time = int(start + row[1] * width)
+            result['raw_count'] += row[2]
+            for i, metric in enumerate(metrics):
+                if metric not in result['series']:
+                    continue
+                low, avg, high = row[3 + i * 3], row[4 + i * 3], row[5 + i * 3]
+                if avg is not None:
+                    result['series'][metric].append([bucket_time, low, round(avg, 2), high])
+        return results
+    
+    cursor.execute(f'''
+        SELECT target_id, created_ts AS ts, {extracts}
+        FROM monitor_data
+        WHERE target_id IN ({placeholders}) AND created_ts >= ? AND created_ts <= ?
+        ORDER BY target_id, id
+    ''', params)
+    
+    for row in cursor.fetchall():
+        result = results[row[0]]
+        result['raw_count'] += 1
+        for i, metric in enumerate(metrics):
+            value = row[i + 2]
+            if metric in result['series'] and isinstance(value, (int, float)):
+                result['series'][metric].append((row[1], value))
+    
+    for result in results.values():
+        result['series'] = {
+            metric: lttb(values, points) for metric, values in result['series'].items()
+        }
+    return results
@@ -0,0 +1,248 @@
+"""
+本地服务器指标采集
+一次采集本机的 CPU（总体、每核、steal、iowait）、内存和交换分区、所有挂载分区、网络和磁盘 IO 速率，以及关注进程的状态。
+- CPU 使用率和 IO 速率由本次与上次采集的计数器差值计算，计数器按监控目标分别保存在采集器中，
+  不依赖 psutil.cpu_percent(interval=0) 的全局状态（多个线程同时调用时互相干扰）；
+  多个本地目标的速率各自对应自己两次检查之间的区间
+- 分区列表很少变化，按 PARTITION_REFRESH 秒缓存
+- 关注的进程通过缓存的 pid 表查找，缓存的进程全部退出时才重新遍历进程列表；
+  进程信息用 oneshot() 一次读取
+"""
+
+import os
+import threading
+import time
+import psutil
+
+PARTITION_REFRESH = 300         # 分区列表缓存时间（秒）
+IGNORED_FSTYPES = {'squashfs', 'iso9660', 'overlay', 'tmpfs', 'devtmpfs'}
+
+
+def parse_process_names(value):
+    """进程名配置支持逗号分隔多个进程"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(name).strip() for name in value if str(name).strip()]
+    return [name.strip() for name in str(value).split(',') if name.strip()]
+
+
+def _rate(current, previous, elapsed):
+    """计数器增长速率（计数器回绕或重置时返回 None）"""
+    if previous is None or elapsed <= 0 or current < previous:
+        return None
+    return round((current - previous) / elapsed, 1)
+
+
+def _percent(part, total):
+    return round(part / total * 100, 1) if total > 0 else 0.0
+
+
+class _TargetState:
+    """单个监控目标上次采集的计数器"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cpu_times = None           # 上次采集的每核 CPU 时间
+        self.io = None                  # (时间, 网络计数器, 磁盘计数器)
+        self.procs = {}                 # 进程名 -> [psutil.Process]
+
+
+class LocalCollector:
+    """本机指标采集器（全局共享，计数器和 pid 表按目标保存，跨检查复用）"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}               # 目标ID -> _TargetState
+        self._partitions = []
+        self._partitions_ts = 0
+    
+    def _state(self, target_id):
+        with self._lock:
+            state = self._states.get(target_id)
+            if state is None:
+                state = self._states[target_id] = _TargetState()
+            return state
+    
+    def collect(self, target_id=None, disk_path='/', process_names=()):
+        """采集本机指标
+        
+        Args:
+            target_id: 监控目标ID，计数器按目标分别保存
+            disk_path: 作为 disk 指标的分区路径
+            process_names: 关注的进程名列表
+        
+        Returns:
+            dict: cpu/memory/disk/swap 等数值指标，以及 cpu_cores、partitions、processes 明细
+        """
+        state = self._state(target_id)
+        with state.lock:
+            result = self._collect_cpu(state)
+            result.update(self._collect_memory())
+            result.update(self._collect_disks(disk_path))
+            result.update(self._collect_io(state))
+            if process_names:
+                result.update(self._collect_processes(state, process_names))
+        return result
+    
+    def forget(self, target_id):
+        """丢弃目标的计数器（目标删除后调用）"""
+        with self._lock:
+            self._states.pop(target_id, None)
+    
+    def _collect_cpu(self, state):
+        current = psutil.cpu_times(percpu=True)
+        previous = state.cpu_times
+        state.cpu_times = current
+        if previous is None or len(previous) != len(current):
+            # 首次采集：没有上次的计数器，使用开机以来的平均值
+            previous = [None] * len(current)
+        
+        cores = []
+        totals = {'busy': 0.0, 'steal': 0.0, 'iowait': 0.0, 'all': 0.0}
+        for now, before in zip(current, previous):
+            delta = {
+                field: getattr(now, field) - (getattr(before, field) if before else 0)
+                for field in now._fields
+            }
+            # guest 时间已计入 user/nice，不重复统计
+            total = sum(value for field, value in delta.items() if field not in ('guest', 'guest_nice'))
+            idle = delta['idle'] + delta.get('iowait', 0)
+            cores.append(_percent(total - idle, total))
+            totals['busy'] += total - idle
+            totals['steal'] += delta.get('steal', 0)
+            totals['iowait'] += delta.get('iowait', 0)
+            totals['all'] += total
+        
+        return {
+            'cpu': _percent(totals['busy'], totals['all']),
+            'cpu_steal': _percent(totals['steal'], totals['all']),
+            'cpu_iowait': _percent(totals['iowait'], totals['all']),
+            'cpu_cores': cores,
+            'load1': round(os.getloadavg()[0], 2) if hasattr(os, 'getloadavg') else None
+        }
+    
+    def _collect_memory(self):
+        mem = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        return {
+            'memory': mem.percent,
+            'memory_total': mem.total,
+            'memory_available': mem.available,
+            'swap': swap.percent,
+            'swap_total': swap.total
+        }
+    
+    def _collect_disks(self, disk_path):
+        now = time.monotonic()
+        # 分区列表所有目标共享
+        with self._lock:
+            if now - self._partitions_ts >= PARTITION_REFRESH:
+                seen = set()
+                partitions = []
+                for part in psutil.disk_partitions(all=False):
+                    if part.fstype in IGNORED_FSTYPES or part.device in seen or part.mountpoint.startswith('/snap/'):
+                        continue
+                    seen.add(part.device)
+                    partitions.append((part.mountpoint, part.device, part.fstype))
+                self._partitions = partitions
+                self._partitions_ts = now
+            partitions = self._partitions
+        
+        usage = []
+        for mountpoint, device, fstype in partitions:
+            try:
+                disk = psutil.disk_usage(mountpoint)
+            except OSError:
+                # 分区已卸载或无权限，下次刷新分区列表时移除
+                continue
+            usage.append({
+                'mountpoint': mountpoint,
+                'device': device,
+                'fstype': fstype,
+                'total': disk.total,
+                'used': disk.used,
+                'percent': disk.percent
+            })
+        
+        disk = psutil.disk_usage(disk_path)
+        return {
+            'disk': disk.percent,
+            'disk_max': max([item['percent'] for item in usage] + [disk.percent]),
+            'partitions': usage
+        }
+    
+    def _collect_io(self, state):
+        now = time.monotonic()
+        net = psutil.net_io_counters(pernic=True)
+        net_sent = sum(counters.bytes_sent for nic, counters in net.items() if nic != 'lo')
+        net_recv = sum(counters.bytes_recv for nic, counters in net.items() if nic != 'lo')
+        disk = psutil.disk_io_counters()     # 容器内可能为 None
+        disk_counters = (disk.read_bytes, disk.write_bytes, disk.read_count, disk.write_count) if disk else None
+        
+        previous = state.io
+        state.io = (now, (net_sent, net_recv), disk_counters)
+        if previous is None:
+            return {}
+        
+        elapsed = now - previous[0]
+        result = {
+            'net_sent_rate': _rate(net_sent, previous[1][0], elapsed),
+            'net_recv_rate': _rate(net_recv, previous[1][1], elapsed)
+        }
+        if disk_counters and previous[2]:
+            result.update({
+                'disk_read_rate': _rate(disk_counters[0], previous[2][0], elapsed),
+                'disk_write_rate': _rate(disk_counters[1], previous[2][1], elapsed),
+                'disk_read_iops': _rate(disk_counters[2], previous[2][2], elapsed),
+                'disk_write_iops': _rate(disk_counters[3], previous[2][3], elapsed)
+            })
+        return result
+    
+    def _collect_processes(self, state, names):
+        # 缓存的进程全部退出的进程名需要重新查找
+        missing = []
+        for name in names:
+            alive = [proc for proc in state.procs.get(name, []) if proc.is_running()]
+            state.procs[name] = alive
+            if not alive:
+                missing.append(name)
+        if missing:
+            state.procs.update(self._rescan(missing))
+        
+        processes = {}
+        for name in names:
+            cpu = 0.0
+            rss = 0
+            count = 0
+            for proc in state.procs.get(name, []):
+                try:
+                    with proc.oneshot():
+                        # 复用缓存的 Process 对象，cpu_percent 为两次检查之间的平均值
+                        cpu += proc.cpu_percent()
+                        rss += proc.memory_info().rss
+                    count += 1
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+            processes[name] = {'running': count > 0, 'count': count, 'cpu': round(cpu, 1), 'rss': rss}
+        
+        missing_count = sum(1 for item in processes.values() if not item['running'])
+        return {
+            'processes': processes,
+            'process_running': missing_count == 0,
+            'process_missing': missing_count
+        }
+    
+    def _rescan(self, names):
+        """遍历一次进程列表，查找所有缺失的进程名，返回 {进程名: [psutil.Process]}"""
+        wanted = set(names)
+        found = {name: [] for name in names}
+        for proc in psutil.process_iter(['name']):
+            name = proc.info['name']
+            if name in wanted:
+                found[name].append(proc)
+        return found
+
+
+# 全局实例
+local_collector = LocalCollector()
@@ -0,0 +1,170 @@
+"""
+本地服务器高频采样
+后台线程每隔 LOCAL_SAMPLE_INTERVAL 秒读取一次本机 CPU、内存和 IO，写入定长数组实现的环形缓冲区。
+每轮检查时汇总该目标上次检查以来的采样（最小/平均/最大/p95），代替检查时刻的单点读数，
+短时的尖峰也能反映出来，检查本身不需要等待采样。
+"""
+
+import math
+import threading
+import time
+from array import array
+import psutil
+from monitor_log import get_logger
+
+BUFFER_SECONDS = 3600           # 环形缓冲区覆盖的时间（秒）
+
+# 采样的序列，汇总后以同名指标上报平均值，并附带 _min/_max/_p95
+SERIES = ('cpu', 'memory', 'net_sent_rate', 'net_recv_rate', 'disk_read_rate', 'disk_write_rate')
+
+logger = get_logger('sampler')
+
+
+class LocalSampler:
+    """后台采样线程和环形缓冲区"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.interval = None
+        self._capacity = 0
+        self._values = {}
+        self._next = 0                  # 下一个写入位置
+        self._count = 0
+        self._written = 0               # 启动以来写入的采样总数
+        self._published = {}            # 目标ID -> 上次汇总时的 _written
+    
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, interval):
+        """启动采样线程（重复调用无效）"""
+        if self.running:
+            return
+        self.interval = max(float(interval), 0.1)
+        self._capacity = max(int(BUFFER_SECONDS / self.interval), 1)
+        self._values = {name: array('d', bytes(8 * self._capacity)) for name in SERIES}
+        self._next = 0
+        self._count = 0
+        self._written = 0
+        self._published = {}
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='local-sampler', daemon=True)
+        self._thread.start()
+        logger.info("本地高频采样已启动，间隔 %.1f秒", self.interval)
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _run(self):
+        previous = None
+        while True:
+            try:
+                previous = self._sample(previous)
+            except Exception as e:
+                logger.error("本地采样失败: %s", e)
+            if self._stop.wait(self.interval):
+                return
+    
+    def _sample(self, previous):
+        """读取一次计数器，与上次读数的差值写入缓冲区，返回本次读数"""
+        now = time.monotonic()
+        cpu = psutil.cpu_times()
+        net = psutil.net_io_counters(pernic=True)
+        disk = psutil.disk_io_counters()
+        # guest 时间已计入 user/nice，不重复统计
+        total = sum(cpu) - getattr(cpu, 'guest', 0) - getattr(cpu, 'guest_nice', 0)
+        current = {
+            'ts': now,
+            'busy': total - cpu.idle - getattr(cpu, 'iowait', 0),
+            'total': total,
+            'net_sent': sum(counters.bytes_sent for nic, counters in net.items() if nic != 'lo'),
+            'net_recv': sum(counters.bytes_recv for nic, counters in net.items() if nic != 'lo'),
+            'disk_read': disk.read_bytes if disk else 0,
+            'disk_write': disk.write_bytes if disk else 0
+        }
+        memory = psutil.virtual_memory().percent
+        if previous is None:
+            return current
+        
+        elapsed = now - previous['ts']
+        total = current['total'] - previous['total']
+        
+        def rate(key):
+            delta = current[key] - previous[key]
+            # 计数器回绕或重置时本次不计
+            return delta / elapsed if delta >= 0 and elapsed > 0 else math.nan
+        
+        values = {
+            'cpu': max(current['busy'] - previous['busy'], 0) / total * 100 if total > 0 else math.nan,
+            'memory': memory,
+            'net_sent_rate': rate('net_sent'),
+            'net_recv_rate': rate('net_recv'),
+            'disk_read_rate': rate('disk_read'),
+            'disk_write_rate': rate('disk_write')
+        }
+        with self._lock:
+            index = self._next
+            for name in SERIES:
+                self._values[name][index] = values[name]
+            self._next = (index + 1) % self._capacity
+            self._count = min(self._count + 1, self._capacity)
+            self._written += 1
+        return current
+    
+    def _window(self, target_id):
+        """复制该目标上次汇总之后写入的采样（按时间顺序），首次汇总从采样启动时开始
+        
+        由写入位置和两次汇总之间写入的采样数直接算出切片，不遍历整个缓冲区
+        """
+        with self._lock:
+            since = self._published.get(target_id, 0)
+            self._published[target_id] = self._written
+            # 超出缓冲区容量的更早采样已被覆盖
+            new = min(self._written - since, self._count)
+            if new <= 0:
+                return {name: [] for name in SERIES}
+            start = (self._next - new) % self._capacity
+            end = start + new
+            if end <= self._capacity:
+                return {name: self._values[name][start:end].tolist() for name in SERIES}
+            end -= self._capacity
+            return {
+                name: self._values[name][start:].tolist() + self._values[name][:end].tolist()
+                for name in SERIES
+            }
+    
+    def publish(self, target_id):
+        """汇总该目标上次检查以来的采样
+        
+        Returns:
+            dict: 如 {'cpu': 平均值, 'cpu_min', 'cpu_max', 'cpu_p95', ..., 'samples': 采样数}，
+                  未启用或没有新采样时返回空字典
+        """
+        if not self.running:
+            return {}
+        window = self._window(target_id)
+        
+        result = {}
+        for name in SERIES:
+            values = sorted(value for value in window[name] if not math.isnan(value))
+            if not values:
+                continue
+            digits = 1 if name in ('cpu', 'memory') else 0
+            result[name] = round(sum(values) / len(values), digits)
+            result[f'{name}_min'] = round(values[0], digits)
+            result[f'{name}_max'] = round(values[-1], digits)
+            result[f'{name}_p95'] = round(values[min(int(len(values) * 0.95), len(values) - 1)], digits)
+        if result:
+            result['samples'] = len(window['cpu'])
+        return result
+    
+    def forget(self, target_id):
+        with self._lock:
+            self._published.pop(target_id, None)
+
+
+# 全局实例
+local_sampler = LocalSampler()
@@ -0,0 +1,269 @@
+"""
+监控系统自身的运行指标
+以 Prometheus 文本格式通过 /metrics 暴露，便于本地采集并对“监控落后”告警。
+指标保存在内存中，每个指标一把锁，只在更新一个数值时持有
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from monitor_log import get_logger
+
+logger = get_logger('metrics')
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 批量大小分桶（条）
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Registry:
+    """指标注册表"""
+    
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+    
+    def on_collect(self, func):
+        """注册采集回调，在导出前调用（用于更新线程池队列长度等即时值）"""
+        with self._lock:
+            self._collectors.append(func)
+        return func
+    
+    def expose(self):
+        """生成 Prometheus 文本格式"""
+        for func in list(self._collectors):
+            try:
+                func()
+            except Exception as e:
+                logger.error("指标采集回调失败: %s", e)
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = 'untyped'
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+    
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+    
+    def _header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def expose(self):
+        with self._lock:
+            items = list(self._values.items())
+        lines = self._header()
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Gauge(_Metric):
+    """可增可减的即时值"""
+    
+    kind = 'gauge'
+    
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+    
+    def remove(self, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+    
+    def expose(self):
+        with self._lock:
+            items = list(self._values.items())
+        lines = self._header()
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class _Timer:
+    """用单调时钟计时并写入直方图的上下文管理器"""
+    
+    __slots__ = ('histogram', 'labels', 'start')
+    
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """分桶直方图，每组标签保存 [各桶计数..., 总和, 总数]"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+    
+    def time(self, **labels):
+        """用法: with histogram.time(type='server'): ..."""
+        return _Timer(self, labels)
+    
+    def totals(self, **labels):
+        """返回一组标签的 (观测次数, 总和)"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return 0, 0.0
+            return sum(state[:-1]), state[-1]
+    
+    def remove(self, **labels):
+        """删除与给定标签匹配的所有序列（如已删除监控目标的耗时分布）"""
+        positions = [(self.labelnames.index(name), str(value)) for name, value in labels.items()]
+        with self._lock:
+            for key in [key for key in self._values if all(key[i] == v for i, v in positions)]:
+                del self._values[key]
+    
+    def expose(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = self._header()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+# ---- 调度 ----
+CYCLE_DURATION = Histogram(
+    'monitor_cycle_duration_seconds', '一轮监控检查的总耗时', ['trigger'],
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+)
+CHECK_DURATION = Histogram(
+    'monitor_check_duration_seconds', '按监控类型统计的单个目标检查耗时', ['type']
+)
+TARGET_CHECK_DURATION = Histogram(
+    'monitor_target_check_duration_seconds', '按监控目标统计的检查耗时', ['target_id', 'type']
+)
+CHECKS_TOTAL = Counter(
+    'monitor_checks_total', '检查次数（result: success/failure/unreachable/cached/skipped）', ['type', 'result']
+)
+LAST_CYCLE_TIMESTAMP = Gauge(
+    'monitor_last_cycle_timestamp_seconds', '最近一轮检查完成的时间', ['trigger']
+)
+EXECUTOR_QUEUE_DEPTH = Gauge('monitor_executor_queue_depth', '线程池中等待执行的任务数')
+EXECUTOR_THREADS = Gauge('monitor_executor_threads', '线程池已创建的线程数')
+EXECUTOR_ACTIVE = Gauge('monitor_executor_active_workers', '正在执行检查的线程数')
+SCHEDULER_START_LAG = Histogram(
+    'monitor_scheduler_start_lag_seconds', '定时检查实际开始时间与计划时间之差',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+)
+SCHEDULER_SKIPPED_RUNS = Counter(
+    'monitor_scheduler_skipped_runs_total', '未按计划执行的定时检查次数（reason: missed/coalesced/overlap）', ['reason']
+)
+SCHEDULER_BACKLOG = Gauge('monitor_scheduler_backlog', '定时检查到期时线程池中排队和执行中的检查数')
+WORKER_UTILIZATION = Gauge('monitor_worker_utilization', '最近一轮检查的线程池利用率（0-1）')
+
+# ---- 数据库写入 ----
+DB_WRITE_DURATION = Histogram(
+    'monitor_db_write_duration_seconds', 'SQLite 写入耗时', ['table']
+)
+DB_WRITE_BATCH_SIZE = Histogram(
+    'monitor_db_write_batch_size', '单次写入的行数', ['table'], buckets=SIZE_BUCKETS
+)
+
+# ---- 告警 ----
+ALERT_DISPATCH_DURATION = Histogram(
+    'monitor_alert_dispatch_duration_seconds', '企业微信 Webhook 请求耗时', ['result']
+)
+ALERT_DELIVERY_DELAY = Histogram(
+    'monitor_alert_delivery_delay_seconds', '告警从写入发件箱到发送成功的延迟',
+    buckets=(1, 5, 10, 30, 60, 120, 300, 900, 1800, 3600)
+)
+ALERT_BATCH_SIZE = Histogram(
+    'monitor_alert_batch_size', '每次投递合并的告警条数', buckets=SIZE_BUCKETS
+)
+
+# ---- 远程连接 ----
+SSH_CONNECTS = Counter('monitor_ssh_connects_total', 'SSH 连接次数', ['result'])
+SSH_CONNECT_DURATION = Histogram('monitor_ssh_connect_duration_seconds', 'SSH 连接（含认证）耗时')
+SSH_OPEN = Gauge('monitor_ssh_connections_open', '当前打开的 SSH 连接数')
+DB_CONNECTS = Counter('monitor_db_connects_total', '被监控数据库的连接次数', ['db_type', 'result'])
+DB_CONNECT_DURATION = Histogram('monitor_db_connect_duration_seconds', '被监控数据库的连接耗时', ['db_type'])
@@ -0,0 +1,134 @@
+"""
+结构化日志
+- 各模块通过 get_logger() 获取 monitor.* 日志器，target_id 等字段通过 extra 传入
+- 日志记录放入队列后立即返回，由后台线程输出到控制台并写入内存环形缓冲区，检查线程不会阻塞在 stdout 上
+- 每个目标的“检查完成”这类高频成功日志按 LOG_SUCCESS_SAMPLE 抽样，失败和告警日志全部保留
+- 环形缓冲区保留最近 LOG_BUFFER_SIZE 条，管理员可以按目标、级别和时间范围查询
+"""
+
+import atexit
+import logging
+import queue
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from config import Config
+
+LOG_BUFFER_SIZE = 5000          # 内存中保留的日志条数
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR
+}
+
+
+class SamplingFilter(logging.Filter):
+    """按 (日志器, 目标) 抽样带有 sample=True 标记的日志，每 rate 条保留 1 条"""
+    
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(int(rate), 1)
+        self._counts = {}
+        self._lock = threading.Lock()
+    
+    def filter(self, record):
+        if self.rate == 1 or not getattr(record, 'sample', False):
+            return True
+        key = (record.name, getattr(record, 'target_id', None))
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.rate:
+            return False
+        if count:
+            record.sampled = self.rate
+        return True
+
+
+class RingBufferHandler(logging.Handler):
+    """把日志以结构化字段保存在固定长度的环形缓冲区中"""
+    
+    def __init__(self, capacity=LOG_BUFFER_SIZE):
+        super().__init__()
+        self._records = deque(maxlen=capacity)
+        self._seq = 0
+    
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            self.handleError(record)
+            return
+        with self.lock:
+            self._seq += 1
+            self._records.append({
+                'id': self._seq,
+                'ts': round(record.created, 3),
+                'level': record.levelname,
+                'logger': record.name,
+                'target_id': getattr(record, 'target_id', None),
+                'message': message,
+                'sampled': getattr(record, 'sampled', None)
+            })
+    
+    def query(self, target_id=None, level=None, since=None, until=None, limit=200):
+        """查询日志（新的在前）
+        
+        Args:
+            target_id: 只返回该监控目标的日志
+            level: 最低日志级别名称，如 WARNING
+            since: 起始时间（epoch 秒）
+            until: 结束时间（epoch 秒）
+            limit: 最多返回的条数
+        
+        Returns:
+            list: 日志记录列表
+        """
+        min_level = LEVELS.get((level or '').upper(), 0)
+        with self.lock:
+            records = list(self._records)
+        
+        result = []
+        for item in reversed(records):
+            if since is not None and item['ts'] < since:
+                # 缓冲区按时间顺序追加，更早的记录都不满足条件
+                break
+            if until is not None and item['ts'] > until:
+                continue
+            if target_id is not None and item['target_id'] != target_id:
+                continue
+            if min_level and LEVELS.get(item['level'], 0) < min_level:
+                continue
+            result.append(item)
+            if len(result) >= limit:
+                break
+        return result
+
+
+log_buffer = RingBufferHandler()
+
+_root = logging.getLogger('monitor')
+_root.setLevel(LEVELS.get(Config.LOG_LEVEL.upper(), logging.INFO))
+_root.propagate = False
+
+_console = logging.StreamHandler()
+_console.setFormatter(logging.Formatter(LOG_FORMAT))
+
+# 调用方只把记录放入队列，格式化和输出由监听线程完成
+_queue = queue.SimpleQueue()
+_queue_handler = QueueHandler(_queue)
+_queue_handler.addFilter(SamplingFilter(Config.LOG_SUCCESS_SAMPLE))
+_root.addHandler(_queue_handler)
+
+_listener = QueueListener(_queue, _console, log_buffer, respect_handler_level=True)
+_listener.start()
+# 退出前输出队列中剩余的日志
+atexit.register(_listener.stop)
+
+
+def get_logger(name):
+    """获取模块日志器，如 get_logger('scheduler') 对应 monitor.scheduler"""
+    return logging.getLogger(f'monitor.{name}')
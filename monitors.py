@@ -2,43 +2,40 @@ import psutil
 import requests
 import pymysql
 import json
+import time
 from datetime import datetime
 from database import get_db
 from alerts import send_alert
 from remote_monitor import RemoteServerMonitor
+from local_collector import local_collector, parse_process_names
+from metrics import DB_CONNECTS, DB_CONNECT_DURATION
+from tracing import span, record
+
+def timed_connect(db_type, connect, **kwargs):
+    """建立数据库连接并记录连接次数和耗时"""
+    start = time.perf_counter()
+    try:
+        conn = connect(**kwargs)
+    except Exception:
+        DB_CONNECTS.inc(db_type=db_type, result='failure')
+        raise
+    finally:
+        record('connect', start)
+    DB_CONNECT_DURATION.observe(time.perf_counter() - start, db_type=db_type)
+    DB_CONNECTS.inc(db_type=db_type, result='success')
+    return conn
 
 class ServerMonitor:
     """服务器监控"""
     
     @staticmethod
-    def check_local_cpu():
-        # 使用非阻塞方式获取CPU使用率（更快但可能不太准确）
-        return psutil.cpu_percent(interval=0)
-    
-    @staticmethod
-    def check_local_memory():
-        mem = psutil.virtual_memory()
-        return mem.percent
-    
-    @staticmethod
-    def check_local_disk():
-        disk = psutil.disk_usage('/')
-        return disk.percent
-    
-    @staticmethod
-    def check_local_network():
-        net = psutil.net_io_counters()
-        return {
-            'bytes_sent': net.bytes_sent,
-            'bytes_recv': net.bytes_recv
-        }
-    
-    @staticmethod
-    def check_local_process(process_name):
-        for proc in psutil.process_iter(['name']):
-            if proc.info['name'] == process_name:
-                return True
-        return False
+    def check_local_server(config, target_id=None):
+        """一次采集本机 CPU、内存、分区、IO 和关注进程的指标"""
+        return local_collector.collect(
+            target_id=target_id,
+            disk_path=config.get('disk_path') or '/',
+            process_names=parse_process_names(config.get('process_name'))
+        )
     
     @staticmethod
     def check_remote_server(config):
@@ -91,7 +88,8 @@ class ApplicationMonitor:
     @staticmethod
     def check_http(url, timeout=3):
         try:
-            response = requests.get(url, timeout=timeout)
+            with span('request'):
+                response = requests.get(url, timeout=timeout)
             return {
                 'status': 'online' if response.status_code == 200 else 'error',
                 'status_code': response.status_code,
@@ -109,7 +107,8 @@ class DatabaseMonitor:
     @staticmethod
     def check_mysql(host, port, user, password, database=''):
         try:
-            conn = pymysql.connect(
+            conn = timed_connect(
+                'mysql', pymysql.connect,
                 host=host,
                 port=port,
                 user=user,
@@ -121,8 +120,9 @@ class DatabaseMonitor:
             )
             # 执行一个简单的查询来确认连接
             cursor = conn.cursor()
-            cursor.execute('SELECT 1')
-            cursor.fetchone()
+            with span('query'):
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
             cursor.close()
             conn.close()
             return {'status': 'online'}
@@ -138,7 +138,8 @@ class DatabaseMonitor:
             if not port or port == 0:
                 port = 1433
             
-            conn = pymssql.connect(
+            conn = timed_connect(
+                'sqlserver', pymssql.connect,
                 server=host,
                 port=int(port),
                 user=user,
@@ -150,8 +151,9 @@ class DatabaseMonitor:
             )
             # 执行一个简单的查询来确认连接
             cursor = conn.cursor()
-            cursor.execute('SELECT 1')
-            cursor.fetchone()
+            with span('query'):
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
             cursor.close()
             conn.close()
             return {'status': 'online'}
@@ -165,7 +167,8 @@ class DatabaseMonitor:
     @staticmethod
     def query_mysql(host, port, user, password, database, query):
         try:
-            conn = pymysql.connect(
+            conn = timed_connect(
+                'mysql', pymysql.connect,
                 host=host,
                 port=port,
                 user=user,
@@ -173,8 +176,9 @@ class DatabaseMonitor:
                 database=database
             )
             cursor = conn.cursor()
-            cursor.execute(query)
-            result = cursor.fetchall()
+            with span('query'):
+                cursor.execute(query)
+                result = cursor.fetchall()
             conn.close()
             return {'status': 'success', 'data': result}
         except Exception as e:
@@ -189,7 +193,8 @@ class DatabaseMonitor:
             if not port or port == 0:
                 port = 1433
             
-            conn = pymssql.connect(
+            conn = timed_connect(
+                'sqlserver', pymssql.connect,
                 server=host,
                 port=int(port),
                 user=user,
@@ -200,8 +205,9 @@ class DatabaseMonitor:
                 tds_version='7.0'  # 使用TDS 7.0协议，兼容性更好
             )
             cursor = conn.cursor()
-            cursor.execute(query)
-            result = cursor.fetchall()
+            with span('query'):
+                cursor.execute(query)
+                result = cursor.fetchall()
             conn.close()
             return {'status': 'success', 'data': result}
         except Exception as e:
@@ -243,6 +249,7 @@ class BusinessMonitor:
             return {'status': 'error', 'error': f'不支持的数据库类型: {db_type}'}
         
         if result['status'] == 'success':
+            parse_start = time.perf_counter()
             # 获取总行数
             row_count = len(result['data']) if result['data'] else 0
             
@@ -269,6 +276,7 @@ class BusinessMonitor:
             detail_data = None
             if alert and len(all_data) > 0:
                 detail_data = all_data
+            record('parse', parse_start)
             
             return {
                 'value': value,
@@ -0,0 +1,163 @@
+"""
+TCP 连通性预检
+在执行 SSH、MySQL、SQL Server 的完整握手之前，先用非阻塞 connect 并发探测所有目标端口，
+所有探测共用一个 selectors 事件循环，总耗时不超过 PREFLIGHT_TIMEOUT。
+只有确定不可达的目标（连接被拒绝、网络不可达、主机名无法解析）直接判定为离线并给出原因，
+不再占用工作线程等待完整握手超时；预检超时或其他错误时不下结论，照常执行完整检查
+（DNS 慢或链路延迟高时完整检查仍可能成功，不能据此告警和计入熔断）
+"""
+
+import errno
+import os
+import selectors
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+PREFLIGHT_TIMEOUT = 2   # 单轮预检的超时时间（秒）
+MAX_OPEN_SOCKETS = 64   # 同时进行的探测连接数上限
+
+# 主机名解析可能阻塞，放到独立线程中并发进行
+_resolver = ThreadPoolExecutor(max_workers=4)
+
+UNREACHABLE_ERRNOS = {
+    errno.EHOSTUNREACH, errno.ENETUNREACH,
+    getattr(errno, 'EHOSTDOWN', errno.EHOSTUNREACH),
+    getattr(errno, 'ENETDOWN', errno.ENETUNREACH)
+}
+
+# 可以确定目标不可达的预检结果，其余结果（timeout/error）交给完整检查判断
+DEFINITIVE_KINDS = {'refused', 'unreachable', 'unresolved'}
+
+REASONS = {
+    'refused': '连接被拒绝',
+    'timeout': '连接超时',
+    'unreachable': '网络不可达',
+    'unresolved': '无法解析主机名'
+}
+
+
+def get_endpoint(target_type, config):
+    """获取需要预检的 (主机, 端口)，本地检查、HTTP 检查或配置不完整时返回 None"""
+    if not config.get('host'):
+        return None
+    if target_type == 'server' and config.get('is_remote'):
+        default_port = 22
+    elif target_type == 'database':
+        default_port = 1433 if config.get('db_type', 'mysql').lower() == 'sqlserver' else 3306
+    elif target_type == 'backup':
+        default_port = 22
+    else:
+        return None
+    try:
+        return config['host'], int(config.get('port') or default_port)
+    except (TypeError, ValueError):
+        return None
+
+
+def _classify(code):
+    """把 connect 错误码归类"""
+    if code == errno.ECONNREFUSED:
+        return 'refused', REASONS['refused']
+    if code == errno.ETIMEDOUT:
+        return 'timeout', REASONS['timeout']
+    if code in UNREACHABLE_ERRNOS:
+        return 'unreachable', REASONS['unreachable']
+    return 'error', os.strerror(code)
+
+
+def _resolve(host, port):
+    return socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+
+
+def _start_connect(endpoint, address, selector, failures):
+    """发起非阻塞连接，立即失败的记录到 failures，进行中的注册到 selector"""
+    family, socktype, proto, _, sockaddr = address
+    sock = None
+    try:
+        sock = socket.socket(family, socktype, proto)
+        sock.setblocking(False)
+        code = sock.connect_ex(sockaddr)
+    except OSError as e:
+        # 文件描述符耗尽（EMFILE/ENOBUFS）、权限不足等，只影响该端点
+        if sock is not None:
+            sock.close()
+        failures[endpoint] = ('error', e.strerror or str(e))
+        return
+    if code in (0, errno.EISCONN):
+        sock.close()
+    elif code in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+        selector.register(sock, selectors.EVENT_WRITE, endpoint)
+    else:
+        sock.close()
+        failures[endpoint] = _classify(code)
+
+
+def probe_endpoints(endpoints, timeout=PREFLIGHT_TIMEOUT):
+    """并发探测多个 TCP 端口
+    
+    Args:
+        endpoints: {key: (主机, 端口)}
+        timeout: 总超时时间（秒）
+    
+    Returns:
+        dict: 确定不可达的端点 {key: (类型, 原因)}，类型为 refused/unreachable/unresolved
+    """
+    if not endpoints:
+        return {}
+    deadline = time.monotonic() + timeout
+    unique = set(endpoints.values())
+    failures = {}
+    
+    # 并发解析主机名（IP 地址会立即返回）
+    futures = {_resolver.submit(_resolve, host, port): (host, port) for host, port in unique}
+    done, not_done = wait(futures, timeout=timeout)
+    addresses = {}
+    for future in not_done:
+        failures[futures[future]] = ('timeout', REASONS['timeout'])
+    for future in done:
+        endpoint = futures[future]
+        try:
+            addresses[endpoint] = future.result()
+        except socket.gaierror:
+            failures[endpoint] = ('unresolved', REASONS['unresolved'])
+        except (OSError, ValueError) as e:
+            failures[endpoint] = ('error', str(e))
+    
+    # 同时打开的套接字数不超过 MAX_OPEN_SOCKETS，完成一个再发起下一个
+    queue = list(addresses.items())
+    selector = selectors.DefaultSelector()
+    try:
+        while queue or selector.get_map():
+            while queue and len(selector.get_map()) < MAX_OPEN_SOCKETS:
+                endpoint, address = queue.pop()
+                _start_connect(endpoint, address, selector, failures)
+            
+            if not selector.get_map():
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                sock = key.fileobj
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code:
+                    failures[key.data] = _classify(code)
+                selector.unregister(sock)
+                sock.close()
+        
+        # 超时仍未完成握手或未来得及发起的连接
+        for key in list(selector.get_map().values()):
+            failures[key.data] = ('timeout', REASONS['timeout'])
+            selector.unregister(key.fileobj)
+            key.fileobj.close()
+        for endpoint, _ in queue:
+            failures[endpoint] = ('timeout', REASONS['timeout'])
+    finally:
+        selector.close()
+    
+    return {
+        key: failures[endpoint]
+        for key, endpoint in endpoints.items()
+        if endpoint in failures and failures[endpoint][0] in DEFINITIVE_KINDS
+    }
@@ -0,0 +1,280 @@
+"""
+按需性能剖析
+管理员开启后，后台线程按固定间隔采样所有线程的调用栈（sys._current_frames），
+覆盖调度线程、检查线程池和 Web 请求线程，不需要修改被剖析的代码。
+两种模式：
+- cycles: 从下一轮监控检查开始，采样接下来的 N 轮
+- window: 立即开始，采样指定的秒数（用于剖析这段时间内的 Web 请求）
+采样达到轮数、时间窗口或 MAX_PROFILE_SECONDS 后自动停止，不同调用栈数超过 MAX_STACKS 后不再记录新的调用栈，
+开销和内存都有上限，可以在生产环境使用。
+结果包括热点函数、各线程最常见的调用栈，以及可用于 flamegraph.pl / speedscope 的折叠栈格式
+"""
+
+import os
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.01         # 默认采样间隔（秒）
+MIN_INTERVAL = 0.005            # 最小采样间隔（秒）
+MAX_PROFILE_SECONDS = 600       # 单次剖析的最长时间（含等待下一轮检查的时间）
+MAX_WINDOW_SECONDS = 300        # window 模式的最长时间
+MAX_CYCLES = 10                 # cycles 模式的最大轮数
+MAX_STACKS = 20000              # 最多记录的不同调用栈数
+MAX_DEPTH = 128                 # 单个调用栈最多记录的帧数
+
+# 线程阻塞等待时最内层的 Python 函数，默认不计入结果
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('socketserver.py', 'serve_forever'),
+    ('thread.py', '_worker'),
+    ('base.py', '_main_loop'),      # APScheduler 的调度线程
+    ('handlers.py', 'dequeue'),     # 日志输出线程
+    ('profiler.py', '_watchdog'),
+}
+
+
+class Profiler:
+    """采样式剖析器（全局只有一个剖析会话）"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = 'idle'        # idle / armed / running / done
+        self._options = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = {}           # (线程名, 调用栈) -> 采样次数
+        self._samples = 0
+        self._dropped = 0
+        self._cycles_left = 0
+        self._started = None
+        self._finished = None
+        self._deadline = 0
+        self._reason = None
+    
+    def start(self, mode='cycles', cycles=1, seconds=30, interval=DEFAULT_INTERVAL, include_idle=False):
+        """开启一次剖析
+        
+        Args:
+            mode: cycles（剖析接下来的 N 轮检查）或 window（立即开始，剖析 seconds 秒）
+            cycles: cycles 模式的轮数
+            seconds: window 模式的时长
+            interval: 采样间隔（秒）
+            include_idle: 是否记录阻塞等待中的线程
+        
+        Returns:
+            str: 错误信息，成功时返回 None
+        """
+        if mode not in ('cycles', 'window'):
+            return f'不支持的剖析模式: {mode}'
+        with self._lock:
+            if self._state in ('armed', 'running'):
+                return '已有进行中的剖析'
+            self._options = {
+                'mode': mode,
+                'cycles': min(max(int(cycles), 1), MAX_CYCLES),
+                'seconds': min(max(float(seconds), 1), MAX_WINDOW_SECONDS),
+                'interval': max(float(interval), MIN_INTERVAL),
+                'include_idle': bool(include_idle)
+            }
+            self._stacks = {}
+            self._samples = 0
+            self._dropped = 0
+            self._started = None
+            self._finished = None
+            self._reason = None
+            self._deadline = time.monotonic() + MAX_PROFILE_SECONDS
+            if mode == 'cycles':
+                # 等待下一轮检查开始后再采样
+                self._cycles_left = self._options['cycles']
+                self._state = 'armed'
+                threading.Thread(target=self._watchdog, name='profiler-watchdog', daemon=True).start()
+            else:
+                self._deadline = min(self._deadline, time.monotonic() + self._options['seconds'])
+                self._begin()
+        return None
+    
+    def stop(self, reason='手动停止'):
+        """停止剖析，保留已采集的结果"""
+        with self._lock:
+            if self._state == 'armed':
+                self._state = 'done'
+                self._reason = reason
+                self._finished = time.time()
+                return
+            if self._state != 'running':
+                return
+            self._reason = reason
+        self._stop.set()
+    
+    def cycle_started(self):
+        """一轮监控检查开始（由调度器调用）"""
+        if self._state != 'armed':
+            return
+        with self._lock:
+            if self._state == 'armed':
+                self._begin()
+    
+    def cycle_finished(self):
+        """一轮监控检查结束（由调度器调用）"""
+        if self._state != 'running' or self._options.get('mode') != 'cycles':
+            return
+        with self._lock:
+            self._cycles_left -= 1
+            if self._cycles_left > 0:
+                return
+            self._reason = f"已完成 {self._options['cycles']} 轮检查"
+        self._stop.set()
+    
+    def _begin(self):
+        """开始采样（调用方持有锁）"""
+        self._state = 'running'
+        self._started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+    
+    def _watchdog(self):
+        """armed 状态超过 MAX_PROFILE_SECONDS 仍未开始时自动取消"""
+        while self._state == 'armed':
+            if time.monotonic() >= self._deadline:
+                self.stop('等待检查开始超时')
+                return
+            time.sleep(1)
+    
+    def _run(self):
+        interval = self._options['interval']
+        include_idle = self._options['include_idle']
+        own_id = threading.get_ident()
+        names = {}
+        names_refreshed = 0
+        
+        while not self._stop.wait(interval):
+            now = time.monotonic()
+            if now >= self._deadline:
+                with self._lock:
+                    if not self._reason:
+                        self._reason = '时间窗口结束' if self._options['mode'] == 'window' else '达到时间上限'
+                break
+            # 线程名每秒刷新一次
+            if now - names_refreshed >= 1:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                names_refreshed = now
+            
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.reverse()
+                samples.append((names.get(thread_id, str(thread_id)), tuple(stack)))
+            # 不持有帧对象的引用，避免延长其局部变量的生命周期
+            frames = frame = None
+            
+            with self._lock:
+                for key in samples:
+                    count = self._stacks.get(key)
+                    if count is not None:
+                        self._stacks[key] = count + 1
+                    elif len(self._stacks) < MAX_STACKS:
+                        self._stacks[key] = 1
+                    else:
+                        self._dropped += 1
+                self._samples += 1
+        
+        with self._lock:
+            self._state = 'done'
+            self._finished = time.time()
+    
+    def status(self):
+        """剖析状态"""
+        with self._lock:
+            return {
+                'state': self._state,
+                'options': dict(self._options),
+                'started': self._started,
+                'finished': self._finished,
+                'samples': self._samples,
+                'stacks': len(self._stacks),
+                'dropped': self._dropped,
+                'reason': self._reason
+            }
+    
+    def report(self, top=50, stacks_per_thread=5):
+        """汇总采样结果
+        
+        Returns:
+            dict: {'status', 'hot_functions': [...], 'threads': {线程名: {...}}}
+        """
+        with self._lock:
+            stacks = list(self._stacks.items())
+        total = sum(count for _, count in stacks) or 1
+        
+        self_counts = {}
+        total_counts = {}
+        threads = {}
+        for (thread_name, stack), count in stacks:
+            if stack:
+                leaf = stack[-1]
+                self_counts[leaf] = self_counts.get(leaf, 0) + count
+            for frame in set(stack):
+                total_counts[frame] = total_counts.get(frame, 0) + count
+            info = threads.setdefault(thread_name, {'samples': 0, 'stacks': []})
+            info['samples'] += count
+            info['stacks'].append((count, stack))
+        
+        hot = sorted(total_counts, key=lambda frame: (self_counts.get(frame, 0), total_counts[frame]), reverse=True)
+        hot_functions = [
+            {
+                'function': _format_frame(frame),
+                'self': self_counts.get(frame, 0),
+                'self_percent': round(self_counts.get(frame, 0) / total * 100, 1),
+                'total': total_counts[frame],
+                'total_percent': round(total_counts[frame] / total * 100, 1)
+            }
+            for frame in hot[:top]
+        ]
+        
+        thread_report = {}
+        for thread_name, info in sorted(threads.items(), key=lambda item: -item[1]['samples']):
+            info['stacks'].sort(key=lambda item: -item[0])
+            thread_report[thread_name] = {
+                'samples': info['samples'],
+                'top_stacks': [
+                    {'count': count, 'stack': [_format_frame(frame) for frame in stack]}
+                    for count, stack in info['stacks'][:stacks_per_thread]
+                ]
+            }
+        
+        return {'status': self.status(), 'hot_functions': hot_functions, 'threads': thread_report}
+    
+    def collapsed(self):
+        """折叠栈格式（每行: 线程;外层函数;...;内层函数 次数）"""
+        with self._lock:
+            stacks = list(self._stacks.items())
+        lines = []
+        for (thread_name, stack), count in stacks:
+            frames = [thread_name.replace(';', '_').replace(' ', '_')]
+            frames.extend(_format_frame(frame).replace(';', '_').replace(' ', '_') for frame in stack)
+            lines.append(f"{';'.join(frames)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_frame(frame):
+    filename, lineno, name = frame
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+# 全局实例
+profiler = Profiler()
@@ -1,5 +1,11 @@
 import paramiko
 import json
+import time
+from metrics import SSH_CONNECTS, SSH_CONNECT_DURATION, SSH_OPEN
+from tracing import span, record
+from monitor_log import get_logger
+
+logger = get_logger('remote')
 
 class RemoteServerMonitor:
     """远程服务器监控"""
@@ -11,9 +17,11 @@ class RemoteServerMonitor:
         self.password = password
         self.key_file = key_file
         self.client = None
+        self._open = False
     
     def connect(self):
         """建立SSH连接"""
+        start = time.perf_counter()
         try:
             self.client = paramiko.SSHClient()
             self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -38,22 +46,33 @@ class RemoteServerMonitor:
                     banner_timeout=10,  # Banner读取超时10秒
                     auth_timeout=30  # 认证超时30秒
                 )
+            SSH_CONNECT_DURATION.observe(time.perf_counter() - start)
+            SSH_CONNECTS.inc(result='success')
+            SSH_OPEN.inc()
+            self._open = True
             return True
         except Exception as e:
-            print(f"SSH连接失败 [{self.host}]: {e}")
+            SSH_CONNECTS.inc(result='failure')
+            logger.warning("SSH连接失败 [%s]: %s", self.host, e)
             return False
+        finally:
+            record('connect', start)
     
     def disconnect(self):
         """断开SSH连接"""
         if self.client:
             self.client.close()
+        if self._open:
+            SSH_OPEN.dec()
+            self._open = False
     
     def execute_command(self, command, timeout=5):
         """执行远程命令"""
         try:
-            stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
-            output = stdout.read().decode('utf-8').strip()
-            error = stderr.read().decode('utf-8').strip()
+            with span('command'):
+                stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
+                output = stdout.read().decode('utf-8').strip()
+                error = stderr.read().decode('utf-8').strip()
             
             if error:
                 return {'success': False, 'error': error}
@@ -154,6 +173,7 @@ class RemoteServerMonitor:
                     'total_size': 0
                 }
             
+            parse_start = time.perf_counter()
             files = []
             total_size = 0
             
@@ -178,8 +198,9 @@ class RemoteServerMonitor:
                             })
                             total_size += size
                     except Exception as e:
-                        print(f"解析文件信息失败: {line}, 错误: {e}")
+                        logger.warning("解析文件信息失败: %s, 错误: %s", line, e)
                         continue
+            record('parse', parse_start)
             
             return {
                 'success': True,
@@ -0,0 +1,172 @@
+"""
+内存环形缓冲区
+监控数值按 (时间戳, 数值) 写入 array('d') 实现的环形缓冲区，不保存字典或元组列表；
+告警规则的滑动窗口是缓冲区上的视图，维护累加和与单调队列，
+推入新值和读取 平均/最小/最大 值都是 O(1)（均摊），不需要查询历史数据
+"""
+
+from array import array
+from collections import deque
+
+INITIAL_TIME_CAPACITY = 64   # 含时间窗口的缓冲区初始容量（不够时按倍数扩容）
+MAX_BUFFER_SAMPLES = 4096    # 单个指标缓冲区的最大容量
+
+
+class SampleBuffer:
+    """单个指标的数值环形缓冲区
+    
+    写入位置用单调递增的序号表示，序号对容量取模即为数组下标
+    """
+    
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.head = 0  # 下一个写入的序号
+        self._ts = array('d', bytes(8 * capacity))
+        self._values = array('d', bytes(8 * capacity))
+    
+    def push(self, ts, value):
+        """写入一个数值，返回其序号"""
+        seq = self.head
+        i = seq % self.capacity
+        self._ts[i] = ts
+        self._values[i] = value
+        self.head = seq + 1
+        return seq
+    
+    def ts(self, seq):
+        return self._ts[seq % self.capacity]
+    
+    def value(self, seq):
+        return self._values[seq % self.capacity]
+    
+    def grow(self, oldest, capacity):
+        """扩容并保留序号 oldest 之后的数据"""
+        ts = array('d', bytes(8 * capacity))
+        values = array('d', bytes(8 * capacity))
+        for seq in range(oldest, self.head):
+            ts[seq % capacity] = self._ts[seq % self.capacity]
+            values[seq % capacity] = self._values[seq % self.capacity]
+        self._ts = ts
+        self._values = values
+        self.capacity = capacity
+
+
+class WindowView:
+    """缓冲区上的滑动窗口（按样本数或按时间长度）"""
+    
+    def __init__(self, buffer, size=None, duration=None):
+        self.buffer = buffer
+        self.size = size
+        self.duration = duration
+        self.start = buffer.head  # 窗口内最早样本的序号
+        self._total = 0.0
+        self._mins = deque()      # 序号，对应数值单调递增，队首为窗口最小值
+        self._maxs = deque()      # 序号，对应数值单调递减，队首为窗口最大值
+    
+    def __len__(self):
+        return self.buffer.head - self.start
+    
+    def expire(self, now):
+        """写入新样本前移出即将超出窗口的旧样本"""
+        buffer = self.buffer
+        if self.size is not None:
+            self.drop_until(buffer.head - self.size + 1)
+        if self.duration is not None:
+            cutoff = now - self.duration
+            seq = self.start
+            while seq < buffer.head and buffer.ts(seq) <= cutoff:
+                seq += 1
+            self.drop_until(seq)
+    
+    def drop_until(self, seq):
+        """移出序号小于 seq 的样本"""
+        buffer = self.buffer
+        while self.start < seq:
+            self._total -= buffer.value(self.start)
+            if self._mins and self._mins[0] == self.start:
+                self._mins.popleft()
+            if self._maxs and self._maxs[0] == self.start:
+                self._maxs.popleft()
+            self.start += 1
+    
+    def add(self, seq):
+        """把刚写入缓冲区的样本加入窗口"""
+        value_of = self.buffer.value
+        value = value_of(seq)
+        self._total += value
+        while self._mins and value_of(self._mins[-1]) > value:
+            self._mins.pop()
+        self._mins.append(seq)
+        while self._maxs and value_of(self._maxs[-1]) < value:
+            self._maxs.pop()
+        self._maxs.append(seq)
+    
+    def avg(self):
+        return self._total / len(self)
+    
+    def min(self):
+        return self.buffer.value(self._mins[0])
+    
+    def max(self):
+        return self.buffer.value(self._maxs[0])
+
+
+class MetricSeries:
+    """一个监控目标的一个指标：共享的环形缓冲区和其上的多个窗口
+    
+    Args:
+        specs: 窗口定义集合，('n', 样本数) 或 ('s', 秒数)
+    """
+    
+    def __init__(self, specs):
+        sizes = [n for kind, n in specs if kind == 'n']
+        if any(kind == 's' for kind, _ in specs):
+            sizes.append(INITIAL_TIME_CAPACITY)
+        self.buffer = SampleBuffer(min(max(sizes or [1]), MAX_BUFFER_SAMPLES))
+        self.views = {}
+        for kind, n in specs:
+            if kind == 'n':
+                self.views[(kind, n)] = WindowView(self.buffer, size=min(n, MAX_BUFFER_SAMPLES))
+            else:
+                self.views[(kind, n)] = WindowView(self.buffer, duration=n)
+    
+    def push(self, ts, value):
+        """写入一个样本并更新所有窗口"""
+        buffer = self.buffer
+        views = self.views.values()
+        for view in views:
+            view.expire(ts)
+        
+        # 缓冲区已满且最早的样本仍在某个时间窗口内：扩容，达到上限后丢弃最早的样本
+        oldest = min(view.start for view in views)
+        if buffer.head - oldest >= buffer.capacity:
+            if buffer.capacity < MAX_BUFFER_SAMPLES:
+                buffer.grow(oldest, min(buffer.capacity * 2, MAX_BUFFER_SAMPLES))
+            else:
+                for view in views:
+                    view.drop_until(buffer.head - buffer.capacity + 1)
+        
+        seq = buffer.push(ts, value)
+        for view in views:
+            view.add(seq)
+
+
+class HitCounter:
+    """最近 M 次判断中满足条件的次数（bytearray 环形存储）"""
+    
+    __slots__ = ('size', 'hits', '_bits', '_pos')
+    
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self._bits = bytearray(size)
+        self._pos = 0
+    
+    def push(self, hit):
+        """记录一次判断结果，返回最近 M 次中满足条件的次数"""
+        hit = 1 if hit else 0
+        pos = self._pos
+        self.hits += hit - self._bits[pos]
+        self._bits[pos] = hit
+        self._pos = (pos + 1) % self.size
+        return self.hits
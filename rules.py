@@ -0,0 +1,384 @@
+"""
+告警规则引擎
+规则以文本配置，每行一条，例如：
+    cpu > 80
+    avg(cpu, 5m) > 90 for 3 cycles
+    avg(cpu, 10) > 80                 最近10个样本的平均值
+    cpu > 90 for 3 of 5 samples       最近5次检查中有3次满足
+    max(response_time, 10m) >= 2
+规则在首次使用时解析一次并编译为求值对象，之后每次检查只需把数值推入内存中的
+环形缓冲区（见 ringbuffer.py）并比较阈值，不再查询历史数据，也不再在检查函数中硬编码阈值判断
+规则来源（后一层覆盖前一层中相同告警类型的规则）：
+- 默认规则：按监控类型由阈值生成（系统配置中的阈值优先于 Config 中的默认值）
+- 分组规则：系统配置 alert_rules，每行 "监控类型: 规则"
+- 目标规则：监控目标配置中的 alert_rules，每行一条规则
+"""
+
+import operator
+import re
+import threading
+import time
+from functools import lru_cache
+from config import Config
+from database import get_db
+from monitor_log import get_logger
+from ringbuffer import MetricSeries, HitCounter, MAX_BUFFER_SAMPLES
+
+RULES_CACHE_TTL = 60  # 分组规则和阈值配置的缓存时间（秒）
+
+logger = get_logger('rules')
+
+RULE_PATTERN = re.compile(r'''
+    ^\s*
+    (?:
+        (?P<func>avg|min|max|last)\s*\(\s*(?P<func_metric>\w+)\s*
+        (?:,\s*(?P<window>\d+)\s*(?P<unit>[smh])?)?\s*\)
+        |
+        (?P<metric>\w+)
+    )
+    \s*(?P<op>>=|<=|==|!=|>|<)\s*
+    (?P<threshold>-?\d+(?:\.\d+)?)
+    (?:\s+for\s+(?P<need>\d+)(?:\s+of\s+(?P<of>\d+))?\s+(?:cycles?|samples?))?
+    \s*$
+''', re.VERBOSE | re.IGNORECASE)
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne
+}
+
+UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600}
+
+# 默认规则，阈值从系统配置（cpu_threshold 等）或 Config 中读取
+DEFAULT_RULES = {
+    'server': [
+        ('cpu_threshold', 'cpu > {}'),
+        ('memory_threshold', 'memory > {}'),
+        ('disk_threshold', 'disk > {}')
+    ],
+    'storage': [
+        ('storage_threshold', 'percent > {}')
+    ]
+}
+
+DEFAULT_THRESHOLDS = {
+    'cpu_threshold': Config.CPU_THRESHOLD,
+    'memory_threshold': Config.MEMORY_THRESHOLD,
+    'disk_threshold': Config.DISK_THRESHOLD,
+    'storage_threshold': Config.STORAGE_THRESHOLD
+}
+
+# 指标对应的告警类型（未列出的指标以指标名作为告警类型）
+ALERT_TYPES = {
+    'percent': 'storage'
+}
+
+# 告警消息中的指标名称和单位
+METRIC_LABELS = {
+    'cpu': ('CPU使用率', '%'),
+    'memory': ('内存使用率', '%'),
+    'disk': ('磁盘使用率', '%'),
+    'disk_max': ('分区最高使用率', '%'),
+    'swap': ('交换分区使用率', '%'),
+    'cpu_steal': ('CPU steal', '%'),
+    'cpu_iowait': ('CPU iowait', '%'),
+    'process_missing': ('未运行的进程数', '个'),
+    'cpu_max': ('CPU峰值使用率', '%'),
+    'cpu_p95': ('CPU使用率p95', '%'),
+    'memory_max': ('内存峰值使用率', '%'),
+    'percent': ('存储使用率', '%'),
+    'response_time': ('响应时间', '秒'),
+    'execution_time': ('执行时间', '秒'),
+    'value': ('业务指标值', ''),
+    'total_count': ('备份文件数', '个'),
+    'total_size': ('备份大小', '字节')
+}
+
+
+class RuleError(ValueError):
+    """规则语法错误"""
+
+
+class Rule:
+    """编译后的告警规则"""
+    
+    def __init__(self, text, func, metric, window, op, threshold, need, of):
+        self.text = text
+        self.func = func
+        self.metric = metric
+        self.window = window  # ('n', 样本数) 或 ('s', 秒数)，最新值规则为 None
+        self.op = op
+        self.threshold = threshold
+        self.need = need      # 最近 of 次判断中至少 need 次满足才触发
+        self.of = of
+        self.alert_type = ALERT_TYPES.get(metric, metric)
+        self.compare = OPERATORS[op]
+        # 窗口聚合规则直接绑定窗口的方法名，求值时不再判断函数类型
+        self.aggregate = None if func == 'last' else func
+    
+    def value(self, sample, series):
+        """计算规则比较的数值（最新值或窗口聚合值）"""
+        if self.aggregate is None:
+            return sample
+        return getattr(series[self.metric].views[self.window], self.aggregate)()
+    
+    def message(self, value, hits=1):
+        """生成告警消息（hits 为最近 of 次判断中满足条件的次数）"""
+        label, unit = METRIC_LABELS.get(self.metric, (self.metric, ''))
+        if self.op in ('>', '>='):
+            state = '过高'
+        elif self.op in ('<', '<='):
+            state = '过低'
+        else:
+            state = '异常'
+        text = f"{label}{state}: {round(value, 2)}{unit}"
+        if self.of > 1:
+            text += f"，最近{self.of}次检查中{hits}次满足条件"
+        if self.aggregate is not None or self.of > 1:
+            text += f"（规则: {self.text}）"
+        return text
+
+
+@lru_cache(maxsize=4096)
+def compile_rule(text):
+    """解析并编译一条规则（相同文本的规则只解析一次）
+    
+    Raises:
+        RuleError: 规则语法错误
+    """
+    match = RULE_PATTERN.match(text)
+    if not match:
+        raise RuleError(f"无法解析规则: {text}")
+    
+    func = (match.group('func') or 'last').lower()
+    metric = match.group('func_metric') or match.group('metric')
+    window = None
+    if func != 'last':
+        if not match.group('window'):
+            raise RuleError(f"{func} 需要指定窗口，例如 {func}({metric}, 5m) 或 {func}({metric}, 10): {text}")
+        size = int(match.group('window'))
+        if match.group('unit'):
+            window = ('s', size * UNIT_SECONDS[match.group('unit').lower()])
+        else:
+            window = ('n', size)
+        if size <= 0 or (window[0] == 'n' and size > MAX_BUFFER_SAMPLES):
+            raise RuleError(f"窗口大小必须在 1 到 {MAX_BUFFER_SAMPLES} 之间: {text}")
+    
+    need = int(match.group('need') or 1)
+    of = int(match.group('of') or need)
+    if need < 1 or of < need or of > MAX_BUFFER_SAMPLES:
+        raise RuleError(f"持续条件无效（需满足 1 <= N <= M）: {text}")
+    
+    return Rule(
+        ' '.join(text.split()), func, metric, window,
+        match.group('op'), float(match.group('threshold')), need, of
+    )
+
+
+def parse_rule_lines(text, grouped=False):
+    """解析多行规则文本（空行和 # 开头的注释行忽略）
+    
+    Args:
+        text: 规则文本
+        grouped: 是否为分组规则（每行以 "监控类型:" 开头）
+    
+    Returns:
+        list: grouped 为 False 时返回 [Rule, ...]，否则返回 [(监控类型, Rule), ...]
+    
+    Raises:
+        RuleError: 任意一行语法错误
+    """
+    result = []
+    for line in (text or '').splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if grouped:
+            group, sep, rule_text = line.partition(':')
+            if not sep or not group.strip():
+                raise RuleError(f"分组规则需要以监控类型开头，例如 server: cpu > 90: {line}")
+            result.append((group.strip(), compile_rule(rule_text.strip())))
+        else:
+            result.append(compile_rule(line))
+    return result
+
+
+class RuleSet:
+    """一个监控目标生效的全部规则"""
+    
+    def __init__(self, rules):
+        self.rules = rules
+        # 每个指标需要维护的窗口：{指标名: {('n', 样本数) 或 ('s', 秒数), ...}}
+        self.window_specs = {}
+        for rule in rules:
+            if rule.window:
+                self.window_specs.setdefault(rule.metric, set()).add(rule.window)
+
+
+class RuleEngine:
+    """告警规则引擎，保存每个监控目标的指标缓冲区和规则命中计数"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._group_rules = None   # {监控类型: {告警类型: [Rule, ...]}}
+        self._expires = 0
+        self._rulesets = {}        # (监控类型, 目标规则文本) -> RuleSet
+        self._states = {}          # target_id -> {'ruleset', 'series', 'hits'}
+    
+    def _load_group_rules(self):
+        """读取默认阈值规则和分组规则"""
+        db = get_db()
+        cursor = db.cursor()
+        keys = list(DEFAULT_THRESHOLDS) + ['alert_rules']
+        cursor.execute(
+            f"SELECT key, value FROM system_config WHERE key IN ({','.join('?' * len(keys))})",
+            keys
+        )
+        values = {row['key']: row['value'] for row in cursor.fetchall()}
+        db.close()
+        
+        groups = {}
+        for target_type, templates in DEFAULT_RULES.items():
+            for key, template in templates:
+                try:
+                    threshold = float(values.get(key) or DEFAULT_THRESHOLDS[key])
+                except ValueError:
+                    threshold = DEFAULT_THRESHOLDS[key]
+                rule = compile_rule(template.format(threshold))
+                groups.setdefault(target_type, {})[rule.alert_type] = [rule]
+        
+        try:
+            grouped = parse_rule_lines(values.get('alert_rules'), grouped=True)
+        except RuleError as e:
+            logger.warning("分组告警规则无效，已忽略: %s", e)
+            grouped = []
+        
+        overrides = {}
+        for target_type, rule in grouped:
+            overrides.setdefault(target_type, {}).setdefault(rule.alert_type, []).append(rule)
+        for target_type, by_alert in overrides.items():
+            groups.setdefault(target_type, {}).update(by_alert)
+        return groups
+    
+    def invalidate(self):
+        """清除规则缓存（系统配置修改后调用）"""
+        with self._lock:
+            self._expires = 0
+    
+    def forget(self, target_id):
+        """丢弃监控目标的窗口和计数（目标删除后调用）"""
+        with self._lock:
+            self._states.pop(target_id, None)
+    
+    def ruleset_for(self, target_type, target_rules):
+        """获取监控目标生效的规则集合（按监控类型和目标规则文本缓存）"""
+        now = time.time()
+        with self._lock:
+            if now < self._expires:
+                ruleset = self._rulesets.get((target_type, target_rules))
+                if ruleset is not None:
+                    return ruleset
+        
+        if now >= self._expires:
+            groups = self._load_group_rules()
+            with self._lock:
+                self._group_rules = groups
+                self._rulesets = {}
+                self._expires = now + RULES_CACHE_TTL
+        
+        by_alert = dict(self._group_rules.get(target_type, {}))
+        try:
+            own = parse_rule_lines(target_rules)
+        except RuleError as e:
+            logger.warning("监控目标告警规则无效，已忽略: %s", e)
+            own = []
+        overrides = {}
+        for rule in own:
+            overrides.setdefault(rule.alert_type, []).append(rule)
+        by_alert.update(overrides)
+        
+        ruleset = RuleSet([rule for rules in by_alert.values() for rule in rules])
+        with self._lock:
+            self._rulesets[(target_type, target_rules)] = ruleset
+        return ruleset
+    
+    @staticmethod
+    def _rebuild_state(state, ruleset):
+        """规则变化后重建目标状态，窗口定义和规则未变的部分保留原有数据"""
+        old_series = state['series'] if state else {}
+        old_hits = state['hits'] if state else {}
+        series = {}
+        for metric, specs in ruleset.window_specs.items():
+            existing = old_series.get(metric)
+            if existing is not None and set(existing.views) == specs:
+                series[metric] = existing
+            else:
+                series[metric] = MetricSeries(specs)
+        hits = {}
+        for rule in ruleset.rules:
+            existing = old_hits.get(rule.text)
+            hits[rule.text] = existing if existing is not None else HitCounter(rule.of)
+        return {'ruleset': ruleset, 'series': series, 'hits': hits}
+    
+    def evaluate(self, target_id, target_type, config, metrics, ts=None):
+        """用本次检查的数值指标评估规则
+        
+        Args:
+            target_id: 监控目标ID
+            target_type: 监控类型
+            config: 监控目标配置（读取其中的 alert_rules）
+            metrics: 本次检查结果 {指标名: 数值}
+            ts: 采样时间（epoch 秒），默认当前时间
+        
+        Returns:
+            dict: {告警类型: (是否触发, 告警消息)}，本次没有对应指标的告警类型不包含在内
+        """
+        ruleset = self.ruleset_for(target_type, (config.get('alert_rules') or '').strip())
+        if not ruleset.rules:
+            return {}
+        if ts is None:
+            ts = time.time()
+        
+        with self._lock:
+            state = self._states.get(target_id)
+            if state is None or state['ruleset'] is not ruleset:
+                state = self._rebuild_state(state, ruleset)
+                self._states[target_id] = state
+            
+            series = state['series']
+            hits = state['hits']
+            for metric, metric_series in series.items():
+                value = metrics.get(metric)
+                if isinstance(value, (int, float)):
+                    metric_series.push(ts, value)
+            
+            results = {}
+            for rule in ruleset.rules:
+                sample = metrics.get(rule.metric)
+                if not isinstance(sample, (int, float)):
+                    continue
+                value = rule.value(sample, series)
+                hit_count = hits[rule.text].push(rule.compare(value, rule.threshold))
+                fired = hit_count >= rule.need
+                
+                previous = results.get(rule.alert_type)
+                if previous is None or (fired and not previous[0]):
+                    results[rule.alert_type] = (fired, rule.message(value, hit_count) if fired else None)
+            return results
+
+
+def validate_rules(text, grouped=False):
+    """校验规则文本，返回错误信息（无错误时返回 None）"""
+    try:
+        parse_rule_lines(text, grouped)
+    except RuleError as e:
+        return str(e)
+    return None
+
+
+# 全局实例
+rule_engine = RuleEngine()
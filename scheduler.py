@@ -1,16 +1,42 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from monitors import ServerMonitor, StorageMonitor, ApplicationMonitor, DatabaseMonitor, BusinessMonitor, BackupMonitor
-from database import get_db
-from alerts import send_alert
+from database import get_db, insert_monitor_data
+from alerts import send_alert, resolve_alert, start_alert_dispatcher, flush_alerts
 from config import Config
-from crypto_utils import decrypt_config
+from crypto_utils import config_cache
+from rules import rule_engine
+from anomaly import anomaly_detector, format_anomalies
+from capacity import check_stats
+from dependencies import get_parent_id, build_dependency_graph, DOWN_STATUSES
+from breaker import circuit_breaker
+from preflight import get_endpoint, probe_endpoints
+from tracing import tracer, span
+from monitor_log import get_logger
+from profiler import profiler
+from scheduler_health import scheduler_health, JOB_ID
+from local_sampler import local_sampler
+from metrics import (
+    registry, CYCLE_DURATION, CHECK_DURATION, TARGET_CHECK_DURATION, CHECKS_TOTAL,
+    LAST_CYCLE_TIMESTAMP, EXECUTOR_QUEUE_DEPTH, EXECUTOR_THREADS, EXECUTOR_ACTIVE
+)
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import time
 
 scheduler = BackgroundScheduler()
 executor = ThreadPoolExecutor(max_workers=10)  # 最多10个并发任务
 
+logger = get_logger('scheduler')
+
+# 每个监控目标最近一次检查写入的状态（用于判断依赖的父目标是否可用）
+latest_status = {}
+
+@registry.on_collect
+def collect_executor_metrics():
+    """导出指标前读取线程池的队列长度和线程数"""
+    EXECUTOR_QUEUE_DEPTH.set(executor._work_queue.qsize())
+    EXECUTOR_THREADS.set(len(executor._threads))
+
 def run_monitors():
     """执行所有监控任务（并行）"""
     start_time = time.time()
@@ -22,31 +48,216 @@ def run_monitors():
     targets = cursor.fetchall()
     db.close()
     
+    scheduler_health.cycle_started('scheduled', len(targets))
     if not targets:
+        scheduler_health.cycle_finished('scheduled')
         return
     
-    # 使用线程池并行执行监控任务
-    futures = []
-    for target in targets:
-        future = executor.submit(run_single_monitor, dict(target))
-        futures.append(future)
+    profiler.cycle_started()
+    try:
+        stats = execute_targets([dict(target) for target in targets])
+    finally:
+        finish_cycle('scheduled')
     
-    # 等待所有任务完成
-    completed = 0
-    failed = 0
-    for future in as_completed(futures):
+    elapsed = time.time() - start_time
+    CYCLE_DURATION.observe(elapsed, trigger='scheduled')
+    LAST_CYCLE_TIMESTAMP.set(time.time(), trigger='scheduled')
+    logger.info(
+        "监控任务完成: %d 成功, %d 失败, %d 不可达, %d 跳过, %d 熔断, 耗时 %.2f秒",
+        stats['completed'], stats['failed'], stats['unreachable'], stats['skipped'], stats['cached'], elapsed
+    )
+
+def finish_cycle(trigger):
+    """一轮检查结束后的收尾（本轮出错时也执行）
+    
+    保存异常检测基线和耗时统计，本轮产生的告警合并发送，结束剖析和健康状态记录；
+    每一步单独处理异常，不影响后面的步骤
+    """
+    for step in (anomaly_detector.save, check_stats.save, flush_alerts, profiler.cycle_finished):
         try:
-            result = future.result()
-            if result:
-                completed += 1
-            else:
-                failed += 1
+            step()
         except Exception as e:
-            failed += 1
-            print(f"监控任务异常: {e}")
+            logger.error("检查收尾失败 (%s): %s", step.__qualname__, e)
+    scheduler_health.cycle_finished(trigger)
+
+def execute_targets(targets, force=False):
+    """使用线程池并行执行监控任务
     
-    elapsed = time.time() - start_time
-    print(f"监控任务完成: {completed} 成功, {failed} 失败, 耗时 {elapsed:.2f}秒")
+    - 声明了依赖的目标在父目标完成后才提交；父目标不可用时子目标（及其后代）
+      不再探测，直接记为 unknown
+    - 处于熔断状态的目标在探测时间到达前不执行检查，直接记为 offline (cached)
+    - 需要远程连接的目标先并发做 TCP 预检，确定不可达（拒绝连接、网络不可达、无法解析）的目标直接记为离线，
+      预检超时的目标照常执行完整检查
+    
+    Args:
+        targets: 监控目标字典列表
+        force: 为 True 时忽略熔断状态，全部执行真实检查（手动触发时使用）
+    
+    Returns:
+        dict: 成功、失败、跳过（依赖不可用）、熔断、预检不可达的目标数
+    """
+    stats = {'completed': 0, 'failed': 0, 'skipped': 0, 'cached': 0, 'unreachable': 0}
+    
+    # 逐个解析配置，配置损坏或无法解密的目标记为失败，不影响本轮其他目标
+    by_id = {}
+    configs = {}
+    for target in targets:
+        tid = target['id']
+        try:
+            configs[tid] = config_cache.get(tid, target['config'])
+        except Exception as e:
+            report_config_error(target, e)
+            stats['failed'] += 1
+            continue
+        by_id[tid] = target
+    parents = {tid: get_parent_id(config) for tid, config in configs.items()}
+    roots, children = build_dependency_graph(parents, list(by_id))
+    
+    # TCP 预检：一次并发探测本轮所有需要远程连接的目标（熔断中的目标不探测）
+    endpoints = {}
+    for tid, target in by_id.items():
+        endpoint = get_endpoint(target['type'], configs[tid])
+        if endpoint and (force or not circuit_breaker.open_state(tid)):
+            endpoints[tid] = endpoint
+    try:
+        unreachable = probe_endpoints(endpoints)
+    except Exception as e:
+        # 预检只是优化，失败时所有目标照常执行完整检查
+        logger.warning("TCP 预检失败，本轮跳过预检: %s", e)
+        unreachable = {}
+    
+    ready = list(roots)
+    pending = {}
+    
+    def release_children(tid):
+        """父目标完成后提交子目标，父目标不可用时跳过所有后代"""
+        if latest_status.get(tid) not in DOWN_STATUSES:
+            ready.extend(children.get(tid, []))
+            return
+        stack = [(child, tid) for child in children.get(tid, [])]
+        while stack:
+            child, parent = stack.pop()
+            skip_target(by_id[child], by_id[parent])
+            stats['skipped'] += 1
+            CHECKS_TOTAL.inc(type=by_id[child]['type'], result='skipped')
+            stack.extend((grandchild, child) for grandchild in children.get(child, []))
+    
+    while ready or pending:
+        while ready:
+            tid = ready.pop()
+            breaker_state = None if force else circuit_breaker.open_state(tid)
+            if breaker_state:
+                report_cached(by_id[tid], breaker_state)
+                stats['cached'] += 1
+                CHECKS_TOTAL.inc(type=by_id[tid]['type'], result='cached')
+                release_children(tid)
+            elif tid in unreachable:
+                report_unreachable(by_id[tid], endpoints[tid], *unreachable[tid])
+                stats['unreachable'] += 1
+                CHECKS_TOTAL.inc(type=by_id[tid]['type'], result='unreachable')
+                release_children(tid)
+            else:
+                pending[executor.submit(run_single_monitor, by_id[tid])] = tid
+        
+        if not pending:
+            break
+        
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            tid = pending.pop(future)
+            try:
+                if future.result():
+                    stats['completed'] += 1
+                else:
+                    stats['failed'] += 1
+            except Exception as e:
+                stats['failed'] += 1
+                latest_status[tid] = 'error'
+                logger.error("监控任务异常: %s", e, extra={'target_id': tid})
+            release_children(tid)
+    
+    return stats
+
+def report_unreachable(target, endpoint, kind, reason):
+    """TCP 预检失败：不执行完整检查，按检查失败记录并告警"""
+    target_id = target['id']
+    target_type = target['type']
+    host, port = endpoint
+    error = f"{host}:{port} {reason}"
+    
+    if target_type == 'backup':
+        result = {'status': 'error', 'error': error, 'files': [], 'total_count': 0, 'total_size': 0}
+        message = f"备份检查失败: {error}"
+    elif target_type == 'database':
+        result = {'status': 'offline', 'error': error}
+        message = f"数据库连接失败: {host}（{reason}）"
+    else:
+        result = {'status': 'offline', 'error': error}
+        message = f"远程服务器连接失败: {host}（{reason}）"
+    result['preflight'] = kind
+    result['execution_time'] = 0
+    
+    db = get_db()
+    cursor = db.cursor()
+    save_result(cursor, target_id, target_type, result, 'error')
+    db.commit()
+    db.close()
+    send_alert(target_id, target_type, message)
+    logger.warning("[%s] 预检失败: %s", target['name'], error, extra={'target_id': target_id})
+
+def report_config_error(target, error):
+    """配置无法解析或解密：不执行检查，按检查失败记录"""
+    target_id = target['id']
+    result = {'status': 'error', 'error': f"配置无效: {error}", 'execution_time': 0}
+    db = get_db()
+    cursor = db.cursor()
+    save_result(cursor, target_id, target['type'], result, 'error')
+    db.commit()
+    db.close()
+    CHECKS_TOTAL.inc(type=target['type'], result='failure')
+    logger.error("[%s] 配置无效: %s", target['name'], error, extra={'target_id': target_id})
+
+def report_cached(target, state):
+    """熔断中的目标不执行检查，记录 offline (cached)（告警保持不变）"""
+    result = {
+        'status': 'offline',
+        'cached': True,
+        'error': state.get('last_error') or '连续检查失败',
+        'failures': state['failures'],
+        'next_probe_ts': int(state['next_probe'])
+    }
+    db = get_db()
+    cursor = db.cursor()
+    insert_monitor_data(cursor, target['id'], target['type'], json.dumps(result), 'error')
+    db.commit()
+    db.close()
+    latest_status[target['id']] = 'error'
+    wait_seconds = int(state['next_probe'] - time.time())
+    logger.warning(
+        "[%s] offline (cached): 连续失败 %d 次，%d秒后重新探测", target['name'], state['failures'], wait_seconds,
+        extra={'target_id': target['id']}
+    )
+
+def skip_target(target, parent):
+    """父目标不可用时跳过检查，记录 unknown 状态（不发送告警）"""
+    result = {
+        'status': 'unknown',
+        'skipped': True,
+        'depends_on': parent['id'],
+        'reason': f"依赖的监控目标 [{parent['name']}] 不可用"
+    }
+    db = get_db()
+    cursor = db.cursor()
+    save_result(cursor, target['id'], target['type'], result, 'unknown')
+    db.commit()
+    db.close()
+    logger.info("[%s] 跳过: %s", target['name'], result['reason'], extra={'target_id': target['id']})
+
+def save_result(cursor, target_id, metric_type, result, status):
+    """写入监控结果，记录目标最新状态并更新熔断计数"""
+    insert_monitor_data(cursor, target_id, metric_type, json.dumps(result), status)
+    latest_status[target_id] = status
+    circuit_breaker.record(target_id, status, result.get('error'))
 
 def run_single_monitor(target):
     """执行单个监控任务"""
@@ -56,12 +267,15 @@ def run_single_monitor(target):
     target_id = target['id']
     target_type = target['type']
     target_name = target['name']
+    EXECUTOR_ACTIVE.inc()
+    scheduler_health.check_started()
+    tracer.start(target_id, target_type)
+    success = False
     
     try:
-        config = json.loads(target['config'])
-        
-        # 解密配置中的敏感信息
-        config = decrypt_config(config)
+        # 解析并解密配置（配置未变化时直接使用缓存）
+        with span('decrypt'):
+            config = config_cache.get(target_id, target['config'])
         
         elapsed = 0
         
@@ -80,12 +294,58 @@ def run_single_monitor(target):
         
         if elapsed == 0:
             elapsed = time.time() - start_time
-        print(f"  [{target_name}] 完成，耗时 {elapsed:.2f}秒")
+        logger.info(
+            "[%s] 完成，耗时 %.2f秒", target_name, elapsed, extra={'target_id': target_id, 'sample': True}
+        )
+        CHECKS_TOTAL.inc(type=target_type, result='success')
+        success = True
         return True
     except Exception as e:
         elapsed = time.time() - start_time
-        print(f"  [{target_name}] 失败，耗时 {elapsed:.2f}秒: {e}")
+        latest_status[target_id] = 'error'
+        circuit_breaker.record(target_id, 'error', str(e))
+        logger.error("[%s] 失败，耗时 %.2f秒: %s", target_name, elapsed, e, extra={'target_id': target_id})
+        CHECKS_TOTAL.inc(type=target_type, result='failure')
         return False
+    finally:
+        EXECUTOR_ACTIVE.dec()
+        tracer.finish('success' if success else 'failure')
+        duration = time.time() - start_time
+        CHECK_DURATION.observe(duration, type=target_type)
+        TARGET_CHECK_DURATION.observe(duration, target_id=target_id, type=target_type)
+        check_stats.record(target_id, target_type, duration)
+        scheduler_health.check_finished(duration)
+
+def apply_alert_rules(target_id, target_type, config, metrics):
+    """用告警规则评估本次检查的数值指标，触发或恢复对应告警"""
+    for alert_type, (fired, message) in rule_engine.evaluate(target_id, target_type, config, metrics).items():
+        if fired:
+            send_alert(target_id, alert_type, message)
+        else:
+            resolve_alert(target_id, alert_type)
+
+def detect_anomalies(target_id, target_type, result, status):
+    """异常检测：偏离基线的指标记录到 result['anomalies']
+    
+    Returns:
+        tuple: (写入监控数据的状态, 异常列表)，有异常时 normal 状态改为 warning
+    """
+    with span('anomaly'):
+        anomalies = anomaly_detector.observe(target_id, target_type, result)
+    if anomalies:
+        result['anomalies'] = anomalies
+        if status == 'normal':
+            status = 'warning'
+    return status, anomalies
+
+def report_anomalies(target_id, anomalies):
+    """根据异常检测结果触发或恢复异常告警（未启用检测时不处理）"""
+    if anomalies is None:
+        return
+    if anomalies:
+        send_alert(target_id, 'anomaly', format_anomalies(anomalies))
+    else:
+        resolve_alert(target_id, 'anomaly')
 
 def check_server(target_id, config):
     """检查服务器"""
@@ -105,48 +365,42 @@ def check_server(target_id, config):
             
             db = get_db()
             cursor = db.cursor()
-            cursor.execute(
-                'INSERT INTO monitor_data (target_id, metric_type, metric_value, status) VALUES (?, ?, ?, ?)',
-                (target_id, 'server', json.dumps(result), 'error')
-            )
-            db.commit()
+            with span('persist'):
+                save_result(cursor, target_id, 'server', result, 'error')
+                db.commit()
             send_alert(target_id, 'server', f"远程服务器连接失败: {config['host']}")
             db.close()
             return elapsed
         
-        cpu = result.get('cpu')
-        memory = result.get('memory')
-        disk = result.get('disk')
+        resolve_alert(target_id, 'server')
+        
+        metrics = {
+            'cpu': result.get('cpu'),
+            'memory': result.get('memory'),
+            'disk': result.get('disk')
+        }
     else:
-        # 本地服务器监控
-        cpu = ServerMonitor.check_local_cpu()
-        memory = ServerMonitor.check_local_memory()
-        disk = ServerMonitor.check_local_disk()
+        # 本地服务器监控：一次采集所有指标
+        with span('collect'):
+            metrics = ServerMonitor.check_local_server(config, target_id)
+            # 启用后台采样时，用两次检查之间采样的汇总代替检查时刻的读数
+            metrics.update(local_sampler.publish(target_id))
     
     elapsed = time.time() - start_time
     
     db = get_db()
     cursor = db.cursor()
     
-    metrics = {
-        'cpu': cpu,
-        'memory': memory,
-        'disk': disk,
-        'execution_time': round(elapsed, 2)
-    }
+    metrics['execution_time'] = round(elapsed, 2)
     
-    cursor.execute(
-        'INSERT INTO monitor_data (target_id, metric_type, metric_value, status) VALUES (?, ?, ?, ?)',
-        (target_id, 'server', json.dumps(metrics), 'normal')
-    )
-    db.commit()
+    status, anomalies = detect_anomalies(target_id, 'server', metrics, 'normal')
+    
+    with span('persist'):
+        save_result(cursor, target_id, 'server', metrics, status)
+        db.commit()
     
-    if cpu and cpu > Config.CPU_THRESHOLD:
-        send_alert(target_id, 'cpu', f"CPU使用率过高: {cpu}%")
-    if memory and memory > Config.MEMORY_THRESHOLD:
-        send_alert(target_id, 'memory', f"内存使用率过高: {memory}%")
-    if disk and disk > Config.DISK_THRESHOLD:
-        send_alert(target_id, 'disk', f"磁盘使用率过高: {disk}%")
+    apply_alert_rules(target_id, 'server', config, metrics)
+    report_anomalies(target_id, anomalies)
     
     db.close()
     return elapsed
@@ -157,7 +411,8 @@ def check_storage(target_id, config):
     start_time = time.time()
     
     path = config.get('path', '/')
-    storage = StorageMonitor.check_storage(path)
+    with span('collect'):
+        storage = StorageMonitor.check_storage(path)
     
     elapsed = time.time() - start_time
     storage['execution_time'] = round(elapsed, 2)
@@ -165,14 +420,14 @@ def check_storage(target_id, config):
     db = get_db()
     cursor = db.cursor()
     
-    cursor.execute(
-        'INSERT INTO monitor_data (target_id, metric_type, metric_value, status) VALUES (?, ?, ?, ?)',
-        (target_id, 'storage', json.dumps(storage), 'normal')
-    )
-    db.commit()
+    status, anomalies = detect_anomalies(target_id, 'storage', storage, 'normal')
+    
+    with span('persist'):
+        save_result(cursor, target_id, 'storage', storage, status)
+        db.commit()
     
-    if storage['percent'] > Config.STORAGE_THRESHOLD:
-        send_alert(target_id, 'storage', f"存储使用率过高: {storage['percent']}%")
+    apply_alert_rules(target_id, 'storage', config, storage)
+    report_anomalies(target_id, anomalies)
     
     db.close()
     return elapsed
@@ -192,15 +447,20 @@ def check_application(target_id, config):
     cursor = db.cursor()
     
     status = 'normal' if result['status'] == 'online' else 'error'
+    anomalies = None
+    if status == 'normal':
+        status, anomalies = detect_anomalies(target_id, 'application', result, status)
     
-    cursor.execute(
-        'INSERT INTO monitor_data (target_id, metric_type, metric_value, status) VALUES (?, ?, ?, ?)',
-        (target_id, 'application', json.dumps(result), status)
-    )
-    db.commit()
+    with span('persist'):
+        save_result(cursor, target_id, 'application', result, status)
+        db.commit()
     
     if result['status'] != 'online':
         send_alert(target_id, 'application', f"应用服务异常: {url}")
+    else:
+        resolve_alert(target_id, 'application')
+        apply_alert_rules(target_id, 'application', config, result)
+        report_anomalies(target_id, anomalies)
     
     db.close()
     return elapsed
@@ -237,15 +497,20 @@ def check_database(target_id, config):
     cursor = db.cursor()
     
     status = 'normal' if result['status'] == 'online' else 'error'
+    anomalies = None
+    if status == 'normal':
+        status, anomalies = detect_anomalies(target_id, 'database', result, status)
     
-    cursor.execute(
-        'INSERT INTO monitor_data (target_id, metric_type, metric_value, status) VALUES (?, ?, ?, ?)',
-        (target_id, 'database', json.dumps(result), status)
-    )
-    db.commit()
+    with span('persist'):
+        save_result(cursor, target_id, 'database', result, status)
+        db.commit()
     
     if result['status'] != 'online':
         send_alert(target_id, 'database', f"数据库连接失败: {config['host']}")
+    else:
+        resolve_alert(target_id, 'database')
+        apply_alert_rules(target_id, 'database', config, result)
+        report_anomalies(target_id, anomalies)
     
     db.close()
     return elapsed
@@ -264,12 +529,13 @@ def check_business(target_id, config):
     cursor = db.cursor()
     
     status = 'normal' if not result.get('alert') else 'warning'
+    anomalies = None
+    if result.get('status') != 'error':
+        status, anomalies = detect_anomalies(target_id, 'business', result, status)
     
-    cursor.execute(
-        'INSERT INTO monitor_data (target_id, metric_type, metric_value, status) VALUES (?, ?, ?, ?)',
-        (target_id, 'business', json.dumps(result), status)
-    )
-    db.commit()
+    with span('persist'):
+        save_result(cursor, target_id, 'business', result, status)
+        db.commit()
     
     if result.get('alert'):
         # 构建详细的告警信息
@@ -299,6 +565,9 @@ def check_business(target_id, config):
                 alert_message += f"  ... 还有 {row_count - max_display_rows} 条记录"
         
         send_alert(target_id, 'business', alert_message)
+    elif result.get('status') != 'error':
+        resolve_alert(target_id, 'business')
+    report_anomalies(target_id, anomalies)
     
     db.close()
     return elapsed
@@ -317,37 +586,49 @@ def check_backup(target_id, config):
     cursor = db.cursor()
     
     status = result.get('status', 'error')
+    anomalies = None
+    if status != 'error':
+        status, anomalies = detect_anomalies(target_id, 'backup', result, status)
     
-    cursor.execute(
-        'INSERT INTO monitor_data (target_id, metric_type, metric_value, status) VALUES (?, ?, ?, ?)',
-        (target_id, 'backup', json.dumps(result), status)
-    )
-    db.commit()
+    with span('persist'):
+        save_result(cursor, target_id, 'backup', result, status)
+        db.commit()
     
     if result.get('alert'):
         alert_message = result.get('alert_message', '备份文件检查异常')
         send_alert(target_id, 'backup', alert_message)
     elif result.get('status') == 'error':
         send_alert(target_id, 'backup', f"备份检查失败: {result.get('error', '未知错误')}")
+    else:
+        resolve_alert(target_id, 'backup')
+    report_anomalies(target_id, anomalies)
     
     db.close()
     return elapsed
 
-def start_scheduler():
-    """启动调度器"""
-    # 从数据库读取检查间隔配置
+def load_check_interval():
+    """从数据库读取检查间隔配置（秒），没有则使用默认值"""
     db = get_db()
     cursor = db.cursor()
     cursor.execute("SELECT value FROM system_config WHERE key = 'check_interval'")
     result = cursor.fetchone()
     db.close()
+    return int(result['value']) if result else Config.CHECK_INTERVAL
+
+def start_scheduler():
+    """启动调度器"""
+    check_interval = load_check_interval()
     
-    # 使用数据库配置，如果没有则使用默认值
-    check_interval = int(result['value']) if result else Config.CHECK_INTERVAL
-    
-    print(f"启动监控调度器，检查间隔: {check_interval}秒")
-    scheduler.add_job(run_monitors, 'interval', seconds=check_interval)
+    logger.info("启动监控调度器，检查间隔: %d秒", check_interval)
+    scheduler_health.attach(scheduler, executor, check_interval)
+    scheduler.add_job(run_monitors, 'interval', seconds=check_interval, id=JOB_ID)
     scheduler.start()
+    
+    # 启动告警投递线程
+    start_alert_dispatcher()
+    
+    if Config.LOCAL_SAMPLE_INTERVAL > 0:
+        local_sampler.start(Config.LOCAL_SAMPLE_INTERVAL)
 
 
 
@@ -360,7 +641,7 @@ def trigger_manual_check():
     import time
     start_time = time.time()
     
-    print("手动触发监控检查...")
+    logger.info("手动触发监控检查...")
     
     db = get_db()
     cursor = db.cursor()
@@ -378,34 +659,29 @@ def trigger_manual_check():
             'elapsed': 0
         }
     
-    # 使用线程池并行执行监控任务
-    futures = []
-    for target in targets:
-        future = executor.submit(run_single_monitor, dict(target))
-        futures.append(future)
-    
-    # 等待所有任务完成
-    completed = 0
-    failed = 0
-    for future in as_completed(futures):
-        try:
-            result = future.result()
-            if result:
-                completed += 1
-            else:
-                failed += 1
-        except Exception as e:
-            failed += 1
-            print(f"监控任务异常: {e}")
+    # 手动检查忽略熔断状态，所有目标都执行真实检查
+    profiler.cycle_started()
+    scheduler_health.cycle_started('manual', len(targets))
+    try:
+        stats = execute_targets([dict(target) for target in targets], force=True)
+    finally:
+        finish_cycle('manual')
     
     elapsed = time.time() - start_time
-    print(f"手动监控完成: {completed} 成功, {failed} 失败, 耗时 {elapsed:.2f}秒")
+    CYCLE_DURATION.observe(elapsed, trigger='manual')
+    LAST_CYCLE_TIMESTAMP.set(time.time(), trigger='manual')
+    logger.info(
+        "手动监控完成: %d 成功, %d 失败, %d 不可达, %d 跳过, 耗时 %.2f秒",
+        stats['completed'], stats['failed'], stats['unreachable'], stats['skipped'], elapsed
+    )
     
     return {
         'success': True,
         'message': f'监控检查完成',
-        'completed': completed,
-        'failed': failed,
+        'completed': stats['completed'],
+        'failed': stats['failed'],
+        'unreachable': stats['unreachable'],
+        'skipped': stats['skipped'],
         'total': len(targets),
         'elapsed': round(elapsed, 2)
     }
@@ -0,0 +1,227 @@
+"""
+调度器健康状态
+监控检查落后时，仪表板上的“最新”数据其实已经过期，但看起来仍然正常。这里跟踪调度器自身的运行情况：
+- 启动延迟：计划执行时间与一轮检查实际开始时间之差。APScheduler 提交完所有到期任务后才分发提交事件，
+  检查线程可能先开始执行，事件和一轮检查按到达的先后分别匹配
+- 错过的执行：APScheduler 超过宽限时间未执行（missed）、多次到期合并为一次（coalesced）、
+  上一轮仍在执行而跳过（overlap）
+- 积压：本该开始下一轮时线程池中仍在排队和执行的检查数
+- 线程利用率：一轮检查中线程池繁忙时间 / (并发数 × 本轮耗时)
+"""
+
+import threading
+import time
+from collections import deque
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
+from metrics import SCHEDULER_START_LAG, SCHEDULER_SKIPPED_RUNS, SCHEDULER_BACKLOG, WORKER_UTILIZATION
+
+JOB_ID = 'run_monitors'     # 定时检查任务的 ID
+CYCLE_HISTORY = 50          # 保留最近的检查轮数
+EVENT_HISTORY = 100         # 保留最近的错过执行事件数
+LAG_WARNING = 5             # 启动延迟超过该秒数时提示
+BUSY_WARNING = 0.8          # 每轮耗时超过检查间隔的该比例时提示
+STALE_INTERVALS = 2         # 超过该倍数的检查间隔没有完成定时检查时视为停滞
+
+
+class SchedulerHealth:
+    """记录调度事件和每轮检查的执行情况"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._interval = None
+        self._attached_ts = None
+        self._last_scheduled = None     # 最近一次到期的计划执行时间（epoch 秒）
+        self._pending_scheduled = None  # 已提交、尚未开始的定时检查的计划时间
+        self._cycles = deque(maxlen=CYCLE_HISTORY)
+        self._events = deque(maxlen=EVENT_HISTORY)
+        self._counts = {'missed': 0, 'coalesced': 0, 'overlap': 0}
+        self._current = {}              # trigger -> 进行中的一轮检查
+        self._active = 0
+        self._last_finished = {}        # trigger -> 最近一轮完成时间
+    
+    def attach(self, scheduler, executor, interval):
+        """注册 APScheduler 事件监听（启动调度器前调用）"""
+        self._executor = executor
+        self._interval = interval
+        self._attached_ts = time.time()
+        scheduler.add_listener(self._on_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+    
+    def _backlog(self):
+        """线程池中排队和正在执行的检查数"""
+        queued = self._executor._work_queue.qsize() if self._executor else 0
+        return queued, self._active
+    
+    def _on_event(self, event):
+        if event.job_id != JOB_ID:
+            return
+        if event.code == EVENT_JOB_MISSED:
+            run_times = [event.scheduled_run_time]
+        else:
+            run_times = list(event.scheduled_run_times)
+        if not run_times:
+            return
+        run_times = [run_time.timestamp() for run_time in run_times]
+        lag = None
+        
+        with self._lock:
+            # 计划时间之间的空缺说明中间的到期被合并（coalesce）掉了
+            if self._last_scheduled is not None and self._interval:
+                gap = round((run_times[0] - self._last_scheduled) / self._interval) - 1
+                if gap > 0:
+                    self._add_event('coalesced', run_times[0], gap)
+            self._last_scheduled = run_times[-1]
+            
+            if event.code == EVENT_JOB_SUBMITTED:
+                cycle = self._current.get('scheduled')
+                if cycle is not None and cycle['lag'] is None and self._matches(run_times[-1], cycle['started']):
+                    # 这一轮检查已先开始
+                    lag = cycle['lag'] = max(cycle['started'] - run_times[-1], 0)
+                else:
+                    self._pending_scheduled = run_times[-1]
+            elif event.code == EVENT_JOB_MISSED:
+                self._add_event('missed', run_times[-1], 1)
+            else:
+                # 上一轮检查仍在执行，本次到期被跳过
+                queued, active = self._backlog()
+                self._add_event('overlap', run_times[-1], len(run_times), queued=queued, active=active)
+                SCHEDULER_BACKLOG.set(queued + active)
+        if lag is not None:
+            SCHEDULER_START_LAG.observe(lag)
+    
+    def _matches(self, scheduled, started):
+        """计划时间和开始时间是否属于同一轮（开始时间在计划时间之后一个检查间隔内）"""
+        return not self._interval or started - scheduled < self._interval
+    
+    def _add_event(self, kind, scheduled, count, **extra):
+        """记录一次错过的执行（调用方持有锁）"""
+        self._counts[kind] += count
+        SCHEDULER_SKIPPED_RUNS.inc(count, reason=kind)
+        event = {'type': kind, 'scheduled': round(scheduled, 3), 'ts': round(time.time(), 3), 'count': count}
+        event.update(extra)
+        self._events.append(event)
+    
+    def cycle_started(self, trigger, targets):
+        """一轮检查开始（由调度器调用）"""
+        now = time.time()
+        lag = None
+        with self._lock:
+            if trigger == 'scheduled' and self._pending_scheduled is not None:
+                # 超过一个检查间隔的计划时间属于更早的一轮（那一轮的提交事件晚到），不用于本轮
+                if self._matches(self._pending_scheduled, now):
+                    lag = max(now - self._pending_scheduled, 0)
+                self._pending_scheduled = None
+            queued, active = self._backlog()
+            self._current[trigger] = {
+                'trigger': trigger,
+                'started': now,
+                'perf': time.perf_counter(),
+                'lag': lag,
+                'targets': targets,
+                'backlog': queued + active,
+                'busy': 0.0
+            }
+        if lag is not None:
+            SCHEDULER_START_LAG.observe(lag)
+        SCHEDULER_BACKLOG.set(queued + active)
+    
+    def check_started(self):
+        with self._lock:
+            self._active += 1
+    
+    def check_finished(self, duration):
+        """一个检查结束，累计本轮线程池繁忙时间"""
+        with self._lock:
+            self._active -= 1
+            # 手动检查和定时检查同时进行时无法区分检查属于哪一轮，计入所有进行中的轮次
+            for cycle in self._current.values():
+                cycle['busy'] += duration
+    
+    def cycle_finished(self, trigger):
+        """一轮检查结束（由调度器调用）"""
+        with self._lock:
+            cycle = self._current.pop(trigger, None)
+            if cycle is None:
+                return
+            elapsed = time.perf_counter() - cycle.pop('perf')
+            workers = self._executor._max_workers if self._executor else 1
+            busy = cycle.pop('busy')
+            cycle['elapsed'] = round(elapsed, 3)
+            cycle['utilization'] = round(min(busy / (workers * elapsed), 1), 3) if elapsed > 0 else 0
+            if cycle['lag'] is not None:
+                cycle['lag'] = round(cycle['lag'], 3)
+            cycle['started'] = round(cycle['started'], 3)
+            self._cycles.append(cycle)
+            self._last_finished[cycle['trigger']] = time.time()
+        WORKER_UTILIZATION.set(cycle['utilization'])
+    
+    def status(self):
+        """健康状态汇总
+        
+        Returns:
+            dict: {'status': ok/warning/critical, 'problems': [...], 'cycles': [...], 'events': [...], ...}
+        """
+        now = time.time()
+        with self._lock:
+            cycles = list(self._cycles)
+            events = list(self._events)
+            counts = dict(self._counts)
+            running = list(self._current)
+            last_finished = self._last_finished.get('scheduled')
+            queued, active = self._backlog()
+        interval = self._interval
+        
+        problems = []
+        level = 'ok'
+        
+        def problem(severity, message):
+            nonlocal level
+            problems.append({'severity': severity, 'message': message})
+            if severity == 'critical' or level == 'ok':
+                level = severity
+        
+        if interval is None:
+            problem('warning', '调度器未启动')
+        else:
+            since = last_finished or self._attached_ts
+            if now - since > interval * STALE_INTERVALS:
+                problem('critical', f'已 {int(now - since)} 秒没有完成定时检查，仪表板数据可能已过期')
+        
+        scheduled = [cycle for cycle in cycles if cycle['trigger'] == 'scheduled']
+        recent_events = [event for event in events if now - event['ts'] <= 3600]
+        if recent_events:
+            summary = {}
+            for event in recent_events:
+                summary[event['type']] = summary.get(event['type'], 0) + event['count']
+            labels = {'missed': '错过', 'coalesced': '合并', 'overlap': '因上一轮未完成而跳过'}
+            text = '，'.join(f'{labels[kind]} {count} 次' for kind, count in summary.items())
+            problem('warning', f'最近1小时定时检查: {text}')
+        if scheduled and scheduled[-1]['lag'] is not None and scheduled[-1]['lag'] > LAG_WARNING:
+            problem('warning', f"最近一轮检查比计划晚 {scheduled[-1]['lag']:.1f} 秒开始")
+        if scheduled and interval and scheduled[-1]['elapsed'] > interval * BUSY_WARNING:
+            problem('warning', f"最近一轮检查耗时 {scheduled[-1]['elapsed']:.1f} 秒，接近检查间隔 {interval} 秒")
+        
+        lags = [cycle['lag'] for cycle in scheduled if cycle['lag'] is not None]
+        return {
+            'status': level,
+            'problems': problems,
+            'interval': interval,
+            'workers': self._executor._max_workers if self._executor else None,
+            'last_cycle_ts': round(last_finished, 3) if last_finished else None,
+            'running': running,
+            'queued': queued,
+            'active': active,
+            'skipped_runs': counts,
+            'lag': {
+                'last': lags[-1] if lags else None,
+                'max': max(lags) if lags else None,
+                'avg': round(sum(lags) / len(lags), 3) if lags else None
+            },
+            'utilization': cycles[-1]['utilization'] if cycles else None,
+            'cycles': cycles[::-1],
+            'events': events[::-1]
+        }
+
+
+# 全局实例
+scheduler_health = SchedulerHealth()
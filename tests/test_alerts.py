@@ -0,0 +1,212 @@
+"""
+alerts 告警状态机测试
+"""
+
+import os
+import sys
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import alerts
+import database
+from config import Config
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'monitoring.db')
+    monkeypatch.setattr(Config, 'DATABASE', path)
+    database.init_db()
+    return path
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可调的 time.time()，其他计时函数不变"""
+    now = [1_800_000_000]
+    fake = types.SimpleNamespace(time=lambda: now[0], monotonic=time.monotonic, perf_counter=time.perf_counter)
+    monkeypatch.setattr(alerts, 'time', fake)
+    return now
+
+
+def query(sql, params=()):
+    db = database.get_db()
+    rows = [dict(row) for row in db.execute(sql, params).fetchall()]
+    db.close()
+    return rows
+
+
+def test_fire_renotifies_after_interval(db_path, clock):
+    tracker = alerts.AlertTracker()
+    tracker.fire(1, 'cpu', 'CPU 90%')
+    tracker.fire(1, 'cpu', 'CPU 91%')
+    assert tracker.flush() == 1
+    
+    clock[0] += Config.ALERT_RENOTIFY_INTERVAL - 1
+    tracker.fire(1, 'cpu', 'CPU 92%')
+    assert tracker.flush() == 0
+    
+    clock[0] += 1
+    tracker.fire(1, 'cpu', 'CPU 93%')
+    assert tracker.flush() == 1
+    
+    assert query('SELECT status, occurrences, message FROM alerts') == [
+        {'status': 'pending', 'occurrences': 4, 'message': 'CPU 93%'}
+    ]
+    titles = [row['title'] for row in query('SELECT title FROM alert_outbox ORDER BY id')]
+    assert titles[0] == '【监控告警】'
+    assert titles[1].startswith('【持续告警】')
+    assert len(titles) == 2
+
+
+def test_resolve_before_first_write(db_path, clock):
+    tracker = alerts.AlertTracker()
+    tracker.fire(1, 'offline', '无法连接')
+    tracker.resolve(1, 'offline')
+    assert tracker.flush() == 2
+    
+    rows = query('SELECT id, status, occurrences FROM alerts')
+    assert [(row['status'], row['occurrences']) for row in rows] == [('resolved', 1)]
+    outbox = query('SELECT alert_id, title FROM alert_outbox ORDER BY id')
+    assert [row['alert_id'] for row in outbox] == [rows[0]['id']] * 2
+    assert outbox[1]['title'].startswith('【告警恢复】')
+    
+    # 恢复后再次触发是一条新的告警
+    tracker.fire(1, 'offline', '无法连接')
+    tracker.flush()
+    assert len(query("SELECT id FROM alerts WHERE status = 'pending'")) == 1
+
+
+def test_flush_failure_keeps_batch(db_path, clock):
+    tracker = alerts.AlertTracker()
+    tracker.fire(1, 'cpu', 'CPU 90%')
+    tracker.flush()
+    tracker.fire(1, 'cpu', 'CPU 91%')
+    tracker.fire(2, 'disk', '磁盘 95%')
+    
+    def fail(changes, outbox):
+        raise RuntimeError('database is locked')
+    
+    tracker._write = fail
+    with pytest.raises(RuntimeError):
+        tracker.flush()
+    del tracker._write
+    
+    # 失败期间新的触发与放回的变化一起写入
+    tracker.fire(2, 'disk', '磁盘 96%')
+    assert tracker.flush() == 1
+    rows = query('SELECT target_id, occurrences, message FROM alerts ORDER BY target_id')
+    assert rows == [
+        {'target_id': 1, 'occurrences': 2, 'message': 'CPU 91%'},
+        {'target_id': 2, 'occurrences': 2, 'message': '磁盘 96%'}
+    ]
+    assert len(query('SELECT id FROM alert_outbox')) == 2
+
+
+def test_reset_reloads_and_forget_drops_target(db_path, clock):
+    tracker = alerts.AlertTracker()
+    tracker.fire(1, 'cpu', 'CPU 90%')
+    tracker.flush()
+    
+    db = database.get_db()
+    db.execute('DELETE FROM alerts')
+    db.commit()
+    db.close()
+    tracker.reset()
+    tracker.fire(1, 'cpu', 'CPU 91%')
+    tracker.fire(2, 'cpu', 'CPU 92%')
+    tracker.forget(2)
+    assert tracker.flush() == 1
+    assert query('SELECT target_id, message FROM alerts') == [{'target_id': 1, 'message': 'CPU 91%'}]
+
+
+def test_split_message_respects_byte_limit():
+    lines = [f'第{i}行 ' + 'x' * 40 for i in range(30)]
+    owners = list(range(30))
+    messages = alerts.split_message(lines, 300, '**汇总**', owners)
+    assert len(messages) > 1
+    for index, (content, chunk_owners) in enumerate(messages):
+        assert len(content.encode('utf-8')) <= 300
+        assert content.startswith(f'**汇总**（{index + 1}/{len(messages)}）')
+    assert sorted(owner for _, chunk_owners in messages for owner in chunk_owners) == owners
+    
+    # 单行超长时截断
+    [(content, chunk_owners)] = alerts.split_message(['长' * 500], 200, owners=[7])
+    assert len(content.encode('utf-8')) <= 200 and content.endswith('...')
+    assert chunk_owners == {7}
+
+
+def test_token_bucket_limits_rate():
+    bucket = alerts.TokenBucket(3)
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    wait = bucket.acquire()
+    assert 0 < wait <= 20
+
+
+def enqueue(count):
+    db = database.get_db()
+    cursor = db.cursor()
+    for i in range(count):
+        alerts._enqueue_message(cursor, None, '【监控告警】', f'告警 {i} ' + 'x' * 30)
+    db.commit()
+    db.close()
+
+
+def test_dispatch_retries_only_unsent_chunks(db_path, clock, monkeypatch):
+    monkeypatch.setattr(alerts, 'MAX_MARKDOWN_BYTES', 300)
+    monkeypatch.setattr(alerts, 'get_webhook_url', lambda: 'https://example.invalid/webhook')
+    sent = []
+    results = iter([True, False])
+    
+    def send(content, webhook_url=None, msgtype='text'):
+        success = next(results, True)
+        if success:
+            sent.append(content)
+        return success
+    
+    monkeypatch.setattr(alerts, 'send_wechat_alert', send)
+    enqueue(8)
+    dispatcher = alerts.AlertDispatcher()
+    assert dispatcher.dispatch_pending() == 8
+    
+    rows = query('SELECT id, message, status, attempts, next_attempt_ts FROM alert_outbox ORDER BY id')
+    delivered = [row for row in rows if row['status'] == 'sent']
+    retry = [row for row in rows if row['status'] == 'pending']
+    assert delivered and retry and len(delivered) + len(retry) == 8
+    assert all(row['message'].split(' x')[0] in sent[0] for row in delivered)
+    assert all(row['next_attempt_ts'] == clock[0] + alerts.RETRY_BASE_DELAY for row in retry)
+    assert all(row['attempts'] == 1 for row in rows)
+    
+    # 到期后只重发未发出的记录
+    clock[0] += alerts.RETRY_BASE_DELAY
+    assert dispatcher.dispatch_pending() == len(retry)
+    resent = '\n'.join(sent[1:])
+    assert all(row['message'].split(' x')[0] not in resent for row in delivered)
+    assert all(row['message'].split(' x')[0] in resent for row in retry)
+    assert {row['status'] for row in query('SELECT status FROM alert_outbox')} == {'sent'}
+
+
+def test_dispatch_backoff_until_failed(db_path, clock, monkeypatch):
+    monkeypatch.setattr(alerts, 'get_webhook_url', lambda: 'https://example.invalid/webhook')
+    monkeypatch.setattr(alerts, 'send_wechat_alert', lambda *args, **kwargs: False)
+    enqueue(1)
+    dispatcher = alerts.AlertDispatcher()
+    dispatcher._bucket = alerts.TokenBucket(1000)
+    
+    delays = []
+    for _ in range(alerts.MAX_ATTEMPTS):
+        assert dispatcher.dispatch_pending() == 1
+        [row] = query('SELECT status, next_attempt_ts FROM alert_outbox')
+        if row['status'] == 'failed':
+            break
+        delays.append(row['next_attempt_ts'] - clock[0])
+        clock[0] = row['next_attempt_ts']
+    
+    assert row['status'] == 'failed'
+    assert len(delays) == alerts.MAX_ATTEMPTS - 1
+    assert delays[0] == alerts.RETRY_BASE_DELAY
+    assert delays == sorted(delays) and max(delays) <= alerts.RETRY_MAX_DELAY
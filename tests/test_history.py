@@ -0,0 +1,48 @@
+"""
+history.lttb 降采样测试
+"""
+
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import lttb
+
+
+def make_series(n):
+    return [(i, math.sin(i / 50) * 50 + 50 + (i % 7)) for i in range(n)]
+
+
+def test_lttb_keeps_endpoints_and_point_count():
+    points = make_series(10000)
+    sampled = lttb(points, 500)
+    assert len(sampled) == 500
+    assert sampled[0] == list(points[0])
+    assert sampled[-1] == list(points[-1])
+    xs = [x for x, _ in sampled]
+    assert xs == sorted(set(xs))
+
+
+def test_lttb_returns_input_when_below_threshold():
+    points = make_series(10)
+    assert lttb(points, 500) == [list(p) for p in points]
+    assert lttb(points, 2) == [list(p) for p in points]
+
+
+def test_lttb_keeps_spike():
+    points = [(i, 0.0) for i in range(10000)]
+    points[4321] = (4321, 100.0)
+    assert [4321, 100.0] in lttb(points, 100)
+
+
+def test_lttb_large_series_runtime():
+    """100 万点降采样到 500 点应在数秒内完成（约为一年的 30 秒间隔数据）"""
+    points = make_series(1_000_000)
+    start = time.perf_counter()
+    sampled = lttb(points, 500)
+    elapsed = time.perf_counter() - start
+    assert len(sampled) == 500
+    assert elapsed < 5, f'lttb took {elapsed:.2f}s'
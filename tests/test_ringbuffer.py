@@ -0,0 +1,69 @@
+"""
+ringbuffer 环形缓冲区和滑动窗口测试（与朴素计算对比）
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ringbuffer import MAX_BUFFER_SAMPLES, HitCounter, MetricSeries
+
+
+def naive_window(samples, spec, now):
+    kind, n = spec
+    if kind == 'n':
+        window = samples[-min(n, MAX_BUFFER_SAMPLES):]
+    else:
+        window = [(ts, value) for ts, value in samples if ts > now - n]
+    return [value for _, value in window]
+
+
+@pytest.mark.parametrize('specs', [
+    {('n', 7)},
+    {('n', 1), ('n', 50)},
+    {('s', 30), ('n', 5)},
+    {('s', 600)},
+])
+def test_window_aggregates_match_naive(specs):
+    rng = random.Random(42)
+    series = MetricSeries(specs)
+    samples = []
+    ts = 0.0
+    for step in range(5000):
+        ts += rng.choice([0.5, 1, 1, 2, 7])
+        # 取值范围小，重复值较多，覆盖单调队列中相等值的情况
+        value = float(rng.randint(-20, 20)) if step % 3 else rng.uniform(-100, 100)
+        series.push(ts, value)
+        samples.append((ts, value))
+        for spec, view in series.views.items():
+            expected = naive_window(samples, spec, ts)
+            assert len(view) == len(expected)
+            assert view.min() == min(expected)
+            assert view.max() == max(expected)
+            assert view.avg() == pytest.approx(sum(expected) / len(expected), abs=1e-6)
+    # 缓冲区多次回绕
+    assert series.buffer.head > 2 * series.buffer.capacity
+
+
+def test_time_window_capped_at_max_samples():
+    series = MetricSeries({('s', 10 ** 6)})
+    for i in range(MAX_BUFFER_SAMPLES + 100):
+        series.push(i, float(i))
+    view = series.views[('s', 10 ** 6)]
+    assert series.buffer.capacity == MAX_BUFFER_SAMPLES
+    assert len(view) == MAX_BUFFER_SAMPLES
+    assert view.min() == 100 and view.max() == MAX_BUFFER_SAMPLES + 99
+
+
+def test_hit_counter_matches_naive():
+    rng = random.Random(7)
+    counter = HitCounter(5)
+    history = []
+    for _ in range(200):
+        hit = rng.random() < 0.4
+        history.append(hit)
+        assert counter.push(hit) == sum(history[-5:])
@@ -0,0 +1,101 @@
+"""
+rules 告警规则解析和求值测试
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from config import Config
+from rules import RuleEngine, RuleError, compile_rule, parse_rule_lines, validate_rules
+
+
+@pytest.mark.parametrize('text, func, metric, window, op, threshold, need, of', [
+    ('cpu > 80', 'last', 'cpu', None, '>', 80, 1, 1),
+    ('avg(cpu, 5m) > 90 for 3 cycles', 'avg', 'cpu', ('s', 300), '>', 90, 3, 3),
+    ('AVG( cpu ,10 )>80', 'avg', 'cpu', ('n', 10), '>', 80, 1, 1),
+    ('cpu > 90 for 3 of 5 samples', 'last', 'cpu', None, '>', 90, 3, 5),
+    ('max(response_time, 2h) >= 2.5', 'max', 'response_time', ('s', 7200), '>=', 2.5, 1, 1),
+    ('min(value, 30s) < -1', 'min', 'value', ('s', 30), '<', -1, 1, 1),
+    ('process_missing != 0', 'last', 'process_missing', None, '!=', 0, 1, 1),
+])
+def test_compile_rule(text, func, metric, window, op, threshold, need, of):
+    rule = compile_rule(text)
+    assert (rule.func, rule.metric, rule.window, rule.op, rule.threshold, rule.need, rule.of) == (
+        func, metric, window, op, threshold, need, of
+    )
+
+
+def test_alert_type_and_normalized_text():
+    assert compile_rule('percent > 80').alert_type == 'storage'
+    assert compile_rule('avg(cpu,  5m)   > 90').text == 'avg(cpu, 5m) > 90'
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    'cpu',
+    'cpu >> 90',
+    'cpu > abc',
+    'avg(cpu) > 90',
+    'median(cpu, 5) > 90',
+    'avg(cpu, 0) > 90',
+    'avg(cpu, 5000) > 90',
+    'avg(cpu, 5d) > 90',
+    'cpu > 90 for 0 cycles',
+    'cpu > 90 for 5 of 3 samples',
+    'cpu > 90 for 3 of 5000 samples',
+    'cpu > 90 for 3 minutes',
+])
+def test_compile_rule_rejects(text):
+    with pytest.raises(RuleError):
+        compile_rule(text)
+
+
+def test_parse_rule_lines():
+    text = '\n# 注释\n  cpu > 90\n\nmemory > 80 for 2 cycles\n'
+    assert [rule.text for rule in parse_rule_lines(text)] == ['cpu > 90', 'memory > 80 for 2 cycles']
+    grouped = parse_rule_lines('server: cpu > 95\napplication: response_time > 3', grouped=True)
+    assert [(group, rule.metric) for group, rule in grouped] == [('server', 'cpu'), ('application', 'response_time')]
+    assert validate_rules('cpu > 95', grouped=True) is not None
+    assert validate_rules('cpu > 90\ncpu >') is not None
+    assert validate_rules('cpu > 90') is None
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATABASE', str(tmp_path / 'monitoring.db'))
+    database.init_db()
+    return RuleEngine()
+
+
+def test_default_threshold_rule(engine):
+    assert engine.evaluate(1, 'server', {}, {'cpu': 50, 'memory': 10, 'disk': 10})['cpu'] == (False, None)
+    fired, message = engine.evaluate(1, 'server', {}, {'cpu': Config.CPU_THRESHOLD + 5})['cpu']
+    assert fired and 'CPU使用率过高' in message
+
+
+def test_target_rule_overrides_default_and_counts_hits(engine):
+    config = {'alert_rules': 'cpu > 90 for 2 of 3 samples'}
+    results = [engine.evaluate(1, 'server', config, {'cpu': cpu}, ts=i)['cpu'][0]
+               for i, cpu in enumerate([85, 95, 50, 95, 50, 50])]
+    # 85 不再触发默认规则；最近3次中有2次超过90时触发
+    assert results == [False, False, False, True, False, False]
+
+
+def test_window_rules(engine):
+    config = {'alert_rules': 'avg(cpu, 3) > 50\nmax(memory, 10s) >= 90'}
+    samples = [(0, 10, 95), (4, 60, 10), (8, 100, 10), (12, 10, 10), (20, 10, 10)]
+    results = [engine.evaluate(1, 'server', config, {'cpu': cpu, 'memory': memory}, ts=ts)
+               for ts, cpu, memory in samples]
+    assert [result['cpu'][0] for result in results] == [False, False, True, True, False]
+    # 10秒窗口：ts=12 时 ts=0 的 95 已移出窗口
+    assert [result['memory'][0] for result in results] == [True, True, True, False, False]
+    
+    # 修改规则后重建窗口，其他目标不受影响
+    assert engine.evaluate(2, 'server', config, {'cpu': 10, 'memory': 10})['cpu'][0] is False
+    changed = {'alert_rules': 'avg(cpu, 2) > 50'}
+    assert engine.evaluate(1, 'server', changed, {'cpu': 100}, ts=24)['cpu'][0] is True
@@ -0,0 +1,201 @@
+"""
+检查链路追踪
+每次检查按阶段计时：配置解密、建立连接、执行命令/查询、解析结果、写入数据库、发送告警，
+用于判断慢目标是慢在网络、远程命令还是本机的 SQLite 写入。
+计时使用单调时钟，当前检查的追踪记录保存在线程局部变量中，未在检查中调用 span() 时不做任何事。
+每个目标只保留最近 TRACE_HISTORY 次检查的追踪记录
+"""
+
+import threading
+import time
+from collections import deque
+
+TRACE_HISTORY = 20      # 每个目标保留的追踪记录数
+MAX_SPANS = 64          # 单次检查最多记录的阶段数（避免循环中的阶段无限增长）
+
+# 阶段名称
+PHASE_LABELS = {
+    'decrypt': '配置解密',
+    'connect': '建立连接',
+    'request': 'HTTP 请求',
+    'command': '远程命令',
+    'query': '数据库查询',
+    'collect': '本机采集',
+    'parse': '解析结果',
+    'anomaly': '异常检测',
+    'persist': '写入数据库',
+    'alert': '告警处理'
+}
+
+_local = threading.local()
+
+
+class Trace:
+    """单次检查的追踪记录"""
+    
+    __slots__ = ('target_id', 'target_type', 'ts', 'start', 'duration', 'status', 'spans')
+    
+    def __init__(self, target_id, target_type):
+        self.target_id = target_id
+        self.target_type = target_type
+        self.ts = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.spans = []   # [(阶段, 相对检查开始的偏移, 耗时)]
+    
+    def to_dict(self):
+        """转换为 API 返回的格式（时间单位：毫秒）"""
+        return {
+            'target_id': self.target_id,
+            'type': self.target_type,
+            'ts': round(self.ts, 3),
+            'status': self.status,
+            'duration': round(self.duration * 1000, 2) if self.duration is not None else None,
+            'spans': [
+                {'name': name, 'start': round(offset * 1000, 2), 'duration': round(elapsed * 1000, 2)}
+                for name, offset, elapsed in self.spans
+            ]
+        }
+
+
+class _Span:
+    """记录一个阶段的上下文管理器"""
+    
+    __slots__ = ('trace', 'name', 'start')
+    
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        spans = self.trace.spans
+        if len(spans) < MAX_SPANS:
+            end = time.perf_counter()
+            spans.append((self.name, self.start - self.trace.start, end - self.start))
+        return False
+
+
+class _NullSpan:
+    """当前线程没有进行中的检查时使用的空上下文管理器"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """为当前检查记录一个阶段
+    
+    用法: with span('connect'): ...
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+
+def record(name, start):
+    """记录从 start（time.perf_counter() 的值）到现在的阶段，适用于不便用 with 包裹的代码"""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None and len(trace.spans) < MAX_SPANS:
+        end = time.perf_counter()
+        trace.spans.append((name, start - trace.start, end - start))
+
+
+class TraceRecorder:
+    """保存各目标最近的追踪记录"""
+    
+    def __init__(self, history=TRACE_HISTORY):
+        self.history = history
+        self._lock = threading.Lock()
+        self._traces = {}   # target_id -> deque[Trace]
+    
+    def start(self, target_id, target_type):
+        """开始追踪当前线程中的一次检查"""
+        trace = Trace(target_id, target_type)
+        _local.trace = trace
+        return trace
+    
+    def finish(self, status):
+        """结束当前线程的检查并保存追踪记录"""
+        trace = getattr(_local, 'trace', None)
+        if trace is None:
+            return None
+        _local.trace = None
+        trace.duration = time.perf_counter() - trace.start
+        trace.status = status
+        with self._lock:
+            traces = self._traces.get(trace.target_id)
+            if traces is None:
+                traces = self._traces[trace.target_id] = deque(maxlen=self.history)
+            traces.append(trace)
+        return trace
+    
+    def recent(self, target_id=None, limit=None):
+        """最近的追踪记录（新的在前）
+        
+        Args:
+            target_id: 监控目标ID，为 None 时返回所有目标
+            limit: 最多返回的条数
+        """
+        with self._lock:
+            if target_id is not None:
+                traces = list(self._traces.get(target_id, ()))
+            else:
+                traces = [trace for items in self._traces.values() for trace in items]
+        traces.sort(key=lambda trace: trace.ts, reverse=True)
+        if limit:
+            traces = traces[:limit]
+        return [trace.to_dict() for trace in traces]
+    
+    def summary(self, target_id=None):
+        """按目标汇总各阶段耗时 {target_id: {阶段: {'count', 'avg', 'max'}}}（毫秒）"""
+        with self._lock:
+            if target_id is not None:
+                groups = {target_id: list(self._traces.get(target_id, ()))}
+            else:
+                groups = {tid: list(items) for tid, items in self._traces.items()}
+        
+        result = {}
+        for tid, traces in groups.items():
+            phases = {}
+            for trace in traces:
+                # 同一阶段在一次检查中出现多次（如多条远程命令）时先累加
+                totals = {}
+                for name, _, elapsed in trace.spans:
+                    totals[name] = totals.get(name, 0) + elapsed
+                for name, elapsed in totals.items():
+                    stats = phases.setdefault(name, [0, 0.0, 0.0])
+                    stats[0] += 1
+                    stats[1] += elapsed
+                    stats[2] = max(stats[2], elapsed)
+            result[tid] = {
+                name: {
+                    'count': count,
+                    'avg': round(total / count * 1000, 2),
+                    'max': round(peak * 1000, 2)
+                }
+                for name, (count, total, peak) in phases.items()
+            }
+        return result
+    
+    def forget(self, target_id):
+        """丢弃目标的追踪记录（目标删除后调用）"""
+        with self._lock:
+            self._traces.pop(target_id, None)
+
+
+# 全局实例
+tracer = TraceRecorder()
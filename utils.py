@@ -1,11 +1,20 @@
 from datetime import datetime
+from functools import lru_cache
 import pytz
 from config import Config
 
+@lru_cache(maxsize=None)
+def get_timezone(timezone=None):
+    """获取时区对象（缓存，避免每次调用 pytz.timezone 查表）"""
+    return pytz.timezone(timezone or Config.TIMEZONE)
+
+@lru_cache(maxsize=4096)
 def utc_to_local(utc_time_str, timezone=None):
     """
     将 UTC 时间字符串转换为本地时区时间
     
+    同一时间字符串在列表和仪表板中会被反复转换，结果做了缓存
+    
     Args:
         utc_time_str: UTC 时间字符串，格式如 '2026-01-19 08:30:00'
         timezone: 目标时区，默认使用配置中的时区
@@ -16,19 +25,12 @@ def utc_to_local(utc_time_str, timezone=None):
     if not utc_time_str:
         return ''
     
-    if timezone is None:
-        timezone = Config.TIMEZONE
-    
     try:
-        # 解析 UTC 时间
-        utc_time = datetime.strptime(utc_time_str, '%Y-%m-%d %H:%M:%S')
-        
-        # 设置为 UTC 时区
-        utc_time = pytz.utc.localize(utc_time)
+        # 解析 UTC 时间（fromisoformat 比 strptime 快得多）
+        utc_time = datetime.fromisoformat(utc_time_str).replace(tzinfo=pytz.utc)
         
         # 转换为目标时区
-        local_tz = pytz.timezone(timezone)
-        local_time = utc_time.astimezone(local_tz)
+        local_time = utc_time.astimezone(get_timezone(timezone))
         
         # 返回格式化的字符串
         return local_time.strftime('%Y-%m-%d %H:%M:%S')
@@ -46,11 +48,7 @@ def get_local_time(timezone=None):
     Returns:
         本地时间字符串
     """
-    if timezone is None:
-        timezone = Config.TIMEZONE
-        
-    local_tz = pytz.timezone(timezone)
-    local_time = datetime.now(local_tz)
+    local_time = datetime.now(get_timezone(timezone))
     return local_time.strftime('%Y-%m-%d %H:%M:%S')
 
 def format_relative_time(time_str):